@@ -38,7 +38,7 @@ cd $WORKDIR
 
 # Build the psnr binary.
 echo "Compiling psnr"
-gcc -o $TOOLDIR/psnr src/psnr.c -lm
+gcc -O3 -pthread -o $TOOLDIR/psnr src/psnr.c -lm
 
 # Build third party source
 cd $WORKDIR/third_party
@@ -0,0 +1,351 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Frame sizes and types from encoded files, without decoding them.
+
+Supported are:
+- Annex B H.264 (.264, .h264) and HEVC (.hevc, .265) streams, split
+  into access units at start codes. A frame's size counts every byte of
+  its access unit, parameter sets and start codes included.
+- AVI files (.avi), where each video chunk in the "movi" list is a frame.
+  Some encoders (avcenc) write Annex B H.264 under this name; the content
+  tells which it is.
+- Motion JPEG streams (.mjpeg), where each JPEG image is a frame.
+- Matroska files (.webm, .mkv), through the matroska module.
+
+Each frame is {'size': size in bits, 'keyframe': true or false,
+'type': "I", "P" or "B"}. "keyframe" is true for frames that decoding
+can start at: IDR and other random access pictures in H.264 and HEVC,
+intra pictures in MPEG-4 part 2 and H.263, every JPEG image and the key
+frames of Matroska files. "type" is the slice or picture type, where the
+header tells (H.264, HEVC, MPEG-4 part 2 and H.263). Either is left out
+when it is not known.
+
+The format is taken from the file extension, and checked against the
+start of the file. FrameInfo returns None for content that does not
+look like the format, so that callers can fall back to a decoder.
+"""
+
+import os
+import struct
+
+import matroska
+
+INTRA_FRAME = 'I'
+PREDICTED_FRAME = 'P'
+BIDIRECTIONAL_FRAME = 'B'
+
+_START_CODE = '\x00\x00\x01'
+# Slice headers are parsed from this many bytes at the start of a NAL unit.
+_HEADER_BYTES = 32
+
+# H.264 NAL unit types that may start an access unit.
+_H264_AU_START = (6, 7, 8, 9, 13, 14, 15, 16, 17, 18)
+_H264_IDR = 5
+# H.264 slice_type modulo 5: P, B, I, SP, SI.
+_H264_SLICE_TYPES = 'PBIPI'
+_HEVC_VPS, _HEVC_PPS = 32, 34
+# Random access (IRAP) pictures: BLA, IDR and CRA, and reserved types.
+_HEVC_IRAP_FIRST, _HEVC_IRAP_LAST = 16, 23
+_HEVC_AU_START = (32, 33, 34, 35, 39, 41, 42, 43, 44) + tuple(range(48, 56))
+# HEVC slice_type: B, P, I.
+_HEVC_SLICE_TYPES = 'BPI'
+
+_MPEG4_VOP_START = '\x00\x00\x01\xb6'
+# MPEG-4 vop_coding_type: I, P, B, S (global motion compensated).
+_MPEG4_VOP_TYPES = 'IPBP'
+# H.263 PLUSPTYPE picture types: I, P, improved PB, B, EI, EP.
+_H263_PLUS_TYPES = 'IPPBIP'
+_JPEG_START = '\xff\xd8\xff'
+
+
+class _BitReader(object):
+  """Reads bits, most significant first, from a string."""
+  def __init__(self, data):
+    self.data = data
+    self.position = 0
+
+  def Bits(self, count):
+    value = 0
+    for _ in range(count):
+      byte = ord(self.data[self.position >> 3])
+      value = (value << 1) | ((byte >> (7 - (self.position & 7))) & 1)
+      self.position += 1
+    return value
+
+  def ExpGolomb(self):
+    """Reads an unsigned Exp-Golomb code, ue(v)."""
+    zeros = 0
+    while not self.Bits(1):
+      zeros += 1
+      if zeros > 31:
+        raise ValueError('Invalid Exp-Golomb code')
+    return (1 << zeros) - 1 + self.Bits(zeros)
+
+
+def _Unescape(data):
+  """Removes emulation prevention bytes from the start of a NAL unit."""
+  return data.replace('\x00\x00\x03', '\x00\x00')
+
+
+def _NalUnits(data, start, end):
+  """Yields (position of start code, start of NAL unit) for each NAL unit
+  in Annex B data, with emulation prevention bytes removed from the start
+  of the NAL unit. A zero byte before a start code is counted as part
+  of it."""
+  position = data.find(_START_CODE, start, end)
+  while position >= 0:
+    header = _Unescape(data[position + 3:min(end,
+                                             position + 3 + _HEADER_BYTES)])
+    if position > start and data[position - 1] == '\x00':
+      yield position - 1, header
+    else:
+      yield position, header
+    position = data.find(_START_CODE, position + 3, end)
+
+
+def _H264Nal(header, _):
+  """Returns (starts access unit, is VCL, first slice, frame type,
+  keyframe)."""
+  nal_type = ord(header[0]) & 0x1f
+  if not 1 <= nal_type <= 5:
+    return nal_type in _H264_AU_START, False, False, None, None
+  reader = _BitReader(header[1:])
+  first_slice = reader.ExpGolomb() == 0
+  return (False, True, first_slice,
+          _H264_SLICE_TYPES[reader.ExpGolomb() % 5], nal_type == _H264_IDR)
+
+
+def _HevcNal(header, extra_bits):
+  """Returns (starts access unit, is VCL, first slice, frame type,
+  keyframe).
+
+  Picture parameter sets are noted in extra_bits, which maps their ID to
+  the number of extra slice header bits they ask for."""
+  nal_type = (ord(header[0]) >> 1) & 0x3f
+  reader = _BitReader(header[2:])
+  if nal_type == _HEVC_PPS:
+    try:
+      pps_id = reader.ExpGolomb()
+      reader.ExpGolomb()
+      reader.Bits(2)
+      extra_bits[pps_id] = reader.Bits(3)
+    except (IndexError, ValueError):
+      pass
+  if nal_type >= _HEVC_VPS:
+    return nal_type in _HEVC_AU_START, False, False, None, None
+  random_access = _HEVC_IRAP_FIRST <= nal_type <= _HEVC_IRAP_LAST
+  if not reader.Bits(1):
+    return False, True, False, None, random_access
+  if random_access:
+    # no_output_of_prior_pics_flag, only in random access pictures.
+    reader.Bits(1)
+  pps_id = reader.ExpGolomb()
+  reader.Bits(extra_bits.get(pps_id, 0))
+  slice_type = reader.ExpGolomb()
+  if slice_type >= len(_HEVC_SLICE_TYPES):
+    raise ValueError('Invalid HEVC slice type')
+  return False, True, True, _HEVC_SLICE_TYPES[slice_type], random_access
+
+
+def _AccessUnits(data, nal_parser, start=0, end=None):
+  """Returns (start, end, frame type, keyframe) for each access unit in
+  Annex B data."""
+  # pylint: disable=too-many-locals
+  if end is None:
+    end = len(data)
+  units = []
+  unit_start = None
+  unit_type = unit_keyframe = None
+  unit_has_picture = False
+  parser_state = {}
+  for position, header in _NalUnits(data, start, end):
+    if not header:
+      continue
+    try:
+      starts_unit, vcl, first_slice, frame_type, keyframe = nal_parser(
+          header, parser_state)
+    except (IndexError, ValueError):
+      # Headers that don't parse are taken to be the start of a picture.
+      starts_unit, vcl, first_slice, frame_type, keyframe = (
+          False, True, True, None, None)
+    if unit_start is None or (unit_has_picture and
+                              (starts_unit or first_slice)):
+      if unit_start is not None:
+        units.append((unit_start, position, unit_type, unit_keyframe))
+      unit_start, unit_has_picture = position, False
+      unit_type = unit_keyframe = None
+    if vcl and not unit_has_picture:
+      unit_type, unit_keyframe = frame_type, keyframe
+      unit_has_picture = True
+  if unit_start is not None:
+    units.append((unit_start, end, unit_type, unit_keyframe))
+  return units
+
+
+def Frame(size, frame_type=None, keyframe=None):
+  """Returns the frame entry for a frame of size bytes. The type and
+  keyframe flag are left out if they are None."""
+  frame = {'size': size * 8}
+  if keyframe is not None:
+    frame['keyframe'] = keyframe
+  if frame_type:
+    frame['type'] = frame_type
+  return frame
+
+
+def _AnnexBFrames(data, nal_parser):
+  return [Frame(unit_end - unit_start, frame_type, keyframe) for
+          unit_start, unit_end, frame_type, keyframe
+          in _AccessUnits(data, nal_parser)]
+
+
+def H264FrameInfo(data):
+  """Returns the frames in an Annex B H.264 stream."""
+  return _AnnexBFrames(data, _H264Nal)
+
+
+def HevcFrameInfo(data):
+  """Returns the frames in an Annex B HEVC stream."""
+  return _AnnexBFrames(data, _HevcNal)
+
+
+def _PictureType(data, start, end):
+  """Returns (picture type, keyframe) for the picture in a chunk of an AVI
+  file, or (None, None) if the codec is not known."""
+  # pylint: disable=too-many-return-statements
+  header = data[start:min(end, start + _HEADER_BYTES)]
+  try:
+    # The VOP start code can't occur in H.264, and may come after
+    # long headers, so the whole chunk is searched.
+    vop = data.find(_MPEG4_VOP_START, start, end)
+    if vop >= 0:
+      vop_type = _MPEG4_VOP_TYPES[ord(data[vop + 4]) >> 6]
+      return vop_type, vop_type == INTRA_FRAME
+    if header.startswith(_START_CODE) or header.startswith('\0' + _START_CODE):
+      units = _AccessUnits(data, _H264Nal, start, end)
+      return units[0][2:] if units else (None, None)
+    if header[:2] == '\0\0' and ord(header[2]) & 0xfc == 0x80:
+      # H.263 picture header: start code and temporal reference, then
+      # PTYPE, in which the source format is bits 6 to 8.
+      reader = _BitReader(header)
+      reader.Bits(22 + 8 + 5)
+      if reader.Bits(3) != 7:
+        if reader.Bits(1):
+          return PREDICTED_FRAME, False
+        return INTRA_FRAME, True
+      if reader.Bits(3) == 1:
+        # The optional part of PLUSPTYPE is present.
+        reader.Bits(18)
+      picture_type = reader.Bits(3)
+      # Only type 0 is a plain I picture; EI pictures are in an
+      # enhancement layer.
+      return _H263_PLUS_TYPES[picture_type], picture_type == 0
+    if header.startswith(_JPEG_START):
+      return INTRA_FRAME, True
+  except IndexError:
+    pass
+  return None, None
+
+
+def _RiffChunks(data, start, end):
+  """Yields (fourcc, data start, data size) for the chunks in a RIFF list."""
+  position = start
+  while position + 8 <= end:
+    fourcc = data[position:position + 4]
+    size = struct.unpack('<I', data[position + 4:position + 8])[0]
+    if position + 8 + size > end:
+      # A truncated file. The complete chunks of a list are still good.
+      if fourcc in ('RIFF', 'LIST'):
+        yield fourcc, position + 8, end - position - 8
+      return
+    yield fourcc, position + 8, size
+    position += 8 + size + (size & 1)
+
+
+def _AviVideoChunks(data, start, end):
+  for fourcc, chunk_start, size in _RiffChunks(data, start, end):
+    if fourcc in ('RIFF', 'LIST'):
+      if data[chunk_start:chunk_start + 4] in ('AVI ', 'AVIX', 'movi', 'rec '):
+        for chunk in _AviVideoChunks(data, chunk_start + 4,
+                                     chunk_start + size):
+          yield chunk
+    elif fourcc[2:] in ('dc', 'db') and fourcc[:2].isdigit():
+      yield chunk_start, size
+
+
+def AviFrameInfo(data):
+  """Returns the frames in an AVI file, one per video chunk."""
+  return [Frame(size, *_PictureType(data, chunk_start, chunk_start + size))
+          for chunk_start, size in _AviVideoChunks(data, 0, len(data))]
+
+
+def MjpegFrameInfo(data):
+  """Returns the frames in a stream of JPEG images."""
+  starts = []
+  position = data.find(_JPEG_START)
+  while position >= 0:
+    starts.append(position)
+    position = data.find(_JPEG_START, position + len(_JPEG_START))
+  return [Frame(end - start, INTRA_FRAME, True)
+          for start, end in zip(starts, starts[1:] + [len(data)])]
+
+
+def _IsAnnexB(data):
+  """Returns true if data starts with a start code."""
+  header = data[:_HEADER_BYTES]
+  stripped = header.lstrip('\x00')
+  return len(header) - len(stripped) >= 2 and stripped.startswith('\x01')
+
+
+def _IsAvi(data):
+  return data[:4] == 'RIFF' and data[8:12] == 'AVI '
+
+
+def _IsMjpeg(data):
+  return data.startswith(_JPEG_START)
+
+
+# Extension -> (content check, scanner) pairs, tried in order.
+_SCANNERS = {
+    '.264': [(_IsAnnexB, H264FrameInfo)],
+    '.h264': [(_IsAnnexB, H264FrameInfo)],
+    '.hevc': [(_IsAnnexB, HevcFrameInfo)],
+    '.265': [(_IsAnnexB, HevcFrameInfo)],
+    '.avi': [(_IsAvi, AviFrameInfo), (_IsAnnexB, H264FrameInfo)],
+    '.mjpeg': [(_IsMjpeg, MjpegFrameInfo)],
+}
+
+_MATROSKA_EXTENSIONS = ('.webm', '.mkv')
+
+
+def CanScan(filename):
+  """Returns true if FrameInfo may know the format of a file, judging by
+  its extension."""
+  extension = os.path.splitext(filename)[1].lower()
+  return extension in _SCANNERS or extension in _MATROSKA_EXTENSIONS
+
+
+def FrameInfo(filename):
+  """Returns a list of frames, as {'size': size in bits, 'keyframe': flag,
+  'type': type}, for a file in a format that CanScan, or None if the
+  content is not in a format that the extension allows."""
+  extension = os.path.splitext(filename)[1].lower()
+  if extension in _MATROSKA_EXTENSIONS:
+    return matroska.FrameInfo(filename)
+  with open(filename, 'rb') as the_file:
+    data = the_file.read()
+  for matches, scanner in _SCANNERS[extension]:
+    if matches(data):
+      return scanner(data)
+  return None
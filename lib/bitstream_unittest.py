@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the bitstream frame scanners."""
+
+import os
+import struct
+import tempfile
+import unittest
+
+import bitstream
+
+# H.264 NAL units. The slice headers start with first_mb_in_slice and
+# slice_type as Exp-Golomb codes.
+H264_SPS = '\x00\x00\x00\x01\x67\x42\x00\x1e'
+H264_PPS = '\x00\x00\x00\x01\x68\xce\x38\x80'
+H264_IDR = '\x00\x00\x01\x65\x88' + 'i' * 20   # first_mb 0, type 7 (I)
+H264_P = '\x00\x00\x01\x41\x98' + 'p' * 10     # first_mb 0, type 5 (P)
+H264_B = '\x00\x00\x01\x01\x9c' + 'b' * 5      # first_mb 0, type 6 (B)
+H264_P_SECOND_SLICE = '\x00\x00\x01\x41\x46' + 's' * 4  # first_mb 1
+
+# HEVC NAL units, with two-byte NAL headers.
+HEVC_VPS = '\x00\x00\x00\x01\x40\x01\x0c'
+# pps_id 0, sps_id 0, two flags, then 2 extra slice header bits.
+HEVC_PPS = '\x00\x00\x00\x01\x44\x01\xc4'
+# first slice, no_output_of_prior_pics, pps_id 0, 2 extra bits, I.
+HEVC_IDR = '\x00\x00\x01\x26\x01\xa3' + 'i' * 10
+# first slice, pps_id 0, 2 extra bits, P.
+HEVC_P = '\x00\x00\x01\x02\x01\xc4' + 'p' * 6
+
+
+def Bits(bit_string):
+  bit_string += '0' * (-len(bit_string) % 8)
+  return ''.join(chr(int(bit_string[i:i + 8], 2))
+                 for i in range(0, len(bit_string), 8))
+
+
+def Chunk(fourcc, data):
+  return fourcc + struct.pack('<I', len(data)) + data + '\0' * (len(data) & 1)
+
+
+def RiffList(fourcc, list_type, chunks):
+  return Chunk(fourcc, list_type + ''.join(chunks))
+
+
+def Sizes(frames):
+  return [frame['size'] / 8 for frame in frames]
+
+
+def Types(frames):
+  return [frame.get('type') for frame in frames]
+
+
+def Keyframes(frames):
+  return [frame.get('keyframe') for frame in frames]
+
+
+def ScanFile(suffix, data):
+  handle, filename = tempfile.mkstemp(suffix=suffix)
+  os.write(handle, data)
+  os.close(handle)
+  try:
+    return bitstream.FrameInfo(filename)
+  finally:
+    os.unlink(filename)
+
+
+class TestAnnexB(unittest.TestCase):
+
+  def test_H264AccessUnits(self):
+    frames = bitstream.H264FrameInfo(
+        H264_SPS + H264_PPS + H264_IDR + H264_P + H264_P_SECOND_SLICE + H264_B)
+    self.assertEqual(['I', 'P', 'B'], Types(frames))
+    self.assertEqual([True, False, False], Keyframes(frames))
+    self.assertEqual(
+        [len(H264_SPS + H264_PPS + H264_IDR),
+         len(H264_P + H264_P_SECOND_SLICE), len(H264_B)], Sizes(frames))
+
+  def test_H264ParameterSetsStartAccessUnit(self):
+    frames = bitstream.H264FrameInfo(H264_IDR + H264_SPS + H264_IDR)
+    self.assertEqual([len(H264_IDR), len(H264_SPS + H264_IDR)],
+                     Sizes(frames))
+
+  def test_H264EmulationPrevention(self):
+    # first_mb 0 and slice type 2 (I) after an escaped zero pair.
+    escaped = '\x00\x00\x01\x65\x00\x00\x03\x01'
+    self.assertEqual([None], Types(bitstream.H264FrameInfo(escaped)))
+    slice_header = '\x00\x00\x01\x41\xb0'
+    frames = bitstream.H264FrameInfo(slice_header)
+    self.assertEqual(['I'], Types(frames))
+    # An I slice outside an IDR picture is not a place to start decoding.
+    self.assertEqual([False], Keyframes(frames))
+
+  def test_HevcAccessUnits(self):
+    frames = bitstream.HevcFrameInfo(HEVC_VPS + HEVC_PPS + HEVC_IDR + HEVC_P)
+    self.assertEqual(['I', 'P'], Types(frames))
+    self.assertEqual([True, False], Keyframes(frames))
+    self.assertEqual([len(HEVC_VPS + HEVC_PPS + HEVC_IDR), len(HEVC_P)],
+                     Sizes(frames))
+
+  def test_Empty(self):
+    self.assertEqual([], bitstream.H264FrameInfo(''))
+
+
+class TestAvi(unittest.TestCase):
+
+  def test_VideoChunks(self):
+    movi = [Chunk('00dc', '\x00\x00\x01\xb6\x00' + 'a' * 10),
+            Chunk('01wb', 'audio'),
+            Chunk('00dc', '\x00\x00\x01\xb6\x40' + 'b' * 4),
+            Chunk('00dc', '\x00\x00\x01\xb6\x80')]
+    data = RiffList('RIFF', 'AVI ', [
+        RiffList('LIST', 'hdrl', [Chunk('avih', 'x' * 56)]),
+        RiffList('LIST', 'movi', movi),
+        Chunk('idx1', 'y' * 16)])
+    frames = bitstream.AviFrameInfo(data)
+    self.assertEqual([15, 9, 5], Sizes(frames))
+    self.assertEqual(['I', 'P', 'B'], Types(frames))
+    self.assertEqual([True, False, False], Keyframes(frames))
+
+  def test_H263Pictures(self):
+    header = '0' * 16 + '100000' + '00000000' + '10000'
+    intra = Bits(header + '010' + '0')
+    inter = Bits(header + '010' + '1')
+    plus_b = Bits(header + '111' + '001' + '0' * 18 + '011')
+    data = RiffList('RIFF', 'AVI ', [RiffList('LIST', 'movi', [
+        Chunk('00dc', intra), Chunk('00dc', inter), Chunk('00dc', plus_b)])])
+    frames = bitstream.AviFrameInfo(data)
+    self.assertEqual(['I', 'P', 'B'], Types(frames))
+    self.assertEqual([True, False, False], Keyframes(frames))
+
+  def test_UnknownCodecHasNoType(self):
+    data = RiffList('RIFF', 'AVI ', [RiffList('LIST', 'movi', [
+        Chunk('00dc', 'something')])])
+    self.assertEqual([{'size': 72}], bitstream.AviFrameInfo(data))
+
+  def test_TruncatedFile(self):
+    data = RiffList('RIFF', 'AVI ', [RiffList('LIST', 'movi', [
+        Chunk('00dc', 'a' * 10), Chunk('00dc', 'b' * 10)])])
+    self.assertEqual([10], Sizes(bitstream.AviFrameInfo(data[:-4])))
+
+
+class TestMjpeg(unittest.TestCase):
+
+  def test_Images(self):
+    first = '\xff\xd8\xff\xe0' + 'a' * 10 + '\xff\xd9'
+    second = '\xff\xd8\xff\xdb' + 'b' * 3 + '\xff\xd9'
+    frames = bitstream.MjpegFrameInfo(first + second)
+    self.assertEqual([len(first), len(second)], Sizes(frames))
+    self.assertEqual(['I', 'I'], Types(frames))
+    self.assertEqual([True, True], Keyframes(frames))
+
+
+class TestFrameInfo(unittest.TestCase):
+
+  def test_ByExtension(self):
+    handle, filename = tempfile.mkstemp(suffix='.264')
+    os.write(handle, H264_SPS + H264_IDR + H264_P)
+    os.close(handle)
+    try:
+      self.assertTrue(bitstream.CanScan(filename))
+      self.assertEqual(['I', 'P'], Types(bitstream.FrameInfo(filename)))
+    finally:
+      os.unlink(filename)
+
+  def test_AnnexBInAvi(self):
+    # avcenc writes raw H.264 to a file named .avi.
+    frames = ScanFile('.avi', H264_SPS + H264_IDR + H264_P)
+    self.assertEqual(['I', 'P'], Types(frames))
+    avi = RiffList('RIFF', 'AVI ', [RiffList('LIST', 'movi', [
+        Chunk('00dc', '\x00\x00\x01\xb6\x00')])])
+    self.assertEqual(['I'], Types(ScanFile('.avi', avi)))
+
+  def test_UnknownContent(self):
+    self.assertIsNone(ScanFile('.avi', 'not a video file'))
+    self.assertIsNone(ScanFile('.264', 'not a video file'))
+
+  def test_UnknownExtension(self):
+    self.assertFalse(bitstream.CanScan('file.h261'))
+    self.assertTrue(bitstream.CanScan('file.webm'))
+
+
+if __name__ == '__main__':
+  unittest.main()
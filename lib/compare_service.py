@@ -0,0 +1,208 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A long-lived process that runs the query tools with warm caches.
+
+Tools like list_best_results spend most of their time starting Python,
+constructing codecs and scanning the score directories. The service
+(bin/compare_codecs_service) keeps the optimizers and the score
+directory indexes between commands, and listens on a UNIX socket in the
+work directory.
+
+A tool calls RunTool from its main block. If a service is listening, the
+command line is sent to it, and its output is copied to the tool's
+stdout and stderr; otherwise the tool runs by itself, as before.
+
+Requests are one JSON line: {"tool": name, "argv": [...], "cwd": dir}.
+The service answers with JSON lines of {"stdout": text} and
+{"stderr": text}, and finally {"status": exit code}.
+"""
+
+import imp
+import json
+import os
+import socket
+import sys
+import traceback
+
+import encoder
+import encoder_configuration
+import fileset_picker
+import optimizer
+import pick_codec
+import score_tools
+
+SOCKET_FILENAME = 'compare-codecs.sock'
+
+# The tools that can be run in the service. They are in the bin directory.
+SERVED_TOOLS = ('compare_codecs', 'frame_size_tool', 'list_best_results',
+                'show_next_tries')
+
+
+def SocketFilename():
+  return os.path.join(encoder_configuration.conf.workdir(), SOCKET_FILENAME)
+
+
+# pylint: disable=invalid-name
+_optimizers = {}
+
+
+def CachedOptimizer(codec_name, criterion='psnr', fileset_name=None):
+  """Returns the process-wide optimizer for a codec, criterion and fileset.
+
+  In a tool that runs once, this is a new optimizer. In the service, the
+  same optimizer, with its context and codec, is used for all commands."""
+  # Filesets other than mpeg_video are found from the current directory.
+  key = (codec_name, criterion, fileset_name, os.getcwd())
+  if key not in _optimizers:
+    file_set = None
+    if fileset_name:
+      file_set = fileset_picker.PickFileset(fileset_name)
+    _optimizers[key] = optimizer.Optimizer(
+        pick_codec.PickCodec(codec_name),
+        score_function=score_tools.PickScorer(criterion),
+        file_set=file_set)
+  return _optimizers[key]
+
+
+def LoadTool(tool_name):
+  """Returns the main function of a tool in the bin directory."""
+  bin_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, 'bin')
+  module = imp.load_source('%s_tool' % tool_name,
+                           os.path.join(bin_directory, tool_name))
+  return module.main
+
+
+class _MessageWriter(object):
+  """A file-like object that sends what is written as messages."""
+  def __init__(self, connection_file, stream):
+    self.connection_file = connection_file
+    self.stream = stream
+
+  def write(self, data):
+    # pylint: disable=invalid-name
+    if data:
+      _SendMessage(self.connection_file, {self.stream: data})
+
+  def flush(self):
+    # pylint: disable=invalid-name
+    self.connection_file.flush()
+
+
+def _SendMessage(connection_file, message):
+  connection_file.write(json.dumps(message) + '\n')
+
+
+def _RunMain(main, argv, stdout, stderr):
+  """Runs a tool's main function with argv as its command line, and
+  returns its exit status."""
+  saved = (sys.argv, sys.stdout, sys.stderr)
+  sys.argv = argv
+  sys.stdout = stdout
+  sys.stderr = stderr
+  try:
+    return main() or 0
+  except SystemExit as exit_exception:
+    # argparse exits on bad arguments and --help.
+    if exit_exception.code is None or isinstance(exit_exception.code, int):
+      return exit_exception.code or 0
+    stderr.write('%s\n' % exit_exception.code)
+    return 1
+  except Exception:  # pylint: disable=broad-except
+    # A failing command must not stop the service.
+    stderr.write(traceback.format_exc())
+    return 1
+  finally:
+    sys.argv, sys.stdout, sys.stderr = saved
+
+
+def HandleRequest(connection, tools):
+  """Reads one request from a connection, runs it and sends the output.
+  tools is a dictionary of tool name -> main function."""
+  connection_file = connection.makefile('rw')
+  try:
+    request = json.loads(connection_file.readline())
+    stdout = _MessageWriter(connection_file, 'stdout')
+    stderr = _MessageWriter(connection_file, 'stderr')
+    if request['tool'] not in tools:
+      stderr.write('Tool %s is not served\n' % request['tool'])
+      status = 1
+    else:
+      saved_cwd = os.getcwd()
+      os.chdir(request['cwd'])
+      try:
+        status = _RunMain(tools[request['tool']],
+                          [request['tool']] + request['argv'],
+                          stdout, stderr)
+      finally:
+        os.chdir(saved_cwd)
+    _SendMessage(connection_file, {'status': status})
+  finally:
+    connection_file.close()
+
+
+def Serve(socket_filename, tools, max_requests=None):
+  """Serves requests on a UNIX socket, one at a time, until max_requests
+  have been served (forever if None)."""
+  if os.path.exists(socket_filename):
+    # Left behind by a service that did not stop cleanly.
+    os.remove(socket_filename)
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  listener.bind(socket_filename)
+  try:
+    listener.listen(5)
+    served = 0
+    while max_requests is None or served < max_requests:
+      connection, _ = listener.accept()
+      try:
+        HandleRequest(connection, tools)
+      except (IOError, ValueError, KeyError, socket.error):
+        # The client went away, or sent a bad request.
+        pass
+      finally:
+        connection.close()
+      served += 1
+  finally:
+    listener.close()
+    os.remove(socket_filename)
+
+
+def RunTool(tool_name, main, argv=None, socket_filename=None):
+  """Runs a tool in the service, if one is listening, and returns its
+  exit status. If no service is listening, returns main()."""
+  if argv is None:
+    argv = sys.argv[1:]
+  connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    connection.connect(socket_filename or SocketFilename())
+  except socket.error:
+    connection.close()
+    return main()
+  connection_file = connection.makefile('rw')
+  try:
+    _SendMessage(connection_file, {'tool': tool_name, 'argv': argv,
+                                   'cwd': os.getcwd()})
+    connection_file.flush()
+    for line in connection_file:
+      message = json.loads(line)
+      if 'status' in message:
+        return message['status']
+      if 'stdout' in message:
+        sys.stdout.write(message['stdout'])
+      if 'stderr' in message:
+        sys.stderr.write(message['stderr'])
+  finally:
+    connection_file.close()
+    connection.close()
+  raise encoder.Error('Service closed the connection early')
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the compare-codecs service."""
+
+import multiprocessing
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+import compare_service
+import test_tools
+
+
+def FakeTool():
+  print 'Arguments', ' '.join(sys.argv[1:])
+  sys.stderr.write('In %s\n' % os.getcwd())
+  return 3
+
+
+def FailingTool():
+  raise ValueError('Tool failed')
+
+
+class TestCompareService(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestCompareService, self).setUp()
+    self.socket_directory = tempfile.mkdtemp()
+    self.socket_filename = os.path.join(self.socket_directory, 'test.sock')
+    self.saved_stdout = sys.stdout
+    self.saved_stderr = sys.stderr
+    sys.stdout = StringIO.StringIO()
+    sys.stderr = StringIO.StringIO()
+
+  def tearDown(self):
+    sys.stdout = self.saved_stdout
+    sys.stderr = self.saved_stderr
+    shutil.rmtree(self.socket_directory)
+    super(TestCompareService, self).tearDown()
+
+  def StartService(self, requests):
+    tools = {'fake': FakeTool, 'failing': FailingTool}
+    # The service runs in its own process, as it does in use, so that
+    # it does not share sys.stdout with the client.
+    service = multiprocessing.Process(
+        target=compare_service.Serve,
+        args=(self.socket_filename, tools, requests))
+    service.start()
+    while not os.path.exists(self.socket_filename):
+      service.join(0.01)
+    return service
+
+  def test_CachedOptimizerIsReused(self):
+    optimizer1 = compare_service.CachedOptimizer('vp8', 'psnr')
+    self.assertIs(optimizer1, compare_service.CachedOptimizer('vp8', 'psnr'))
+    self.assertIsNot(optimizer1, compare_service.CachedOptimizer('vp8', 'rt'))
+
+  def test_RunsDirectlyWithoutService(self):
+    def Main():
+      return 5
+    self.assertEquals(5, compare_service.RunTool(
+        'fake', Main, [], socket_filename=self.socket_filename))
+
+  def test_RunsInService(self):
+    service = self.StartService(1)
+    def Main():
+      self.fail('Tool ran in the client')
+    status = compare_service.RunTool('fake', Main, ['a', 'b'],
+                                     socket_filename=self.socket_filename)
+    service.join()
+    self.assertEquals(3, status)
+    self.assertEquals('Arguments a b\n', sys.stdout.getvalue())
+    self.assertEquals('In %s\n' % os.getcwd(), sys.stderr.getvalue())
+    self.assertFalse(os.path.exists(self.socket_filename))
+
+  def test_ServiceSurvivesFailingTool(self):
+    service = self.StartService(2)
+    self.assertEquals(1, compare_service.RunTool(
+        'failing', None, [], socket_filename=self.socket_filename))
+    self.assertIn('Tool failed', sys.stderr.getvalue())
+    self.assertEquals(1, compare_service.RunTool(
+        'unknown', None, [], socket_filename=self.socket_filename))
+    service.join()
+
+  def test_ServedToolsExist(self):
+    for tool_name in compare_service.SERVED_TOOLS:
+      self.assertTrue(callable(compare_service.LoadTool(tool_name)))
+
+
+if __name__ == '__main__':
+  unittest.main()
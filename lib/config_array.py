@@ -0,0 +1,128 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Configurations as arrays of small integers.
+
+A ConfigurationArrays object gives the options of an OptionSet a fixed
+order, and each value of an option a number; 0 means the option is not
+set. A configuration is then a row of integers, one per option, and a
+set of configurations is a 2-dimensional array. The neighbours of many
+configurations can be listed, deduplicated and compared with the
+configurations already tried in a few array operations, and only the
+ones that are wanted are turned back into OptionValueSets.
+
+Options with no list of values (DummyOption) and unparsed parts of the
+command line are not in the rows. They are taken from a template
+OptionValueSet when a row is turned back into an OptionValueSet.
+"""
+
+import math
+
+import encoder
+import lazy_import
+
+numpy = lazy_import.LazyModule('numpy')  # pylint: disable=invalid-name
+
+# Index of "the option is not set".
+NOT_SET = 0
+
+# Keys are numbers in a mixed radix, and must fit in an int64.
+MAX_KEY_BITS = 62
+
+
+def _SortedValues(option):
+  if isinstance(option, encoder.IntegerOption):
+    return sorted(option.values, key=int)
+  return sorted(option.values)
+
+
+class ConfigurationArrays(object):
+  """Conversion between OptionValueSets of an OptionSet and rows of
+  value indexes, and operations on arrays of such rows."""
+  def __init__(self, option_set):
+    self.option_set = option_set
+    self.options = sorted([option for option in option_set.AllOptions()
+                           if option.values],
+                          key=lambda option: option.name)
+    self.values = [[None] + _SortedValues(option) for option in self.options]
+    self.value_indexes = [dict((value, index)
+                               for index, value in enumerate(values))
+                          for values in self.values]
+    radixes = [len(values) for values in self.values]
+    if sum(math.log(radix, 2) for radix in radixes) > MAX_KEY_BITS:
+      raise encoder.Error('Too many configurations for integer keys')
+    strides = [1]
+    for radix in radixes[:-1]:
+      strides.append(strides[-1] * radix)
+    self.strides = numpy.array(strides, dtype=numpy.int64)
+    # Every change of one option: a column and the value index it gets.
+    columns = []
+    indexes = []
+    for column, option in enumerate(self.options):
+      if option.CanChange():
+        for index in xrange(1, len(self.values[column])):
+          columns.append(column)
+          indexes.append(index)
+      if not option.mandatory:
+        columns.append(column)
+        indexes.append(NOT_SET)
+    self.change_columns = numpy.array(columns, dtype=numpy.int64)
+    self.change_indexes = numpy.array(indexes, dtype=numpy.int64)
+
+  def FromValueSet(self, value_set):
+    """Returns the row of a configuration."""
+    row = numpy.zeros(len(self.options), dtype=numpy.int64)
+    for column, option in enumerate(self.options):
+      if value_set.HasValue(option.name):
+        value = value_set.GetValue(option.name)
+        if value not in self.value_indexes[column]:
+          raise encoder.Error('Illegal value %s for option %s' %
+                              (value, option.name))
+        row[column] = self.value_indexes[column][value]
+    return row
+
+  def ToValueSet(self, row, template):
+    """Returns the configuration of a row. Values of options that are
+    not in the row, and unparsed parts, are taken from template."""
+    return template.ChangeValues(dict(
+        (option.name, self.values[column][row[column]])
+        for column, option in enumerate(self.options)))
+
+  def Keys(self, rows):
+    """Returns an integer for each row, different for different rows."""
+    return numpy.dot(rows, self.strides)
+
+  def Neighbours(self, rows):
+    """Returns all the rows that differ from one of rows in the value of
+    exactly one option, including the rows where that option is not set.
+    Only options that can change are changed, and mandatory options are
+    never unset."""
+    rows = numpy.atleast_2d(rows)
+    changes = len(self.change_columns)
+    neighbours = numpy.repeat(rows, changes, axis=0)
+    positions = numpy.arange(len(neighbours))
+    columns = numpy.tile(self.change_columns, len(rows))
+    indexes = numpy.tile(self.change_indexes, len(rows))
+    changed = neighbours[positions, columns] != indexes
+    neighbours[positions, columns] = indexes
+    return neighbours[changed]
+
+  def Unique(self, rows):
+    """Returns rows without duplicates, in the order they first occur."""
+    _, first = numpy.unique(self.Keys(rows), return_index=True)
+    return rows[numpy.sort(first)]
+
+  def Untried(self, rows, tried_keys):
+    """Returns the rows whose keys are not in tried_keys, an iterable."""
+    tried_keys = numpy.fromiter(tried_keys, dtype=numpy.int64)
+    return rows[numpy.logical_not(numpy.in1d(self.Keys(rows), tried_keys))]
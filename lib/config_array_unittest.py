@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for configurations as integer arrays."""
+
+import unittest
+
+import numpy
+
+import config_array
+import encoder
+import pick_codec
+
+
+def SmallOptionSet():
+  return encoder.OptionSet(
+      encoder.IntegerOption('speed', 0, 10),
+      encoder.ChoiceOption(['good', 'best']).Mandatory(),
+      encoder.Option('mode', ['a', 'b', 'c']),
+      encoder.DummyOption('fixed'))
+
+
+class TestConfigurationArrays(unittest.TestCase):
+  def test_RoundTrip(self):
+    option_set = SmallOptionSet()
+    arrays = config_array.ConfigurationArrays(option_set)
+    value_set = encoder.OptionValueSet(option_set,
+                                       '--speed=10 --best --fixed=3 --x')
+    row = arrays.FromValueSet(value_set)
+    # Options are in name order (good/best, mode, speed), values in
+    # sorted order after 0 for "not set".
+    self.assertEquals([1, 0, 11], list(row))
+    self.assertEquals(value_set, arrays.ToValueSet(row, value_set))
+
+  def test_RoundTripForCodecs(self):
+    for codec_name in ('vp8', 'x264', 'vp8_mpeg_1d'):
+      codec = pick_codec.PickCodec(codec_name)
+      arrays = config_array.ConfigurationArrays(codec.option_set)
+      value_set = codec.StartEncoder(encoder.Context(codec)).parameters
+      for _ in range(20):
+        value_set = value_set.RandomlyPatchConfig()
+        row = arrays.FromValueSet(value_set)
+        self.assertEquals(value_set, arrays.ToValueSet(row, value_set))
+
+  def test_NeighboursDifferInOneOption(self):
+    option_set = SmallOptionSet()
+    arrays = config_array.ConfigurationArrays(option_set)
+    row = arrays.FromValueSet(encoder.OptionValueSet(option_set,
+                                                     '--speed=3 --good'))
+    neighbours = arrays.Neighbours(row)
+    # The other choice; 3 modes; 10 other speeds and no speed.
+    self.assertEquals(1 + 3 + 11, len(neighbours))
+    for neighbour in neighbours:
+      self.assertEquals(1, sum(neighbour != row))
+    self.assertEquals(len(neighbours),
+                      len(set(arrays.Keys(neighbours).tolist())))
+    # Rows of several configurations at once.
+    self.assertEquals(2 * len(neighbours),
+                      len(arrays.Neighbours([row, row])))
+
+  def test_UniqueAndUntried(self):
+    option_set = SmallOptionSet()
+    arrays = config_array.ConfigurationArrays(option_set)
+    rows = numpy.array([
+        arrays.FromValueSet(encoder.OptionValueSet(option_set, flags))
+        for flags in ('--good', '--best', '--good', '--good --mode=a')])
+    unique = arrays.Unique(rows)
+    self.assertEquals(3, len(unique))
+    self.assertEquals(list(rows[1]), list(unique[1]))
+    untried = arrays.Untried(unique, set(arrays.Keys(rows[:2]).tolist()))
+    self.assertEquals([list(rows[3])], untried.tolist())
+    self.assertEquals(3, len(arrays.Untried(unique, [])))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -28,17 +28,22 @@ A variant is an encoder with at least one option changed.
 
 Configuration of the module is through the encoder_configuration module.
 """
+# pylint: disable=too-many-lines
 
 import encoder_configuration
+import frame_data
 import glob
 import json
+import leaderboard
 import md5
 import os
 import random
 import re
+import score_index
 import shutil
 import subprocess
 import sys
+import weakref
 
 
 class Error(Exception):
@@ -216,10 +221,15 @@ class OptionFormatter(object):
       return '%s%s%s%s' % (self.prefix, name, self.infix, value)
 
 
+# OptionValueSets returned by Interned(), by (string, option set, formatter).
+# pylint: disable=invalid-name
+_interned_value_sets = weakref.WeakValueDictionary()
+
+
 class OptionValueSet(object):
   """Values for a set of options.
 
-  The values are immutable.
+  The values are immutable, so the string form is computed only once.
   This class knows how to parse the set from a string (via an injected
   formatter module + an OptionSet for the names), and how to generate
   a string from the set of values.
@@ -236,6 +246,7 @@ class OptionValueSet(object):
     self.formatter = formatter
     self.values = {}
     self.other_parts = []
+    self.string = None
     unparsed = string
     matcher = r'\s*%s([^%s ]*)(%s(\S+))?' % (formatter.prefix,
                                              formatter.infix[0:1],
@@ -281,11 +292,25 @@ class OptionValueSet(object):
 
   def ToString(self):
     # ToString returns parts in sorted order, for consistency.
-    parts = [self.option_set.Format(name, value, self.formatter)
-                       for name, value in self.values.iteritems()]
-    return ' '.join(sorted(parts + self.other_parts))
+    if self.string is None:
+      parts = [self.option_set.Format(name, value, self.formatter)
+               for name, value in self.values.iteritems()]
+      self.string = ' '.join(sorted(parts + self.other_parts))
+    return self.string
+
+  def Interned(self):
+    """Returns the OptionValueSet that is shared by all equal sets of the
+    same options, so that equal sets are usually the same object."""
+    key = (self.ToString(), self.option_set, self.formatter)
+    interned = _interned_value_sets.get(key)
+    if interned is None:
+      _interned_value_sets[key] = self
+      return self
+    return interned
 
   def __eq__(self, other):
+    if self is other:
+      return True
     if isinstance(other, self.__class__):
       return self.ToString() == other.ToString()
     else:
@@ -296,6 +321,9 @@ class OptionValueSet(object):
   def __ne__(self, other):
     return not self.__eq__(other)
 
+  def __hash__(self):
+    return hash(self.ToString())
+
   def GetValue(self, name):
     try:
       return self.values[name]
@@ -335,6 +363,23 @@ class OptionValueSet(object):
     del new_set.values[name]
     return new_set
 
+  def ChangeValues(self, changes):
+    """Return an OptionValueSet with several parameters changed.
+
+    changes is a dictionary of name -> value. A value of None removes
+    the parameter."""
+    new_set = self._Clone()
+    for name, value in changes.iteritems():
+      if not self.option_set.HasOption(name):
+        raise Error('Unknown option name %s' % name)
+      if value is not None:
+        new_set.values[name] = value
+      elif name in new_set.values:
+        if self.option_set.Option(name).mandatory:
+          raise Error('Cannot remove option %s' % name)
+        del new_set.values[name]
+    return new_set
+
   def RandomlyPatchOption(self, option):
     """ Modify a configuration by changing the value of this option."""
     if self.HasValue(option.name):
@@ -515,6 +560,7 @@ class Encoder(object):
     """
     self.context = context
     self.stored = False
+    self.hashname = None
     if parameters is None:
       if filename is None:
         raise Error("Encoder with neither parameters nor filename")
@@ -525,6 +571,7 @@ class Encoder(object):
                       % (filename, context.codec.name))
     else:
       self.parameters = context.codec.ConfigurationFixups(parameters)
+    self.parameters = self.parameters.Interned()
 
   def Encoding(self, bitrate, videofile):
     return Encoding(self, bitrate, videofile)
@@ -552,10 +599,11 @@ class Encoder(object):
     self.context.cache.StoreEncoder(self)
 
   def Hashname(self):
-    parameter_hash = md5.new()
-    parameter_hash.update(self.parameters.ToString())
-    hashname = parameter_hash.hexdigest()[:12]
-    return hashname
+    if self.hashname is None:
+      parameter_hash = md5.new()
+      parameter_hash.update(self.parameters.ToString())
+      self.hashname = parameter_hash.hexdigest()[:12]
+    return self.hashname
 
   def OptionValues(self):
     """Returns a dictionary of all current option values."""
@@ -619,7 +667,7 @@ class Encoding(object):
     return self.result
 
   def ResultWithoutFrameData(self):
-    return {i: self.result[i] for i in self.result if i != 'frame'}
+    return frame_data.WithoutFrames(self.result)
 
   def SomeUntriedVariants(self):
     """Returns some variant encodings that have not been tried.
@@ -632,10 +680,8 @@ class Encoding(object):
       return []
     # Check for suggested variants.
     suggested_tweak = self.context.codec.SuggestTweak(self)
-    if suggested_tweak:
-      suggested_tweak.Recover()
-      if not suggested_tweak.Result():
-        result.append(suggested_tweak)
+    if suggested_tweak and not suggested_tweak.Tried():
+      result.append(suggested_tweak)
     # Generate up to 10 single-hop variants.
     # Just using a variable as a counter doesn't satisfy pylint.
     # pylint: disable=W0612
@@ -648,8 +694,7 @@ class Encoding(object):
       if not params_as_string in seen:
         variant_encoding = Encoding(variant_encoder, self.bitrate,
                                     self.videofile)
-        variant_encoding.Recover()
-        if not variant_encoding.Result():
+        if not variant_encoding.Tried():
           result.append(variant_encoding)
           seen.add(params_as_string)
 
@@ -666,8 +711,7 @@ class Encoding(object):
           variant_encoding = Encoding(variant_encoder,
                                       self.bitrate,
                                       self.videofile)
-          variant_encoding.Recover()
-          if not variant_encoding.Result():
+          if not variant_encoding.Tried():
             result.append(variant_encoding)
             seen.add(params_as_string)
 
@@ -700,11 +744,22 @@ class Encoding(object):
 
   def Store(self):
     self.encoder.Store()
+    leaderboards = self.context.cache.leaderboards
+    if leaderboards:
+      fingerprint = leaderboards.CurrentFingerprint(self.bitrate,
+                                                    self.videofile)
     self.context.cache.StoreEncoding(self)
+    if leaderboards:
+      leaderboards.NoteStoredEncoding(self, fingerprint)
 
   def Recover(self):
     self.result = self.context.cache.ReadEncodingResult(self)
 
+  def Tried(self):
+    """Returns true if a result for this encoding is stored. This is
+    cheaper than Recover, since the result is not read."""
+    return self.context.cache.HasResult(self)
+
   def ChangeValue(self, name, value):
     new_encoder = self.encoder.ChangeValue(name, value)
     new_encoding = new_encoder.Encoding(self.bitrate, self.videofile)
@@ -722,6 +777,9 @@ def _FileNameToBitrate(full_filename):
     # Let it remain zero, we don't know what the target rate is.
     return 0
 
+def _FileNameToHashname(full_filename):
+  return os.path.basename(os.path.dirname(os.path.dirname(full_filename)))
+
 def _FileNameToVideofile(full_filename):
   # Construct a pseudo videofile from the filename.
   filename = os.path.basename(full_filename)
@@ -734,15 +792,17 @@ class EncodingDiskCache(object):
   def __init__(self, context, scoredir=None):
     self.context = context
     self.bad_encodings = {}
+    # (speed group, clip) -> hashnames of the encoders with a result.
+    self.tried = {}
     if scoredir:
-      self.workdir = os.path.join(encoder_configuration.conf.sysdir(),
-                                  scoredir, context.codec.name)
+      root = os.path.join(encoder_configuration.conf.sysdir(), scoredir)
     else:
       # Default work directory.
-      self.workdir = os.path.join(encoder_configuration.conf.workdir(),
-                                  context.codec.name)
+      root = encoder_configuration.conf.workdir()
+    self.workdir = os.path.join(root, context.codec.name)
     if not os.path.isdir(self.workdir):
       os.mkdir(self.workdir)
+    self.leaderboards = leaderboard.LeaderboardStore(context, root)
 
   def WorkDir(self):
     return self.workdir
@@ -784,21 +844,25 @@ class EncodingDiskCache(object):
     if encoder:
       encoder_part = encoder.Hashname()
     else:
-      encoder_part = '*'
+      encoder_part = None
     if bitrate:
       bitrate_part = self.context.codec.SpeedGroup(bitrate)
     else:
-      bitrate_part = '*'
+      bitrate_part = None
     if videofile:
       videofile_part = os.path.splitext(
-          os.path.basename(videofile.filename))[0] + '.result'
+          os.path.basename(videofile.filename))[0]
     else:
-      videofile_part = '*' + '.result'
+      videofile_part = None
     files = []
     for path in self.SearchPathForScores():
-      pattern = os.path.join(path, encoder_part,
-                             bitrate_part, videofile_part)
-      files.extend(glob.glob(pattern))
+      files.extend(score_index.IndexForDirectory(path).ResultFilenames(
+          encoder_part, bitrate_part, videofile_part))
+    if bitrate_part and videofile_part and not encoder_part:
+      # All results for the target have been listed, so the tried set
+      # for it can be brought up to date for free.
+      self.tried[(bitrate_part, videofile_part)] = set(
+          _FileNameToHashname(filename) for filename in files)
     return self._FilesToEncodings(files, videofile, bitrate)
 
   def AllScoredEncodings(self, bitrate, videofile):
@@ -837,12 +901,12 @@ class EncodingDiskCache(object):
                               formatter=self.context.codec.option_formatter)
     else:
       for repository in self.SearchPathForScores():
-        filename = os.path.join(repository, dirname, 'parameters')
-        if os.path.isfile(filename):
-          with open(filename, 'r') as parameterfile:
-            return OptionValueSet(self.context.codec.option_set,
-                                  parameterfile.read(),
-                                  formatter=self.context.codec.option_formatter)
+        parameters = score_index.ReadParameterFile(
+            os.path.join(repository, dirname, 'parameters'))
+        if parameters is not None:
+          return OptionValueSet(self.context.codec.option_set,
+                                parameters,
+                                formatter=self.context.codec.option_formatter)
 
   def AllEncoderFilenames(self, only_workdir=False):
     filenames = []
@@ -857,6 +921,7 @@ class EncodingDiskCache(object):
 
   def RemoveEncoder(self, hashname):
     shutil.rmtree(os.path.join(self.workdir, hashname))
+    score_index.ForgetDirectory(os.path.join(self.workdir, hashname))
 
   def StoreEncoding(self, encoding):
     """Stores an encoding object on disk.
@@ -873,8 +938,63 @@ class EncodingDiskCache(object):
     if not encoding.result:
       return
     videoname = encoding.videofile.basename
-    with open('%s/%s.result' % (dirname, videoname), 'w') as resultfile:
-      json.dump(encoding.result, resultfile, indent=2)
+    filename = '%s/%s.result' % (dirname, videoname)
+    frame_filename = frame_data.FrameFilename(filename)
+    result = frame_data.WithoutFrames(encoding.result)
+    entries = frame_data.FrameEntries(encoding.result)
+    if entries and frame_data.Packable(entries):
+      frame_data.WriteFrameFile(frame_filename, entries)
+    else:
+      result.update(entries)
+      if os.path.isfile(frame_filename):
+        os.remove(frame_filename)
+    with open(filename, 'w') as resultfile:
+      json.dump(result, resultfile, indent=2)
+    score_index.ForgetFile(filename)
+    tried = self.tried.get((self.context.codec.SpeedGroup(encoding.bitrate),
+                            videoname))
+    if tried is not None:
+      tried.add(encoding.encoder.Hashname())
+
+  def TriedHashnames(self, bitrate, videofile):
+    """Returns the set of hashnames of the encoders with a stored result
+    for a target. The caller must not change it.
+
+    The hashnames are listed once, the first time they are needed or when
+    all the results for the target are read. Results stored by other
+    processes in the meantime may be missed."""
+    speed_group = self.context.codec.SpeedGroup(bitrate)
+    clip = videofile.basename
+    key = (speed_group, clip)
+    if key not in self.tried:
+      hashnames = set()
+      for path in self.SearchPathForScores():
+        hashnames.update(
+            _FileNameToHashname(filename) for filename in
+            score_index.IndexForDirectory(path).ResultFilenames(
+                None, speed_group, clip))
+      self.tried[key] = hashnames
+    return self.tried[key]
+
+  def HasResult(self, encoding):
+    """Returns true if there is a stored result for the encoding.
+
+    This is a set lookup, both for encodings that have been tried and
+    encodings that have not."""
+    return encoding.encoder.Hashname() in self.TriedHashnames(
+        encoding.bitrate, encoding.videofile)
+
+  def ScoredFingerprint(self, bitrate, videofile):
+    """Returns a string that changes when the set of encoders with a
+    result for a target's speed group and clip changes.
+
+    The score indexes keep it up to date, and see results stored by other
+    processes once they have checked their directories."""
+    speed_group = self.context.codec.SpeedGroup(bitrate)
+    return ','.join(
+        '%x' % score_index.IndexForDirectory(path).Fingerprint(
+            speed_group, videofile.basename)
+        for path in self.SearchPathForScores())
 
   def ReadEncodingResult(self, encoding):
     """Reads an encoding result back from storage, if present.
@@ -883,61 +1003,63 @@ class EncodingDiskCache(object):
     If scoredir is given, only that directory is searched.
     If it is not given, all directories in the search path are searched."""
 
-    searchpath = self.SearchPathForScores()
-
-    for workdir in searchpath:
-      dirname = os.path.join(workdir, encoding.encoder.Hashname(),
-                             self.context.codec.SpeedGroup(encoding.bitrate))
-      filename = os.path.join(dirname,
-                              '%s.result' % encoding.videofile.basename)
-      if not os.path.isfile(filename):
+    for workdir in self.SearchPathForScores():
+      filename = score_index.IndexForDirectory(workdir).ResultFilename(
+          encoding.encoder.Hashname(),
+          self.context.codec.SpeedGroup(encoding.bitrate),
+          encoding.videofile.basename)
+      if not filename:
         continue
-      with open(filename, 'r') as resultfile:
-        stringbuffer = resultfile.read()
-        try:
-          return json.loads(stringbuffer)
-        except:
-          raise Error('Unexpected JSON error: %s, filename was %s' %
-                      (sys.exc_info()[0], filename))
+      try:
+        result = score_index.ReadResultFile(filename)
+      except ValueError:
+        raise Error('Unexpected JSON error: %s, filename was %s' %
+                    (sys.exc_info()[0], filename))
+      if result is not None:
+        if 'frame' in result:
+          # Written before frame files were used.
+          return result
+        return frame_data.LazyFrameResult(
+            result, frame_data.FrameFilename(filename))
     return None
 
 
 class EncodingMemoryCache(object):
   """Encoder and encoding information, in-memory only. For testing."""
+  # pylint: disable=too-many-instance-attributes
   def __init__(self, context, scoredir=None):
     if scoredir:
       raise Error('Cannot have scoredir on a memory cache')
     self.context = context
     self.encoders = {}
     self.encodings = []
+    # Indexes of the stored encodings, each keeping them in the order they
+    # were stored, so that lookups need not scan all encodings.
+    self.encodings_by_target = {}
+    self.encodings_by_parameters = {}
+    self.encodings_by_key = {}
     self.workdir = '/not-valid-file/' + self.context.codec.name
+    self.leaderboards = None
 
   def WorkDir(self):
     return self.workdir
 
+  @staticmethod
+  def _Scored(encodings):
+    return [encoding for encoding in encodings if encoding.Result()]
+
   def AllScoredEncodings(self, bitrate, videofile):
-    result = []
-    for encoding in self.encodings:
-      if (bitrate == encoding.bitrate and
-          videofile.filename == encoding.videofile.filename and
-          encoding.Result()):
-        result.append(encoding)
-    return result
+    return self._Scored(self.encodings_by_target.get(
+        (bitrate, videofile.filename), []))
 
   def AllScoredRates(self, encoder, videofile):
-    result = []
-    for encoding in self.encodings:
-      if (videofile == encoding.videofile and
-          encoder.parameters.ToString() ==
-              encoding.encoder.parameters.ToString() and
-          encoding.Result()):
-        result.append(encoding)
-    return result
+    return [encoding for encoding
+            in self.AllScoredEncodingsForEncoder(encoder)
+            if encoding.videofile.filename == videofile.filename]
 
   def AllScoredEncodingsForEncoder(self, encoder):
-    return [encoding for encoding in self.encodings
-            if (encoder.HasSameParameters(encoding.encoder) and
-                encoding.Result())]
+    return self._Scored(self.encodings_by_parameters.get(
+        encoder.parameters.ToString(), []))
 
   def StoreEncoder(self, encoder):
     self.encoders[encoder.Hashname()] = encoder
@@ -949,17 +1071,29 @@ class EncodingMemoryCache(object):
 
   def StoreEncoding(self, encoding):
     self.encodings.append(encoding)
+    parameters = encoding.encoder.parameters.ToString()
+    filename = encoding.videofile.filename
+    self.encodings_by_target.setdefault(
+        (encoding.bitrate, filename), []).append(encoding)
+    self.encodings_by_parameters.setdefault(parameters, []).append(encoding)
+    self.encodings_by_key.setdefault(
+        (parameters, encoding.bitrate, filename), []).append(encoding)
+
+  def TriedHashnames(self, bitrate, videofile):
+    return set(encoding.encoder.Hashname() for encoding
+               in self.AllScoredEncodings(bitrate, videofile))
+
+  def HasResult(self, encoding):
+    return self.ReadEncodingResult(encoding) is not None
 
   def ReadEncodingResult(self, encoding_in, scoredir=None):
     # pylint: disable=W0613
-    # Since the memory cache stores the results as a list of encodings,
-    # we must find an encoding with the same properties as the one we're
-    # reading parameters for, and return the result from that.
-    for encoding in self.encodings:
-      if (encoding_in.videofile.filename == encoding.videofile.filename and
-          encoding_in.encoder.parameters.ToString() ==
-              encoding.encoder.parameters.ToString() and
-          encoding_in.bitrate == encoding.bitrate and
-          encoding.Result()):
+    # The memory cache stores the results with the encodings, so we must
+    # find an encoding with the same properties as the one we're reading
+    # parameters for, and return the result from that.
+    key = (encoding_in.encoder.parameters.ToString(), encoding_in.bitrate,
+           encoding_in.videofile.filename)
+    for encoding in self.encodings_by_key.get(key, []):
+      if encoding.Result():
         return encoding.Result()
     return None
@@ -16,6 +16,7 @@
 """Unit tests for encoder module."""
 
 import encoder_configuration
+import json
 import os
 import re
 import shutil
@@ -205,6 +206,14 @@ class TestOptionValueSet(unittest.TestCase):
       # pylint: disable=W0612
       newset = valueset.ChangeValue('nosuchname', 'bar')
 
+  def test_ChangeValues(self):
+    opts = encoder.OptionSet(encoder.ChoiceOption(['foo', 'bar']),
+                             encoder.Option('baz', ['1', '2']))
+    valueset = encoder.OptionValueSet(opts, '--foo --baz=1')
+    newset = valueset.ChangeValues({'foo/bar': 'bar', 'baz': None})
+    self.assertEqual('--bar', newset.ToString())
+    self.assertEqual('--baz=1 --foo', valueset.ToString())
+
   def test_RandomlyPatchConfig(self):
     config = encoder.OptionValueSet(
       encoder.OptionSet(encoder.Option('foo', ['foo', 'bar'])),
@@ -332,13 +341,29 @@ class TestEncoder(unittest.TestCase):
     my_encoder.Store()
     # Break stored object. Note: This uses knowledge of the memory cache.
     old_filename = my_encoder.Hashname()
-    parameters = context.cache.encoders[old_filename].parameters
-    parameters.other_parts.append('--extra-stuff')
+    # Value sets are immutable, so replace the stored one.
+    context.cache.encoders[old_filename].parameters = encoder.OptionValueSet(
+        encoder.OptionSet(), '--parameters --extra-stuff')
     # Now Hashname() should return a different value.
     with self.assertRaisesRegexp(encoder.Error, 'contains wrong arguments'):
       # pylint: disable=W0612
       new_encoder = encoder.Encoder(context, filename=old_filename)
 
+  def testEqualParametersAreShared(self):
+    context = encoder.Context(DummyCodec())
+    option_set = encoder.OptionSet(encoder.Option('foo', ['foo', 'bar']))
+    encoder1 = encoder.Encoder(
+        context, encoder.OptionValueSet(option_set, '--foo=foo'))
+    encoder2 = encoder.Encoder(
+        context, encoder.OptionValueSet(option_set, '--foo=bar').ChangeValue(
+            'foo', 'foo'))
+    self.assertIs(encoder1.parameters, encoder2.parameters)
+    self.assertEquals(encoder1.Hashname(), encoder2.Hashname())
+    encoder3 = encoder.Encoder(
+        context, encoder.OptionValueSet(option_set, '--foo=bar'))
+    self.assertIsNot(encoder1.parameters, encoder3.parameters)
+    self.assertNotEqual(encoder1.Hashname(), encoder3.Hashname())
+
   def test_Changevalue(self):
     config = encoder.OptionValueSet(
         encoder.OptionSet(encoder.Option('foo', ['foo', 'bar'])),
@@ -458,6 +483,83 @@ class TestEncodingDiskCache(test_tools.FileUsingCodecTest):
     result = cache.ReadEncodingResult(my_encoding)
     self.assertEquals(result, testresult)
 
+  def testHasResult(self):
+    context = StorageOnlyContext()
+    cache = encoder.EncodingDiskCache(context)
+    context.cache = cache
+    videofile = encoder.Videofile('x/foo_640_480_20.yuv')
+    option_set = encoder.OptionSet(encoder.Option('x', ['1', '2', '3']))
+    encoders = [encoder.Encoder(context,
+                                encoder.OptionValueSet(option_set, flags))
+                for flags in ('--x=1', '--x=2', '--x=3')]
+    for my_encoder in encoders:
+      cache.StoreEncoder(my_encoder)
+    my_encoding = encoders[0].Encoding(123, videofile)
+    my_encoding.result = {'foo': 'bar'}
+    my_encoding.Store()
+    # The tried set is listed from the directories.
+    self.assertTrue(my_encoding.Tried())
+    self.assertFalse(encoders[1].Encoding(123, videofile).Tried())
+    self.assertFalse(encoders[0].Encoding(246, videofile).Tried())
+    # Results stored through the cache are added to the tried set.
+    other_encoding = encoders[1].Encoding(123, videofile)
+    other_encoding.result = {'foo': 'baz'}
+    other_encoding.Store()
+    self.assertTrue(other_encoding.Tried())
+    # Results stored elsewhere are seen when the target is listed again.
+    other_cache = encoder.EncodingDiskCache(StorageOnlyContext())
+    third_encoding = encoders[2].Encoding(123, videofile)
+    third_encoding.result = {'foo': 'qux'}
+    other_cache.StoreEncoder(encoders[2])
+    other_cache.StoreEncoding(third_encoding)
+    cache.AllScoredEncodings(123, videofile)
+    self.assertTrue(cache.HasResult(third_encoding))
+    # Other tests in this class count the encoders in the work directory.
+    for my_encoder in encoders:
+      cache.RemoveEncoder(my_encoder.Hashname())
+
+  def testFrameDataIsStoredSeparately(self):
+    context = StorageOnlyContext()
+    cache = encoder.EncodingDiskCache(context)
+    my_encoder = encoder.Encoder(
+        context,
+        encoder.OptionValueSet(encoder.OptionSet(), '--parameters'))
+    cache.StoreEncoder(my_encoder)
+    my_encoding = encoder.Encoding(my_encoder, 123,
+                                   encoder.Videofile('x/foo_640_480_20.yuv'))
+    frames = [{'size': 800}, {'size': 160}]
+    my_encoding.result = {'foo': 'bar', 'frame': frames,
+                          'frame_psnr': [40.0, 41.5]}
+    cache.StoreEncoding(my_encoding)
+    resultfile_name = os.path.join(cache.workdir, my_encoder.Hashname(),
+                                   '123', 'foo_640_480_20.result')
+    with open(resultfile_name) as resultfile:
+      self.assertEquals({'foo': 'bar'}, json.load(resultfile))
+    my_encoding.result = None
+    result = cache.ReadEncodingResult(my_encoding)
+    # Frame data is only read when asked for.
+    self.assertEquals({'foo': 'bar'}, result.result)
+    self.assertTrue('frame' in result)
+    self.assertEquals(frames, result['frame'])
+    self.assertEquals([40.0, 41.5], result['frame_psnr'])
+    my_encoding.result = result
+    self.assertEquals({'foo': 'bar'}, my_encoding.ResultWithoutFrameData())
+
+  def testUnpackableFrameDataIsKeptInResult(self):
+    context = StorageOnlyContext()
+    cache = encoder.EncodingDiskCache(context)
+    my_encoder = encoder.Encoder(
+        context,
+        encoder.OptionValueSet(encoder.OptionSet(), '--parameters'))
+    cache.StoreEncoder(my_encoder)
+    my_encoding = encoder.Encoding(my_encoder, 123,
+                                   encoder.Videofile('x/foo_640_480_20.yuv'))
+    testresult = {'foo': 'bar', 'frame': [{'size': 800, 'qp': 20}]}
+    my_encoding.result = testresult
+    cache.StoreEncoding(my_encoding)
+    my_encoding.result = None
+    self.assertEquals(testresult, cache.ReadEncodingResult(my_encoding))
+
   def testStoreMultipleEncodings(self):
     context = StorageOnlyContext()
     cache = encoder.EncodingDiskCache(context)
@@ -681,6 +783,39 @@ class TestEncodingMemoryCache(unittest.TestCase):
     encoding2 = encoder2.Encoding(123, videofile2)
     self.assertTrue(cache.ReadEncodingResult(encoding2))
 
+  def testLookupsSeeOnlyMatchingEncodings(self):
+    context = StorageOnlyContext()
+    cache = encoder.EncodingMemoryCache(context)
+    context.cache = cache
+    option_set = encoder.OptionSet(encoder.Option('x', ['1', '2']))
+    encoders = [encoder.Encoder(context,
+                                encoder.OptionValueSet(option_set, flags))
+                for flags in ('--x=1', '--x=2')]
+    videofiles = [encoder.Videofile('x/foo_640_480_20.yuv'),
+                  encoder.Videofile('x/bar_640_480_20.yuv')]
+    for my_encoder in encoders:
+      for videofile in videofiles:
+        for bitrate in (100, 200):
+          my_encoding = encoder.Encoding(my_encoder, bitrate, videofile)
+          my_encoding.result = {'bitrate': bitrate,
+                                'flags': my_encoder.parameters.ToString()}
+          cache.StoreEncoding(my_encoding)
+    # An encoding without a result is not returned.
+    cache.StoreEncoding(encoder.Encoding(encoders[0], 300, videofiles[0]))
+    self.assertEquals(2, len(cache.AllScoredEncodings(100, videofiles[0])))
+    self.assertEquals(0, len(cache.AllScoredEncodings(300, videofiles[0])))
+    self.assertEquals(2, len(cache.AllScoredRates(encoders[1],
+                                                  videofiles[1])))
+    self.assertEquals(4, len(cache.AllScoredEncodingsForEncoder(encoders[0])))
+    same_parameters = encoder.Encoder(
+        context, encoder.OptionValueSet(option_set, '--x=2'))
+    result = cache.ReadEncodingResult(
+        encoder.Encoding(same_parameters, 200,
+                         encoder.Videofile(videofiles[1].filename)))
+    self.assertEquals({'bitrate': 200, 'flags': '--x=2'}, result)
+    self.assertIsNone(cache.ReadEncodingResult(
+        encoder.Encoding(same_parameters, 300, videofiles[1])))
+
 
 if __name__ == '__main__':
   unittest.main()
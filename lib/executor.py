@@ -0,0 +1,184 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Execution of many encodings at the same time.
+
+ExecuteMany runs encodings in a pool of worker processes. Each job runs
+in a scratch directory of its own, inside the encoding's Workdir(), so
+jobs that would write the same temporary files can run side by side.
+When a job finishes, its files are moved to the Workdir() as if
+Execute() had been called there, and the result is stored.
+
+The number of jobs counts cores, not encodings: an encoding whose
+parameters ask for several threads (such as --threads for x264) takes
+as many cores as threads.
+
+The workers are forked from the calling process and run the codec's
+Execute() on their copy of the encodings, so codecs and caches do not
+need to be picklable. Only results are sent back.
+"""
+
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+# How often running jobs are checked on.
+_POLL_SECONDS = 0.1
+
+# The encodings of the ExecuteMany call in progress. Set before the
+# worker processes are forked, so that they see it too.
+# pylint: disable=invalid-name
+_encodings = []
+
+
+class Error(Exception):
+  pass
+
+
+def DefaultJobs():
+  """Returns the number of cores on this machine."""
+  try:
+    return multiprocessing.cpu_count()
+  except NotImplementedError:
+    return 1
+
+
+def ThreadCount(encoding):
+  """Returns the number of threads an encoding's parameters ask for."""
+  parameters = encoding.encoder.parameters
+  if parameters.HasValue('threads'):
+    return max(1, int(parameters.GetValue('threads')))
+  match = re.search(r'--threads[ =:](\d+)', parameters.ToString())
+  if match:
+    return max(1, int(match.group(1)))
+  return 1
+
+
+def _ExecuteJob(index, scratchdir):
+  """Runs in a worker. Returns (index, result, error message)."""
+  encoding = _encodings[index]
+  try:
+    result = encoding.encoder.Execute(encoding.bitrate, encoding.videofile,
+                                      scratchdir)
+    return index, result, None
+  except Exception:  # pylint: disable=broad-except
+    return index, None, ''.join(traceback.format_exception(*sys.exc_info()))
+  finally:
+    sys.stdout.flush()
+
+
+def _ScratchDirectory(encoding):
+  workdir = encoding.Workdir()
+  if os.path.isdir(workdir):
+    return tempfile.mkdtemp(prefix='job-', dir=workdir)
+  return tempfile.mkdtemp(prefix='job-')
+
+
+def _FinishScratchDirectory(scratchdir, workdir):
+  """Moves the files a job left behind to where Execute() puts them."""
+  if os.path.isdir(workdir):
+    for name in os.listdir(scratchdir):
+      os.rename(os.path.join(scratchdir, name), os.path.join(workdir, name))
+  shutil.rmtree(scratchdir)
+
+
+def _WorkerPids(pool):
+  """Returns the process ids of a pool's workers, or None if one of
+  them has exited."""
+  # Pool has no public way to tell that a worker died, and the job it
+  # was running is lost when it does.
+  # pylint: disable=protected-access
+  workers = pool._pool
+  if any(worker.exitcode is not None for worker in workers):
+    return None
+  return set(worker.pid for worker in workers)
+
+
+def _WaitForJob(pool, workers, running):
+  """Returns the index of a running job that has finished.
+
+  Raises Error if a worker process has died, since its job never will
+  finish."""
+  while True:
+    for index, (_, async_result) in running.iteritems():
+      if async_result.ready():
+        return index
+    if _WorkerPids(pool) != workers:
+      raise Error('A worker process died while running encodings')
+    # A short sleep keeps the wait interruptible with Ctrl-C.
+    time.sleep(_POLL_SECONDS)
+
+
+def _JobResult(async_result):
+  """Returns (result, error message) for a finished job."""
+  try:
+    _, result, error = async_result.get()
+    return result, error
+  except Exception as err:  # pylint: disable=broad-except
+    # Such as a result that can't be sent back from the worker.
+    return None, 'Job failed: %r' % err
+
+
+def ExecuteMany(encodings, jobs=None, store=True):
+  """Executes encodings in parallel, using up to jobs cores.
+
+  Results are stored as each encoding finishes, unless store is false.
+  Returns the encodings that failed, as (encoding, error message) pairs;
+  the others have their results filled in. Raises Error if a worker
+  process dies."""
+  # pylint: disable=global-statement
+  global _encodings
+  jobs = jobs or DefaultJobs()
+  _encodings = list(encodings)
+  pending = range(len(_encodings))
+  failures = []
+  if not pending:
+    return failures
+  pool = multiprocessing.Pool(min(jobs, len(pending)))
+  try:
+    workers = _WorkerPids(pool)
+    running = {}
+    cores_in_use = 0
+    while pending or running:
+      # Start what fits. Something is always started when nothing is
+      # running, so that encodings wanting more than jobs cores still run.
+      while pending and (not running or
+                         cores_in_use + ThreadCount(_encodings[pending[0]])
+                         <= jobs):
+        index = pending.pop(0)
+        scratchdir = _ScratchDirectory(_encodings[index])
+        cores_in_use += ThreadCount(_encodings[index])
+        running[index] = (scratchdir, pool.apply_async(_ExecuteJob,
+                                                       (index, scratchdir)))
+      index = _WaitForJob(pool, workers, running)
+      scratchdir, async_result = running.pop(index)
+      encoding = _encodings[index]
+      cores_in_use -= ThreadCount(encoding)
+      _FinishScratchDirectory(scratchdir, encoding.Workdir())
+      result, error = _JobResult(async_result)
+      if error:
+        failures.append((encoding, error))
+        continue
+      encoding.result = result
+      if store:
+        encoding.Store()
+  finally:
+    pool.terminate()
+    pool.join()
+    _encodings = []
+  return failures
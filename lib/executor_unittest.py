@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the parallel executor."""
+
+import os
+import re
+import unittest
+
+import encoder
+import executor
+import test_tools
+
+
+class FileWritingCodec(encoder.Codec):
+  """A codec that writes an "encoded file" to its workdir."""
+  def __init__(self):
+    super(FileWritingCodec, self).__init__('filewriting')
+    self.extension = 'fake'
+    self.option_set = encoder.OptionSet(
+        encoder.IntegerOption('score', 0, 10),
+        encoder.IntegerOption('threads', 1, 8),
+    )
+
+  def StartEncoder(self, context):
+    return encoder.Encoder(context, encoder.OptionValueSet(
+        self.option_set, '--score=5 --threads=1'))
+
+  def Execute(self, parameters, bitrate, videofile, workdir):
+    score = int(re.search(r'--score=(\d+)', parameters.ToString()).group(1))
+    if score == 0:
+      raise encoder.Error('Score zero fails')
+    if score == 9:
+      # pylint: disable=protected-access
+      os._exit(1)
+    with open(os.path.join(workdir, '%s.%s' % (videofile.basename,
+                                               self.extension)), 'w') as out:
+      out.write('encoded')
+    if score == 8:
+      # Can't be pickled.
+      return {'psnr': score, 'bitrate': bitrate, 'pid': lambda: None}
+    return {'psnr': score, 'bitrate': bitrate, 'pid': os.getpid()}
+
+
+class TestExecutor(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestExecutor, self).setUp()
+    test_tools.EmptyWorkDirectory()
+    self.context = encoder.Context(FileWritingCodec(),
+                                   encoder.EncodingDiskCache)
+    self.videofile = encoder.Videofile('foofile_640_480_30.yuv')
+
+  def MakeEncoding(self, parameter_string, bitrate=100):
+    return encoder.Encoder(self.context, encoder.OptionValueSet(
+        self.context.codec.option_set, parameter_string)).Encoding(
+            bitrate, self.videofile)
+
+  def testThreadCount(self):
+    self.assertEquals(1, executor.ThreadCount(self.MakeEncoding('--score=1')))
+    self.assertEquals(4, executor.ThreadCount(
+        self.MakeEncoding('--score=1 --threads=4')))
+
+  def testExecuteMany(self):
+    encodings = [self.MakeEncoding('--score=%d' % score, bitrate)
+                 for score in range(1, 6) for bitrate in (100, 200)]
+    self.assertEquals([], executor.ExecuteMany(encodings, jobs=3))
+    for encoding in encodings:
+      self.assertTrue(encoding.result)
+      self.assertNotEqual(os.getpid(), encoding.result['pid'])
+      # Stored, with the encoded file where Execute() would put it.
+      recovered = encoding.encoder.Encoding(encoding.bitrate, self.videofile)
+      recovered.Recover()
+      self.assertEquals(encoding.result['psnr'], recovered.result['psnr'])
+      self.assertEquals(['foofile_640_480_30.fake',
+                         'foofile_640_480_30.result'],
+                        sorted(os.listdir(encoding.Workdir())))
+
+  def testFailuresAreReported(self):
+    good = self.MakeEncoding('--score=3')
+    bad = self.MakeEncoding('--score=0')
+    failures = executor.ExecuteMany([good, bad], jobs=2)
+    self.assertEquals(1, len(failures))
+    self.assertIs(bad, failures[0][0])
+    self.assertIn('Score zero fails', failures[0][1])
+    self.assertFalse(bad.result)
+    self.assertTrue(good.result)
+
+  def testUnpicklableResultIsAFailure(self):
+    bad = self.MakeEncoding('--score=8')
+    failures = executor.ExecuteMany([bad], jobs=1)
+    self.assertEquals([bad], [encoding for encoding, _ in failures])
+    self.assertFalse(bad.result)
+
+  def testDeadWorkerRaises(self):
+    encodings = [self.MakeEncoding('--score=9'),
+                 self.MakeEncoding('--score=3')]
+    with self.assertRaises(executor.Error):
+      executor.ExecuteMany(encodings, jobs=2)
+
+  def testWideEncodingsStillRun(self):
+    encodings = [self.MakeEncoding('--score=%d --threads=8' % score)
+                 for score in (1, 2)]
+    self.assertEquals([], executor.ExecuteMany(encodings, jobs=2,
+                                               store=False))
+    self.assertTrue(all(encoding.result for encoding in encodings))
+    self.assertIsNone(self.context.cache.ReadEncodingResult(encodings[0]))
+
+  def testNothingToDo(self):
+    self.assertEquals([], executor.ExecuteMany([], jobs=2))
+
+
+if __name__ == '__main__':
+  unittest.main()
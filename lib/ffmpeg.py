@@ -54,9 +54,19 @@ class FfmpegCodec(file_codec.FileCodec):
       encodedfile, yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = "%s -loglevel warning -codec:v %s -i %s %s" % (
+      encoder.Tool('ffmpeg'),
+      self.codecname,
+      encodedfile, file_codec.FFMPEG_PIPE_OUTPUT)
+    return commandline
+
   def ResultData(self, encodedfile):
     return {'frame': file_codec.FfmpegFrameInfo(encodedfile)}
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('ffmpeg')]
+
   def EncoderVersion(self):
     version_output = subprocess.check_output([encoder.Tool('ffmpeg'),
                                               '-version'])
@@ -14,12 +14,18 @@
 # limitations under the License.
 """A base class for all codecs using encode-to-file."""
 
+import bitstream
 import encoder
 import filecmp
 import json
+import matroska
 import os
-import re
 import subprocess
+import tool_versions
+import yuv_metrics
+
+# Output arguments that make ffmpeg write raw video to standard output.
+FFMPEG_PIPE_OUTPUT = '-f rawvideo pipe:1'
 
 class FileCodec(encoder.Codec):
   """Base class for file-using codecs.
@@ -27,6 +33,8 @@ class FileCodec(encoder.Codec):
   - EncodeCommandLine
   - DecodeCommandLine
   - ResultData
+  Subclasses MAY define:
+  - DecodeToPipeCommandLine
   """
   def __init__(self, name, formatter=None):
     super(FileCodec, self).__init__(name, formatter=formatter)
@@ -50,6 +58,13 @@ class FileCodec(encoder.Codec):
       return (subprocess_cpu, elapsed_clock)
 
   def _DecodeFile(self, videofile, encodedfile, workdir):
+    """Decodes and compares with the original.
+
+    Returns the decode cpu time and a dictionary of metrics: psnr,
+    psnr_y, psnr_u, psnr_v, frame_psnr and yuv_md5."""
+    commandline = self.DecodeToPipeCommandLine(videofile, encodedfile)
+    if commandline:
+      return self._DecodeToPipe(videofile, commandline)
     tempyuvfile = os.path.join(workdir,
                                videofile.basename + 'tempyuvfile.yuv')
     if os.path.isfile(tempyuvfile):
@@ -65,16 +80,38 @@ class FileCodec(encoder.Codec):
         raise Exception('Decode failed with returncode %d' % returncode)
       subprocess_cpu = os.times()[2] - subprocess_cpu_start
       print "Decode took %f seconds" % subprocess_cpu
-      commandline = encoder.Tool("psnr") + " %s %s %d %d 9999" % (
+      commandline = encoder.Tool("psnr") + " %s %s %d %d 9999 --frames" % (
         videofile.filename, tempyuvfile, videofile.width,
         videofile.height)
       print commandline
-      psnr = subprocess.check_output(commandline, shell=True, stdin=nullinput)
+      metrics = yuv_metrics.ParsePsnrToolOutput(
+          subprocess.check_output(commandline, shell=True, stdin=nullinput))
       commandline = ['md5sum', tempyuvfile]
       md5 = subprocess.check_output(commandline, shell=False)
-      yuv_md5 = md5.split(' ')[0]
+      metrics['yuv_md5'] = md5.split(' ')[0]
     os.unlink(tempyuvfile)
-    return psnr, subprocess_cpu, yuv_md5
+    return subprocess_cpu, metrics
+
+  def _DecodeToPipe(self, videofile, commandline):
+    # pylint: disable=no-self-use
+    print commandline
+    comparison = yuv_metrics.YuvComparison(videofile.width, videofile.height)
+    with open(os.path.devnull, 'r') as nullinput:
+      subprocess_cpu_start = os.times()[2]
+      decoder = subprocess.Popen(commandline, shell=True, stdin=nullinput,
+                                 stdout=subprocess.PIPE)
+      try:
+        with open(videofile.filename, 'rb') as original:
+          comparison.Compare(original, decoder.stdout)
+      finally:
+        decoder.stdout.close()
+        returncode = decoder.wait()
+      if returncode:
+        raise Exception('Decode failed with returncode %d' % returncode)
+      subprocess_cpu = os.times()[2] - subprocess_cpu_start
+      print "Decode took %f seconds" % subprocess_cpu
+    return subprocess_cpu, comparison.Metrics(
+        os.path.getsize(videofile.filename))
 
   def Execute(self, parameters, bitrate, videofile, workdir):
     encodedfile = os.path.join(workdir,
@@ -85,17 +122,16 @@ class FileCodec(encoder.Codec):
 
     result['encode_cputime'] = subprocess_cpu
     result['encode_clocktime'] = elapsed_clock
-    result['encoder_version'] = self.EncoderVersion()
+    result['encoder_version'] = self.CachedEncoderVersion()
     bitrate = videofile.MeasuredBitrate(os.path.getsize(encodedfile))
 
-    psnr, decode_cputime, yuv_md5 = self._DecodeFile(
-        videofile, encodedfile, workdir)
+    decode_cputime, metrics = self._DecodeFile(videofile, encodedfile,
+                                               workdir)
 
     result['decode_cputime'] = decode_cputime
-    result['yuv_md5'] = yuv_md5
-    print "Bitrate", bitrate, "PSNR", psnr
+    print "Bitrate", bitrate, "PSNR", metrics['psnr']
     result['bitrate'] = int(bitrate)
-    result['psnr'] = float(psnr)
+    result.update(metrics)
     result['cliptime'] = videofile.ClipTime()
     result.update(self.ResultData(encodedfile))
 
@@ -115,6 +151,14 @@ class FileCodec(encoder.Codec):
     # pylint: disable=W0613,R0201
     raise encoder.Error('DecodeCommandLine not defined')
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    """This function returns the command line that should be executed
+    in order to write an encoded file, decoded to raw I420, to standard
+    output. Nothing else may be written to standard output.
+    If None is returned, the decoder writes to a temporary file instead."""
+    # pylint: disable=W0613,R0201
+    return None
+
   def ResultData(self, encodedfile):
     """Returns additional fields that the codec may know how to generate."""
     # pylint: disable=W0613,R0201
@@ -140,24 +184,38 @@ class FileCodec(encoder.Codec):
   def EncoderVersion(self):
     raise encoder.Error('File codecs must define their own version')
 
+  def EncoderVersionTools(self):
+    """Returns the tool binaries that EncoderVersion reports on.
+
+    When these are given, the version is only found again when one of
+    them changes. With none, EncoderVersion is called for every encoding."""
+    # pylint: disable=R0201
+    return []
+
+  def CachedEncoderVersion(self):
+    tools = self.EncoderVersionTools()
+    if not tools:
+      return self.EncoderVersion()
+    return tool_versions.CachedVersion(self.name, tools, self.EncoderVersion)
+
 
 # Tools that may be called upon by the codec implementation if needed.
 def MatroskaFrameInfo(encodedfile):
-  # Run the mkvinfo tool across the file to get frame size info.
-  commandline = 'mkvinfo -v %s' % encodedfile
-  print commandline
-  mkvinfo = subprocess.check_output(commandline, shell=True)
-  frameinfo = []
-  for line in mkvinfo.splitlines():
-    match = re.search(r'Frame with size (\d+)', line)
-    if match:
-      # The mkvinfo tool gives frame size in bytes. We want bits.
-      frameinfo.append({'size': int(match.group(1))*8})
-
-  return frameinfo
+  # Frame sizes and key frames, read straight from the file.
+  return matroska.FrameInfo(encodedfile)
 
 
 def FfmpegFrameInfo(encodedfile):
+  # Formats that can be read directly don't need the ffprobe tool,
+  # which decodes every frame.
+  if bitstream.CanScan(encodedfile):
+    frameinfo = bitstream.FrameInfo(encodedfile)
+    if frameinfo is not None:
+      return frameinfo
+  return FfprobeFrameInfo(encodedfile)
+
+
+def FfprobeFrameInfo(encodedfile):
   # Uses the ffprobe tool to give frame info.
   commandline = '%s -loglevel warning -show_frames -of json %s' % (
       encoder.Tool('ffprobe'), encodedfile)
@@ -15,6 +15,7 @@
 """Unit tests for the FileCodec framework"""
 
 import encoder
+import encoder_configuration
 import optimizer
 import os
 import test_tools
@@ -39,10 +40,35 @@ class CopyingCodec(file_codec.FileCodec):
   def DecodeCommandLine(self, videofile, inputfile, outputfile):
     return 'cp %s %s' % (inputfile, outputfile)
 
+  def DecodeToPipeCommandLine(self, videofile, inputfile):
+    return 'cat %s' % inputfile
+
   def EncoderVersion(self):
     return 'CopyingCodec v1'
 
 
+class CopyingCodecWithoutPipe(CopyingCodec):
+  """A copying "codec" that decodes through a temporary file."""
+  def DecodeToPipeCommandLine(self, videofile, inputfile):
+    return None
+
+
+class VersionCountingCodec(CopyingCodec):
+  """A copying "codec" whose version is a file's contents."""
+  def __init__(self, version_file):
+    super(VersionCountingCodec, self).__init__('version-counting')
+    self.version_file = version_file
+    self.version_calls = 0
+
+  def EncoderVersion(self):
+    self.version_calls += 1
+    with open(self.version_file) as version_file:
+      return version_file.read()
+
+  def EncoderVersionTools(self):
+    return [self.version_file]
+
+
 class CorruptingCodec(file_codec.FileCodec):
   """A "codec" that gives a different result every time."""
   def __init__(self, name='corrupt'):
@@ -80,6 +106,53 @@ class TestFileCodec(test_tools.FileUsingCodecTest):
     self.assertIn('encode_cputime', encoding.Result())
     self.assertIn('encode_clocktime', encoding.Result())
     self.assertIn('yuv_md5', encoding.Result())
+    self.assertEqual([100.0], encoding.Result()['frame_psnr'])
+
+  def test_DecodeThroughTempFile(self):
+    codec = CorruptingCodec()
+    my_optimizer = optimizer.Optimizer(codec)
+    videofile = test_tools.MakeYuvFileWithOneBlankFrame(
+        'one_black_frame_1024_768_30.yuv')
+    encoding = my_optimizer.BestEncoding(1000, videofile)
+    encoding.Execute()
+    self.assertIn('psnr', encoding.Result())
+    self.assertIn('psnr_y', encoding.Result())
+    self.assertIn('yuv_md5', encoding.Result())
+    self.assertEqual(1, len(encoding.Result()['frame_psnr']))
+
+  def test_PipeAndTempFileGiveSameResult(self):
+    codec = CopyingCodec()
+    videofile = test_tools.MakeYuvFileWithOneBlankFrame(
+        'one_black_frame_1024_768_30.yuv')
+    workdir = encoder_configuration.conf.workdir()
+    encodedfile = os.path.join(workdir, 'copy.yuv')
+    with open(videofile.filename) as source:
+      with open(encodedfile, 'w') as target:
+        target.write(source.read())
+    # pylint: disable=protected-access
+    piped = codec._DecodeFile(videofile, encodedfile, workdir)
+    codec = CopyingCodecWithoutPipe()
+    from_file = codec._DecodeFile(videofile, encodedfile, workdir)
+    self.assertEqual(from_file[1], piped[1])
+
+  def test_EncoderVersionIsCached(self):
+    version_file = os.path.join(encoder_configuration.conf.workdir(),
+                                'version')
+    with open(version_file, 'w') as the_file:
+      the_file.write('v1')
+    codec = VersionCountingCodec(version_file)
+    my_optimizer = optimizer.Optimizer(codec)
+    videofile = test_tools.MakeYuvFileWithOneBlankFrame(
+        'one_black_frame_1024_768_30.yuv')
+    encoding = my_optimizer.BestEncoding(1000, videofile)
+    encoding.Execute()
+    encoding.Execute()
+    self.assertEqual('v1', encoding.Result()['encoder_version'])
+    self.assertEqual(1, codec.version_calls)
+    with open(version_file, 'w') as the_file:
+      the_file.write('v2 is longer')
+    encoding.Execute()
+    self.assertEqual('v2 is longer', encoding.Result()['encoder_version'])
 
   def test_VerifyOneBlackFrame(self):
     codec = CopyingCodec()
@@ -0,0 +1,308 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-frame data, stored beside a result file rather than inside it.
+
+The "frame" entry of a result is a list with one small dictionary per
+frame, and "frame_psnr" is a list with the PSNR of each frame. They are
+by far the largest part of the result. The EncodingDiskCache keeps them
+in a <clip>.frames file next to <clip>.result, as columns of numbers
+(all little-endian):
+
+  4 bytes   magic "FRM2"
+  uint32    number of columns
+  for each column:
+    8 bytes   column name, padded with zero bytes
+    1 byte    array type code of the values
+    uint32    number of values, N
+    N values
+
+The "size" column has the frame sizes in bits (uint32), the "type"
+column the frame types, as a character, or 0 if the frame has no type,
+and the optional "keyframe" column (uint8) is 1 for key frames, 0 for
+other frames and 2 if it is not known. Together they make up the
+"frame" entry; each frame is {'size': bits, 'keyframe': flag, 'type':
+type}, as the bitstream module gives them. The "psnr" column (float64) is
+the "frame_psnr" entry.
+
+Results read from disk are LazyFrameResult objects, which read the
+frame file the first time one of its entries is looked up.
+"""
+
+import array
+import collections
+import os
+import struct
+import sys
+
+FRAME_SUFFIX = '.frames'
+
+# The entries of a result that are kept in frame files.
+FRAME_KEYS = ('frame', 'frame_psnr')
+
+_MAGIC = 'FRM2'
+_HEADER = struct.Struct('<4sI')
+_COLUMN_HEADER = struct.Struct('<8scI')
+_ITEM_SIZES = {'B': 1, 'I': 4, 'c': 1, 'd': 8}
+_MAX_SIZE = 2 ** 32 - 1
+_KEYFRAME_UNKNOWN = 2
+_FRAME_FIELDS = frozenset(['size', 'type', 'keyframe'])
+
+
+def _Column(typecode, values=()):
+  column = array.array(typecode, values)
+  # The array type codes are picked for their sizes; check that they fit.
+  assert column.itemsize == _ITEM_SIZES[typecode]
+  return column
+
+
+def _FramesPackable(frames):
+  if not isinstance(frames, list):
+    return False
+  for frame in frames:
+    if not isinstance(frame, dict) or 'size' not in frame:
+      return False
+    if (not _FRAME_FIELDS.issuperset(frame) or
+        not isinstance(frame.get('keyframe', False), bool)):
+      return False
+    size = frame['size']
+    if not isinstance(size, (int, long)) or not 0 <= size <= _MAX_SIZE:
+      return False
+    frame_type = frame.get('type')
+    if frame_type is not None and (not isinstance(frame_type, basestring)
+                                   or len(frame_type) != 1
+                                   or frame_type == '\0'):
+      return False
+  return True
+
+
+def FrameEntries(result):
+  """Returns the entries of a result that belong in a frame file, as a
+  dictionary."""
+  return dict((key, result[key]) for key in FRAME_KEYS if key in result)
+
+
+def Packable(entries):
+  """Returns true if a dictionary of frame entries can be stored in a
+  frame file without losing anything."""
+  if 'frame' in entries and not _FramesPackable(entries['frame']):
+    return False
+  if 'frame_psnr' in entries:
+    frame_psnr = entries['frame_psnr']
+    if (not isinstance(frame_psnr, list) or
+        not all(isinstance(psnr, float) for psnr in frame_psnr)):
+      return False
+  return True
+
+
+def PackFrames(entries):
+  """Returns a dictionary of frame entries, which must be Packable, in
+  frame file format."""
+  columns = []
+  if 'frame' in entries:
+    frames = entries['frame']
+    columns.append(('size', _Column('I', [frame['size']
+                                          for frame in frames])))
+    columns.append(('type', _Column('c', [str(frame.get('type', '\0'))
+                                          for frame in frames])))
+    if any('keyframe' in frame for frame in frames):
+      columns.append(('keyframe', _Column(
+          'B', [int(frame.get('keyframe', _KEYFRAME_UNKNOWN))
+                for frame in frames])))
+  if 'frame_psnr' in entries:
+    columns.append(('psnr', _Column('d', entries['frame_psnr'])))
+  parts = [_HEADER.pack(_MAGIC, len(columns))]
+  for name, column in columns:
+    parts.append(_COLUMN_HEADER.pack(name, column.typecode, len(column)))
+    if sys.byteorder == 'big':
+      column.byteswap()
+    parts.append(column.tostring())
+  return ''.join(parts)
+
+
+def _Frames(sizes, types, keyframes=None):
+  if keyframes is None:
+    keyframes = [_KEYFRAME_UNKNOWN] * len(sizes)
+  frames = []
+  for size, frame_type, keyframe in zip(sizes, types, keyframes):
+    frame = {'size': size}
+    if frame_type != '\0':
+      frame['type'] = frame_type
+    if keyframe != _KEYFRAME_UNKNOWN:
+      frame['keyframe'] = bool(keyframe)
+    frames.append(frame)
+  return frames
+
+
+def _UnpackColumns(data, count, name):
+  """Returns the columns in frame file data as a dictionary of name ->
+  array."""
+  columns = {}
+  offset = _HEADER.size
+  for _ in xrange(count):
+    if len(data) < offset + _COLUMN_HEADER.size:
+      raise ValueError('%s is truncated' % name)
+    column_name, typecode, length = _COLUMN_HEADER.unpack_from(data, offset)
+    offset += _COLUMN_HEADER.size
+    if typecode not in _ITEM_SIZES:
+      raise ValueError('%s is not valid' % name)
+    end = offset + length * _ITEM_SIZES[typecode]
+    if len(data) < end:
+      raise ValueError('%s is truncated' % name)
+    column = _Column(typecode)
+    column.fromstring(data[offset:end])
+    if sys.byteorder == 'big':
+      column.byteswap()
+    columns[column_name.rstrip('\0')] = column
+    offset = end
+  if offset != len(data):
+    raise ValueError('%s is not valid' % name)
+  return columns
+
+
+def UnpackFrames(data, name='frame data'):
+  """Returns the dictionary of frame entries in a string in frame file
+  format.
+
+  Raises ValueError if the string is not valid. The name is used in
+  error messages."""
+  if len(data) < _HEADER.size:
+    raise ValueError('%s is truncated' % name)
+  magic, count = _HEADER.unpack_from(data)
+  if magic != _MAGIC:
+    raise ValueError('%s is not valid' % name)
+  columns = _UnpackColumns(data, count, name)
+  entries = {}
+  if 'size' in columns:
+    sizes = columns['size']
+    types = columns.get('type', ['\0'] * len(sizes))
+    keyframes = columns.get('keyframe')
+    if len(types) != len(sizes) or (keyframes is not None and
+                                    len(keyframes) != len(sizes)):
+      raise ValueError('%s is not valid' % name)
+    entries['frame'] = _Frames(sizes, types, keyframes)
+  if 'psnr' in columns:
+    entries['frame_psnr'] = columns['psnr'].tolist()
+  return entries
+
+
+def WriteFrameFile(filename, entries):
+  """Writes a dictionary of frame entries, which must be Packable, to a
+  frame file."""
+  with open(filename, 'wb') as framefile:
+    framefile.write(PackFrames(entries))
+
+
+def ReadFrameFile(filename):
+  """Returns the dictionary of frame entries in a frame file, or None if
+  it is missing.
+
+  Raises ValueError if the file is not a valid frame file."""
+  try:
+    with open(filename, 'rb') as framefile:
+      data = framefile.read()
+  except IOError:
+    return None
+  return UnpackFrames(data, name='Frame file %s' % filename)
+
+
+def FrameFilename(result_filename):
+  """Returns the name of the frame file belonging to a result file."""
+  return os.path.splitext(result_filename)[0] + FRAME_SUFFIX
+
+
+class LazyFrameResult(collections.MutableMapping):
+  """A result whose frame entries are read from a frame file when needed.
+
+  Looking up a frame entry, and listing, counting or copying the entries,
+  reads the frame file; other lookups do not. If the frame file does not
+  exist, the result has no frame entries, except those it was made with.
+  Storage that keeps frame data elsewhere can give its own reader, which
+  is called with frame_source and returns the frame entries or None.
+
+  This is a mapping rather than a dict, so that dict(result) has the
+  frames in it. The json module only writes dicts; use FullResult."""
+  def __init__(self, result, frame_source, reader=ReadFrameFile):
+    # pylint: disable=super-init-not-called
+    self.result = dict(result)
+    self.frame_source = frame_source
+    self.reader = reader
+
+  def _LoadFrames(self):
+    if self.frame_source is None:
+      return
+    frame_source = self.frame_source
+    self.frame_source = None
+    entries = self.reader(frame_source)
+    for key, value in (entries or {}).iteritems():
+      # Entries in the result itself were written after the frame file.
+      self.result.setdefault(key, value)
+
+  def __getitem__(self, key):
+    if key in FRAME_KEYS:
+      self._LoadFrames()
+    return self.result[key]
+
+  def __setitem__(self, key, value):
+    if key in FRAME_KEYS:
+      # Read the others before the frame file goes out of date.
+      self._LoadFrames()
+    self.result[key] = value
+
+  def __delitem__(self, key):
+    if key in FRAME_KEYS:
+      self._LoadFrames()
+    del self.result[key]
+
+  def __contains__(self, key):
+    if key in FRAME_KEYS:
+      self._LoadFrames()
+    return key in self.result
+
+  def __iter__(self):
+    self._LoadFrames()
+    return iter(self.result)
+
+  def __len__(self):
+    self._LoadFrames()
+    return len(self.result)
+
+  def __nonzero__(self):
+    # Results always have other entries, so this need not read frames.
+    return bool(self.result) or len(self) > 0
+
+  def __repr__(self):
+    return 'LazyFrameResult(%r, %r)' % (self.result, self.frame_source)
+
+  def copy(self):
+    """Returns a plain dictionary with all of the result."""
+    self._LoadFrames()
+    return dict(self.result)
+
+
+def FullResult(result):
+  """Returns a plain dictionary with all of a result, frames included."""
+  if isinstance(result, LazyFrameResult):
+    return result.copy()
+  return result
+
+
+def WithoutFrames(result):
+  """Returns a plain dictionary with all of a result except the frame
+  entries.
+
+  Frame data that has not been read yet is not read."""
+  if isinstance(result, LazyFrameResult):
+    result = result.result
+  return {key: value for key, value in result.iteritems()
+          if key not in FRAME_KEYS}
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for per-frame data files."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import frame_data
+
+
+class TestFrameFiles(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp(prefix='frame-data-unittest')
+    self.filename = os.path.join(self.path, 'clip.frames')
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def testFrameFilename(self):
+    self.assertEquals('/a/100/clip.frames',
+                      frame_data.FrameFilename('/a/100/clip.result'))
+
+  def testWriteAndRead(self):
+    entries = {'frame': [{'size': 8000, 'type': 'I', 'keyframe': True},
+                         {'size': 0, 'keyframe': False},
+                         {'size': 2**32 - 1}],
+               'frame_psnr': [40.5, 100.0, 12.25]}
+    frame_data.WriteFrameFile(self.filename, entries)
+    self.assertEquals(8 + 4 * 13 + 6 * 3 + 8 * 3,
+                      os.path.getsize(self.filename))
+    self.assertEquals(entries, frame_data.ReadFrameFile(self.filename))
+
+  def testOnlyFramePsnr(self):
+    entries = {'frame_psnr': [40.5]}
+    frame_data.WriteFrameFile(self.filename, entries)
+    self.assertEquals(entries, frame_data.ReadFrameFile(self.filename))
+
+  def testEmptyList(self):
+    frame_data.WriteFrameFile(self.filename, {'frame': []})
+    self.assertEquals({'frame': []}, frame_data.ReadFrameFile(self.filename))
+
+  def testMissingFile(self):
+    self.assertIsNone(frame_data.ReadFrameFile(self.filename))
+
+  def testBrokenFileRaises(self):
+    with open(self.filename, 'wb') as framefile:
+      framefile.write('FRM2\x01\x00\x00\x00short')
+    with self.assertRaises(ValueError):
+      frame_data.ReadFrameFile(self.filename)
+    packed = frame_data.PackFrames({'frame_psnr': [40.5, 30.0]})
+    for broken in [packed[:-1], packed + '\0', 'FRM3' + packed[4:]]:
+      with self.assertRaises(ValueError):
+        frame_data.UnpackFrames(broken)
+
+  def testPackable(self):
+    self.assertTrue(frame_data.Packable(
+        {'frame': [{'size': 8}, {'size': 8, 'type': 'P'}],
+         'frame_psnr': [30.0, 40.0]}))
+    self.assertTrue(frame_data.Packable({}))
+    self.assertFalse(frame_data.Packable({'frame': [{'size': 8, 'qp': 10}]}))
+    self.assertFalse(frame_data.Packable({'frame': [{'size': 2**32}]}))
+    self.assertFalse(frame_data.Packable({'frame': [{'size': 8.5}]}))
+    self.assertFalse(frame_data.Packable({'frame': [{'size': 8,
+                                                     'type': 'key'}]}))
+    self.assertFalse(frame_data.Packable({'frame': ['first', 'second']}))
+    self.assertFalse(frame_data.Packable({'frame_psnr': ['high']}))
+    self.assertTrue(frame_data.Packable({'frame': [{'size': 8, 'type': 'I',
+                                                    'keyframe': True}]}))
+    self.assertFalse(frame_data.Packable({'frame': [{'size': 8,
+                                                     'keyframe': 1}]}))
+
+  def testFrameEntries(self):
+    self.assertEquals({'frame': [], 'frame_psnr': [30.0]},
+                      frame_data.FrameEntries({'psnr': 30.0, 'frame': [],
+                                               'frame_psnr': [30.0]}))
+
+
+class TestLazyFrameResult(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp(prefix='frame-data-unittest')
+    self.filename = os.path.join(self.path, 'clip.frames')
+    self.frames = [{'size': 800}, {'size': 80}]
+    self.frame_psnr = [45.0, 35.5]
+    frame_data.WriteFrameFile(self.filename, {'frame': self.frames,
+                                              'frame_psnr': self.frame_psnr})
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def testFramesAreReadWhenAskedFor(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    self.assertEquals({'psnr': 40.0}, frame_data.WithoutFrames(result))
+    self.assertEquals(40.0, result['psnr'])
+    self.assertNotIn('frame', result.result)
+    self.assertEquals(self.frames, result['frame'])
+    self.assertEquals(self.frames, result.get('frame'))
+    self.assertEquals(self.frame_psnr, result['frame_psnr'])
+
+  def testFramePsnrIsReadWhenAskedFor(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    self.assertEquals(self.frame_psnr, result['frame_psnr'])
+    self.assertEquals(self.frames, result['frame'])
+
+  def testEntriesInResultOverrideFrameFile(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0, 'frame_psnr': [1.0]},
+                                        self.filename)
+    self.assertEquals({'psnr': 40.0}, frame_data.WithoutFrames(result))
+    self.assertEquals([1.0], result['frame_psnr'])
+    self.assertEquals(self.frames, result['frame'])
+
+  def testMissingFrameFile(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0},
+                                        self.filename + '.missing')
+    self.assertFalse('frame' in result)
+    self.assertIsNone(result.get('frame'))
+    with self.assertRaises(KeyError):
+      _ = result['frame']
+    with self.assertRaises(KeyError):
+      _ = result['other']
+
+  def testFullResultHasFrames(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    full_result = frame_data.FullResult(result)
+    self.assertEquals(self.frames, full_result['frame'])
+    self.assertEquals({'psnr': 40.0, 'frame': self.frames,
+                       'frame_psnr': self.frame_psnr},
+                      json.loads(json.dumps(full_result)))
+
+  def testGenericAccessSeesFrames(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    self.assertTrue(result)
+    self.assertIsNotNone(result.frame_source)
+    full_result = {'psnr': 40.0, 'frame': self.frames,
+                   'frame_psnr': self.frame_psnr}
+    self.assertEquals(full_result, dict(result))
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    self.assertEquals(['frame', 'frame_psnr', 'psnr'], sorted(result))
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    self.assertIn('frame', result)
+    self.assertEquals(3, len(result.items()))
+    self.assertEquals(full_result, result.copy())
+    self.assertEquals(full_result, result)
+
+  def testReplacedFrames(self):
+    result = frame_data.LazyFrameResult({'psnr': 40.0}, self.filename)
+    result['frame'] = [{'size': 1}]
+    self.assertEquals([{'size': 1}], result['frame'])
+    self.assertEquals(self.frame_psnr, result['frame_psnr'])
+    del result['frame']
+    self.assertNotIn('frame', result)
+
+
+if __name__ == '__main__':
+  unittest.main()
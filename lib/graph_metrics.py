@@ -18,10 +18,12 @@
 
 import encoder
 import fileset_picker
+import lazy_import
 import math
-import numpy
 import optimizer
 
+numpy = lazy_import.LazyModule('numpy')  # pylint: disable=invalid-name
+
 class Error(Exception):
   pass
 
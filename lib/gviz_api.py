@@ -69,6 +69,15 @@ class DataTableJSONEncoder(json.JSONEncoder):
       return super(DataTableJSONEncoder, self).default(o)
 
 
+def _KeyOrder(*keys):
+  """Returns the keys in the order a dict iterates over them, when the dict
+  is built by inserting the keys in the given order."""
+  ordered = {}
+  for key in keys:
+    ordered[key] = None
+  return ordered.keys()
+
+
 class DataTable(object):
   """Wraps the data to convert to a Google Visualization API DataTable.
 
@@ -165,6 +174,11 @@ class DataTable(object):
     """
     self.__columns = self.TableDescriptionParser(table_description)
     self.__data = []
+    # Set by LoadColumns: column ID -> list of coerced values, the number
+    # of rows, and the custom properties of all rows.
+    self.__column_data = None
+    self.__column_rows = 0
+    self.__column_rows_cp = None
     self.custom_properties = {}
     if custom_properties is not None:
       self.custom_properties = custom_properties
@@ -527,6 +541,8 @@ class DataTable(object):
 
   def NumberOfRows(self):
     """Returns the number of rows in the current data stored in the table."""
+    if self.__column_data is not None:
+      return self.__column_rows
     return len(self.__data)
 
   def SetRowsCustomProperties(self, rows, custom_properties):
@@ -540,6 +556,7 @@ class DataTable(object):
       custom_properties: A string to string dictionary of custom properties to
       set for all rows.
     """
+    self._MaterializeColumns()
     if not hasattr(rows, "__iter__"):
       rows = [rows]
     for row in rows:
@@ -558,8 +575,88 @@ class DataTable(object):
                          properties for all rows.
     """
     self.__data = []
+    self.__column_data = None
     self.AppendData(data, custom_properties)
 
+  def LoadColumns(self, columns, custom_properties=None):
+    """Loads new rows to the data table, given column by column.
+
+    This is a faster way to load flat tables than LoadData, in particular
+    for number columns given as lists or NumPy arrays: the values of such
+    a column are checked, and later serialized by ToJSon and ToJSCode,
+    once per column instead of once per cell. The output is the same as
+    if the rows had been given to LoadData.
+
+    Args:
+      columns: A dictionary of column ID -> sequence of values, one per row.
+               All sequences must have the same length. Values are as for
+               CoerceValue; None leaves a cell empty. Columns not given are
+               empty.
+      custom_properties: A dictionary of string to string to set as the
+                         custom properties for all rows.
+
+    Raises:
+      DataTableException: The columns do not match the description, or have
+                          different lengths, or a value does not match its
+                          column's type.
+    """
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+    column_data = {}
+    lengths = set()
+    for col_id, column in columns.iteritems():
+      if col_id not in col_dict:
+        raise DataTableException("Unknown column %s" % col_id)
+      col_type = col_dict[col_id]["type"]
+      # NumPy arrays of numbers need no check of each value.
+      dtype = getattr(column, "dtype", None)
+      values = column.tolist() if hasattr(column, "tolist") else list(column)
+      if col_type == "number" and dtype is not None and dtype.kind in "biuf":
+        pass
+      elif col_type == "number" and all(
+          isinstance(value, (int, long, float, types.NoneType))
+          for value in values):
+        pass
+      else:
+        values = [self.CoerceValue(value, col_type) for value in values]
+      column_data[col_id] = values
+      lengths.add(len(values))
+    if len(lengths) > 1:
+      raise DataTableException("Columns have different lengths: %s" %
+                               sorted(lengths))
+    self.__data = []
+    self.__column_data = column_data
+    self.__column_rows = lengths.pop() if lengths else 0
+    self.__column_rows_cp = custom_properties
+
+  def _MaterializeColumns(self):
+    """Converts data loaded by LoadColumns into rows."""
+    if self.__column_data is None:
+      return
+    self.__data = []
+    for i in xrange(self.__column_rows):
+      row = {}
+      for col_id, values in self.__column_data.iteritems():
+        if values[i] is not None:
+          row[col_id] = values[i]
+      self.__data.append((row, self.__column_rows_cp))
+    self.__column_data = None
+
+  def _EncodedColumn(self, col_id, col_type, encode):
+    """Returns the values of a column loaded by LoadColumns, with each value
+    that is not a tuple or None replaced by encode(value)."""
+    values = self.__column_data.get(col_id)
+    if values is None:
+      return [None] * self.__column_rows
+    if col_type == "number" and not any(
+        isinstance(value, tuple) for value in values):
+      # Numbers encode the same in JSON and JS code, and never contain a
+      # comma, so a whole column is encoded at once.
+      tokens = DataTableJSONEncoder().encode(values)[1:-1].split(",")
+      return [None if value is None else token
+              for value, token in zip(values, tokens)]
+    return [value if value is None or isinstance(value, tuple)
+            else encode(value) for value in values]
+
   def AppendData(self, data, custom_properties=None):
     """Appends new data to the table.
 
@@ -577,6 +674,7 @@ class DataTable(object):
     Raises:
       DataTableException: The data structure does not match the description.
     """
+    self._MaterializeColumns()
     # If the maximal depth is 0, we simply iterate over the data table
     # lines and insert them using _InnerAppendData. Otherwise, we simply
     # let the _InnerAppendData handle all the levels.
@@ -655,6 +753,7 @@ class DataTable(object):
     Raises:
       DataTableException: Sort direction not in 'asc' or 'desc'
     """
+    self._MaterializeColumns()
     if not order_by:
       return self.__data
 
@@ -744,6 +843,10 @@ class DataTable(object):
       if col_dict[col]["custom_properties"]:
         jscode += "%s.setColumnProperties(%d, %s);\n" % (
             name, i, encoder.encode(col_dict[col]["custom_properties"]))
+    if self.__column_data is not None and not order_by:
+      return jscode + self._ColumnsToJSCode(name, columns_order, col_dict,
+                                            encoder)
+    self._MaterializeColumns()
     jscode += "%s.addRows(%d);\n" % (name, len(self.__data))
 
     # We now go over the data and add each row
@@ -770,6 +873,34 @@ class DataTable(object):
             name, i, encoder.encode(cp))
     return jscode
 
+  def _ColumnsToJSCode(self, name, columns_order, col_dict, encoder):
+    """Returns the rows part of ToJSCode, for data loaded by LoadColumns."""
+    jscode = ["%s.addRows(%d);\n" % (name, self.__column_rows)]
+    columns = [
+        self._EncodedColumn(col, col_dict[col]["type"],
+                            lambda value: self.EscapeForJSCode(encoder, value))
+        for col in columns_order]
+    cp = self.__column_rows_cp
+    for i in xrange(self.__column_rows):
+      for (j, column) in enumerate(columns):
+        value = column[i]
+        if value is None:
+          continue
+        if isinstance(value, tuple):
+          cell_cp = ""
+          if len(value) == 3:
+            cell_cp = ", %s" % encoder.encode(value[2])
+          jscode.append("%s.setCell(%d, %d, %s, %s%s);\n" %
+                        (name, i, j,
+                         self.EscapeForJSCode(encoder, value[0]),
+                         self.EscapeForJSCode(encoder, value[1]), cell_cp))
+        else:
+          jscode.append("%s.setCell(%d, %d, %s);\n" % (name, i, j, value))
+      if cp:
+        jscode.append("%s.setRowProperties(%d, %s);\n" % (
+            name, i, encoder.encode(cp)))
+    return "".join(jscode)
+
   def ToHtml(self, columns_order=None, order_by=()):
     """Writes the data table as an HTML table code string.
 
@@ -905,6 +1036,72 @@ class DataTable(object):
     return (self.ToCsv(columns_order, order_by, separator="\t")
             .decode("utf-8").encode("UTF-16LE"))
 
+  def _ColumnJSonObjs(self, columns_order):
+    """Returns the column JSON objects, in the given order."""
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+    col_objs = []
+    for col_id in columns_order:
+      col_obj = {"id": col_dict[col_id]["id"],
+                 "label": col_dict[col_id]["label"],
+                 "type": col_dict[col_id]["type"]}
+      if col_dict[col_id]["custom_properties"]:
+        col_obj["p"] = col_dict[col_id]["custom_properties"]
+      col_objs.append(col_obj)
+    return col_objs
+
+  def _ColumnsToJSon(self, columns_order):
+    """Returns what ToJSon encodes, for data loaded by LoadColumns, without
+    building an object for each row and cell."""
+    encoder = DataTableJSONEncoder()
+    if columns_order is None:
+      columns_order = [col["id"] for col in self.__columns]
+    col_dict = dict([(col["id"], col) for col in self.__columns])
+    columns = [self._EncodedColumn(col, col_dict[col]["type"], encoder.encode)
+               for col in columns_order]
+
+    # The keys of each object are written in the order in which the
+    # objects built by _ToJSonObj would give them.
+    cell_key_orders = {}
+    def EncodeCell(value):
+      if value is None:
+        return "null"
+      if not isinstance(value, tuple):
+        return '{"v":%s}' % value
+      parts = {"v": encoder.encode(value[0])}
+      keys = ("v",)
+      if len(value) > 1 and value[1] is not None:
+        parts["f"] = encoder.encode(value[1])
+        keys += ("f",)
+      if len(value) == 3:
+        parts["p"] = encoder.encode(value[2])
+        keys += ("p",)
+      if keys not in cell_key_orders:
+        cell_key_orders[keys] = _KeyOrder(*keys)
+      return "{%s}" % ",".join(['"%s":%s' % (key, parts[key])
+                                for key in cell_key_orders[keys]])
+
+    cp = self.__column_rows_cp
+    if not cp:
+      row_start, row_end = '{"c":[', "]}"
+    elif _KeyOrder("c", "p")[0] == "c":
+      row_start, row_end = '{"c":[', '],"p":%s}' % encoder.encode(cp)
+    else:
+      row_start, row_end = '{"p":%s,"c":[' % encoder.encode(cp), "]}"
+    row_jsons = []
+    for i in xrange(self.__column_rows):
+      row_jsons.append(row_start +
+                       ",".join([EncodeCell(column[i]) for column in columns]) +
+                       row_end)
+
+    parts = {"cols": encoder.encode(self._ColumnJSonObjs(columns_order)),
+             "rows": "[%s]" % ",".join(row_jsons)}
+    keys = ("cols", "rows")
+    if self.custom_properties:
+      parts["p"] = encoder.encode(self.custom_properties)
+      keys += ("p",)
+    return "{%s}" % ",".join(['"%s":%s' % (key, parts[key])
+                              for key in _KeyOrder(*keys)])
+
   def _ToJSonObj(self, columns_order=None, order_by=()):
     """Returns an object suitable to be converted to JSON.
 
@@ -922,15 +1119,7 @@ class DataTable(object):
       columns_order = [col["id"] for col in self.__columns]
     col_dict = dict([(col["id"], col) for col in self.__columns])
 
-    # Creating the column JSON objects
-    col_objs = []
-    for col_id in columns_order:
-      col_obj = {"id": col_dict[col_id]["id"],
-                 "label": col_dict[col_id]["label"],
-                 "type": col_dict[col_id]["type"]}
-      if col_dict[col_id]["custom_properties"]:
-        col_obj["p"] = col_dict[col_id]["custom_properties"]
-      col_objs.append(col_obj)
+    col_objs = self._ColumnJSonObjs(columns_order)
 
     # Creating the rows jsons
     row_objs = []
@@ -998,6 +1187,8 @@ class DataTable(object):
       DataTableException: The data does not match the type.
     """
 
+    if self.__column_data is not None and not order_by:
+      return self._ColumnsToJSon(columns_order).encode("utf-8")
     encoder = DataTableJSONEncoder()
     return encoder.encode(
         self._ToJSonObj(columns_order, order_by)).encode("utf-8")
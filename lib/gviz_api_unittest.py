@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the columnar loading of gviz_api.DataTable."""
+
+import numpy
+import unittest
+
+import gviz_api
+
+DESCRIPTION = {'file': ('string', 'File'),
+               'vp8': ('number', 'vp8'),
+               'vp9': ('number', 'vp9'),
+               'x264': ('string', 'x264')}
+COLUMNS_ORDER = ['file', 'vp8', 'vp9', 'x264']
+
+
+def RowsFromColumns(columns):
+  length = len(columns.values()[0])
+  return [dict((col_id, values[i]) for col_id, values in columns.iteritems()
+               if values[i] is not None)
+          for i in range(length)]
+
+
+class TestLoadColumns(unittest.TestCase):
+  def assertSameOutput(self, columns, custom_properties=None,
+                       table_properties=None):
+    by_rows = gviz_api.DataTable(DESCRIPTION,
+                                 custom_properties=table_properties)
+    by_rows.LoadData(RowsFromColumns(columns), custom_properties)
+    by_columns = gviz_api.DataTable(DESCRIPTION,
+                                    custom_properties=table_properties)
+    by_columns.LoadColumns(columns, custom_properties)
+    self.assertEquals(by_rows.NumberOfRows(), by_columns.NumberOfRows())
+    for order in (None, COLUMNS_ORDER, list(reversed(COLUMNS_ORDER))):
+      self.assertEquals(by_rows.ToJSon(columns_order=order),
+                        by_columns.ToJSon(columns_order=order))
+      self.assertEquals(by_rows.ToJSCode('table', columns_order=order),
+                        by_columns.ToJSCode('table', columns_order=order))
+
+  def test_NumberColumns(self):
+    self.assertSameOutput({'file': ['a', 'b', u'c\xe9'],
+                           'vp8': [1.5, None, 3],
+                           'vp9': [0.1, 2.0 / 3, -7.25]})
+
+  def test_NumpyColumns(self):
+    self.assertSameOutput({'file': ['a', 'b'],
+                           'vp8': numpy.array([1.5, 1e-9]),
+                           'vp9': numpy.arange(2)})
+
+  def test_FormattedValuesAndProperties(self):
+    self.assertSameOutput({'file': ['a', 'b'],
+                           'vp8': [(1.5, '1.50'), (2.5, None, {'x': 'y'})],
+                           'x264': [(3.25, '<a>3.25</a>'), None]},
+                          custom_properties={'row': 'prop'},
+                          table_properties={'table': 'prop'})
+
+  def test_OrderedOutputUsesRows(self):
+    by_rows = gviz_api.DataTable(DESCRIPTION)
+    columns = {'file': ['b', 'a'], 'vp8': [2, 1]}
+    by_rows.LoadData(RowsFromColumns(columns))
+    by_columns = gviz_api.DataTable(DESCRIPTION)
+    by_columns.LoadColumns(columns)
+    self.assertEquals(by_rows.ToJSon(order_by='file'),
+                      by_columns.ToJSon(order_by='file'))
+    self.assertEquals(by_rows.ToCsv(), by_columns.ToCsv())
+
+  def test_AppendAfterLoadColumns(self):
+    table = gviz_api.DataTable(DESCRIPTION)
+    table.LoadColumns({'file': ['a'], 'vp8': [1]})
+    table.AppendData([{'file': 'b', 'vp8': 2}])
+    self.assertEquals(2, table.NumberOfRows())
+
+  def test_BadColumns(self):
+    table = gviz_api.DataTable(DESCRIPTION)
+    with self.assertRaises(gviz_api.DataTableException):
+      table.LoadColumns({'nonexistent': [1]})
+    with self.assertRaises(gviz_api.DataTableException):
+      table.LoadColumns({'file': ['a', 'b'], 'vp8': [1]})
+    with self.assertRaises(gviz_api.DataTableException):
+      table.LoadColumns({'vp8': ['not a number']})
+
+
+if __name__ == '__main__':
+  unittest.main()
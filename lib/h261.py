@@ -17,6 +17,7 @@ This uses ffmpeg for encoding and decoding.
 """
 import encoder
 import ffmpeg
+import file_codec
 
 class H261Codec(ffmpeg.FfmpegCodec):
   def __init__(self, name='h261'):
@@ -45,3 +46,10 @@ class H261Codec(ffmpeg.FfmpegCodec):
       yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = "%s -i %s -s %sx%s %s" % (
+      encoder.Tool('ffmpeg'),
+      encodedfile, videofile.width, videofile.height,
+      file_codec.FFMPEG_PIPE_OUTPUT)
+    return commandline
+
@@ -62,6 +62,9 @@ class HevcCodec(file_codec.FileCodec):
         encodedfile, yuvfile)
     return commandline
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('TAppEncoderStatic')]
+
   def EncoderVersion(self):
     try:
       subprocess.check_output([encoder.Tool('TAppEncoderStatic')])
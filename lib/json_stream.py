@@ -0,0 +1,134 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Writing of large JSON documents, a piece at a time.
+
+A JsonWriter writes objects member by member, as they are produced,
+instead of building the whole document as one string. Members of a
+StreamedObject are taken from an iterable, so that the caller can
+compute each section just before it is written, and drop it after.
+
+In compact mode, no whitespace is written and floats are rounded.
+OutputFile replaces a file in one step when writing is done, and can
+write a gzipped copy next to it.
+"""
+
+import contextlib
+import gzip
+import json
+import os
+
+# Decimals kept for floats in compact output.
+COMPACT_FLOAT_DIGITS = 4
+
+
+class StreamedObject(object):
+  """A JSON object whose members come from an iterable of (key, value)
+  pairs, which is consumed while the object is written."""
+  def __init__(self, members):
+    self.members = members
+
+
+def _Rounded(value, digits):
+  if isinstance(value, float):
+    return round(value, digits)
+  if isinstance(value, dict):
+    return dict((key, _Rounded(item, digits))
+                for key, item in value.iteritems())
+  if isinstance(value, (list, tuple)):
+    return [_Rounded(item, digits) for item in value]
+  return value
+
+
+class JsonWriter(object):
+  """Writes JSON values to a file, streaming objects member by member."""
+  def __init__(self, output_file, compact=False):
+    self.output_file = output_file
+    self.compact = compact
+
+  def _Dumps(self, value, level):
+    if self.compact:
+      return json.dumps(_Rounded(value, COMPACT_FLOAT_DIGITS),
+                        separators=(',', ':'))
+    return json.dumps(value, indent=2, separators=(',', ': ')).replace(
+        '\n', '\n' + '  ' * level)
+
+  def _WriteObject(self, members, level):
+    write = self.output_file.write
+    write('{')
+    empty = True
+    for key, value in members:
+      if not empty:
+        write(',')
+      empty = False
+      if not self.compact:
+        write('\n' + '  ' * (level + 1))
+      if not isinstance(key, basestring):
+        key = str(key)
+      write(json.dumps(key) + (':' if self.compact else ': '))
+      self._WriteValue(value, level + 1)
+    if not empty and not self.compact:
+      write('\n' + '  ' * level)
+    write('}')
+
+  def _WriteValue(self, value, level):
+    if isinstance(value, StreamedObject):
+      self._WriteObject(value.members, level)
+    elif isinstance(value, dict):
+      self._WriteObject(value.iteritems(), level)
+    else:
+      self.output_file.write(self._Dumps(value, level))
+
+  def Write(self, value):
+    """Writes a JSON value, followed by a newline."""
+    self._WriteValue(value, 0)
+    self.output_file.write('\n')
+
+
+class _Tee(object):
+  """A file-like object that writes to several files."""
+  def __init__(self, files):
+    self.files = files
+
+  def write(self, data):
+    # pylint: disable=invalid-name
+    for the_file in self.files:
+      the_file.write(data)
+
+
+@contextlib.contextmanager
+def OutputFile(filename, gzip_copy=False):
+  """Yields a file to write filename with. The file replaces filename when
+  the block finishes, and is removed if it raises.
+
+  With gzip_copy, the same data is written gzipped to filename.gz."""
+  final_filenames = [filename]
+  temp_filenames = ['%s.%d' % (filename, os.getpid())]
+  files = [open(temp_filenames[0], 'w')]
+  if gzip_copy:
+    final_filenames.append(filename + '.gz')
+    temp_filenames.append('%s.gz.%d' % (filename, os.getpid()))
+    files.append(gzip.open(temp_filenames[1], 'wb'))
+  finished = False
+  try:
+    yield _Tee(files)
+    finished = True
+  finally:
+    for the_file in files:
+      the_file.close()
+    for temp_filename, final_filename in zip(temp_filenames,
+                                             final_filenames):
+      if finished:
+        os.rename(temp_filename, final_filename)
+      else:
+        os.remove(temp_filename)
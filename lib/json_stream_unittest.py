@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the streaming JSON writer."""
+
+import gzip
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import json_stream
+
+DOCUMENT = {
+    'codecs': [['vp8', 'VP8'], ['vp9', 'VP9']],
+    'detailed': {'vp8': {'clip': [{'bitrate': 100, 'psnr': 30.123456}]},
+                 'vp9': {}},
+    'baseline': None,
+}
+
+
+def WriteToString(value, compact=False):
+  output = StringIO.StringIO()
+  json_stream.JsonWriter(output, compact=compact).Write(value)
+  return output.getvalue()
+
+
+class TestJsonWriter(unittest.TestCase):
+  def test_IndentedOutputIsTheSameDocument(self):
+    text = WriteToString(DOCUMENT)
+    self.assertEquals(DOCUMENT, json.loads(text))
+    self.assertIn('\n  "detailed": {\n    "vp', text)
+    self.assertTrue(text.endswith('}\n'))
+
+  def test_CompactOutputHasNoWhitespaceAndRoundedFloats(self):
+    text = WriteToString(DOCUMENT, compact=True)
+    self.assertNotIn(' ', text)
+    self.assertEquals(1, text.count('\n'))
+    self.assertEquals(30.1235,
+                      json.loads(text)['detailed']['vp8']['clip'][0]['psnr'])
+
+  def test_EmptyObjects(self):
+    self.assertEquals('{}\n', WriteToString({}))
+    self.assertEquals('{}\n', WriteToString(json_stream.StreamedObject([])))
+
+  def test_StreamedMembersAreComputedWhileWriting(self):
+    output = StringIO.StringIO()
+    lengths_seen = []
+    def Members():
+      for name in ('a', 'b', 'c'):
+        lengths_seen.append(len(output.getvalue()))
+        yield name, {'value': name}
+    json_stream.JsonWriter(output).Write(
+        {'top': json_stream.StreamedObject(Members())})
+    self.assertEquals({'top': {'a': {'value': 'a'}, 'b': {'value': 'b'},
+                               'c': {'value': 'c'}}},
+                      json.loads(output.getvalue()))
+    # Each member was produced after the previous one had been written.
+    self.assertTrue(lengths_seen[0] < lengths_seen[1] < lengths_seen[2])
+
+
+class TestOutputFile(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.filename = os.path.join(self.directory, 'out.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_WritesFileAndGzipCopy(self):
+    with json_stream.OutputFile(self.filename, gzip_copy=True) as output:
+      json_stream.JsonWriter(output).Write(DOCUMENT)
+    with open(self.filename) as written_file:
+      text = written_file.read()
+    self.assertEquals(DOCUMENT, json.loads(text))
+    gzipped_file = gzip.open(self.filename + '.gz')
+    try:
+      self.assertEquals(text, gzipped_file.read())
+    finally:
+      gzipped_file.close()
+    self.assertEquals(['out.json', 'out.json.gz'],
+                      sorted(os.listdir(self.directory)))
+
+  def test_FailureLeavesOldFile(self):
+    with open(self.filename, 'w') as old_file:
+      old_file.write('old')
+    with self.assertRaises(ValueError):
+      with json_stream.OutputFile(self.filename) as output:
+        output.write('partial')
+        raise ValueError('failed')
+    with open(self.filename) as old_file:
+      self.assertEquals('old', old_file.read())
+    self.assertEquals(['out.json'], os.listdir(self.directory))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,40 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Modules that are imported when first used.
+
+Importing numpy takes longer than starting most of the tools, so
+modules that need it only for some of their functions write
+
+  numpy = lazy_import.LazyModule('numpy')
+
+instead of "import numpy", and the import happens on the first use of
+an attribute of the module.
+"""
+
+import importlib
+
+
+class LazyModule(object):
+  """Stands in for a module until one of its attributes is used."""
+  def __init__(self, name):
+    self._name = name
+    self._module = None
+
+  def __getattr__(self, attribute):
+    if self._module is None:
+      self._module = importlib.import_module(self._name)
+    value = getattr(self._module, attribute)
+    # Later uses of the attribute don't come here.
+    setattr(self, attribute, value)
+    return value
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for lazily imported modules."""
+
+import sys
+import unittest
+
+import lazy_import
+
+
+class TestLazyModule(unittest.TestCase):
+  def test_ImportsOnFirstUse(self):
+    # A module that no other test imports.
+    sys.modules.pop('colorsys', None)
+    colorsys = lazy_import.LazyModule('colorsys')
+    self.assertNotIn('colorsys', sys.modules)
+    self.assertEquals((0.0, 0.0, 0.0), colorsys.rgb_to_hsv(0.0, 0.0, 0.0))
+    self.assertIn('colorsys', sys.modules)
+    self.assertIs(sys.modules['colorsys'].rgb_to_hsv, colorsys.rgb_to_hsv)
+
+  def test_MissingAttribute(self):
+    module = lazy_import.LazyModule('os')
+    with self.assertRaises(AttributeError):
+      _ = module.no_such_attribute
+
+  def test_MissingModule(self):
+    module = lazy_import.LazyModule('no_such_module')
+    with self.assertRaises(ImportError):
+      _ = module.anything
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,199 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Persistent lists of the best encodings for each target.
+
+Finding the best encoding for a bitrate and clip means scoring every
+encoding stored for it. A leaderboard keeps the hashnames and scores of
+the LEADERBOARD_SIZE best ones instead, in a small file per codec,
+speed group, clip and score function:
+
+  <root>/leaderboard/<codec>/<speed group>/<clip>.<score function name>
+
+Each file holds a fingerprint of the set of encoders that have a result
+for the clip and speed group, and maps a bitrate to a list of
+[score, hashname] pairs, best first. A board whose fingerprint does not
+match the results in the cache is stale, and is not used; this catches
+results added or removed by other processes, by importing scores or by
+updating the score path. The caches keep the fingerprints up to date, so
+checking one costs no listing (the disk cache sees other processes'
+results within score_index.CHECK_INTERVAL_SECONDS). Stale and missing
+boards are filled in when an Optimizer that is allowed to update
+leaderboards asks for them (it scans the cache to do so); from then on,
+Encoding.Store() keeps them up to date. Only score functions that
+score_tools.PickScorer knows by name have leaderboards. bin/rebuild_leaderboards rebuilds them all.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+
+import score_tools
+
+LEADERBOARD_DIRECTORY = 'leaderboard'
+LEADERBOARD_SIZE = 20
+
+
+def EncodingScore(score_function, bitrate, result, encoder):
+  """Returns the score of a result for a target bitrate, with a weak
+  penalty for long command lines."""
+  score = score_function(bitrate, result)
+  score -= len(encoder.parameters.values) * 0.00001
+  return score
+
+
+class LeaderboardStore(object):
+  """The leaderboards for one codec in one score directory."""
+  def __init__(self, context, root):
+    self.context = context
+    self.directory = os.path.join(root, LEADERBOARD_DIRECTORY,
+                                  context.codec.name)
+
+  def _Filename(self, speed_group, clip, scorer_name):
+    return os.path.join(self.directory, speed_group,
+                        '%s.%s' % (clip, scorer_name))
+
+  @contextlib.contextmanager
+  def _Lock(self):
+    if not os.path.isdir(self.directory):
+      os.makedirs(self.directory)
+    with open(os.path.join(self.directory, 'lock'), 'a') as lockfile:
+      fcntl.flock(lockfile, fcntl.LOCK_EX)
+      yield
+
+  def _Read(self, filename):
+    # pylint: disable=no-self-use
+    try:
+      with open(filename, 'r') as boardfile:
+        return json.load(boardfile)
+    except (IOError, ValueError):
+      return {}
+
+  def _Write(self, filename, board):
+    # pylint: disable=no-self-use
+    if not os.path.isdir(os.path.dirname(filename)):
+      os.makedirs(os.path.dirname(filename))
+    # Readers don't lock, so replace the file in one step.
+    with open(filename + '.new', 'w') as boardfile:
+      json.dump(board, boardfile)
+    os.rename(filename + '.new', filename)
+
+  def CurrentFingerprint(self, bitrate, videofile):
+    """Returns the fingerprint of the results in the cache for the
+    clip and speed group of a target."""
+    return self.context.cache.ScoredFingerprint(bitrate, videofile)
+
+  def Entries(self, bitrate, videofile, scorer_name):
+    """Returns the [score, hashname] pairs for a target, best first,
+    or None if there is no leaderboard for it, or it is stale."""
+    board = self._Read(self._Filename(self.context.codec.SpeedGroup(bitrate),
+                                      videofile.basename, scorer_name))
+    entries = board.get('bitrates', {}).get(str(bitrate))
+    if (entries is None or board.get('fingerprint') !=
+        self.CurrentFingerprint(bitrate, videofile)):
+      return None
+    return entries
+
+  def Replace(self, bitrate, videofile, scorer_name, entries, fingerprint):
+    """Sets the leaderboard for a target from (score, hashname) pairs.
+
+    The fingerprint is that of the results the entries were picked from.
+    Entries beyond the leaderboard size are dropped."""
+    # pylint: disable=too-many-arguments
+    entries = sorted(entries, key=lambda entry: entry[0], reverse=True)
+    filename = self._Filename(self.context.codec.SpeedGroup(bitrate),
+                              videofile.basename, scorer_name)
+    with self._Lock():
+      board = self._Read(filename)
+      if board.get('fingerprint') != fingerprint:
+        # The other bitrates were picked from other results.
+        board = {'fingerprint': fingerprint, 'bitrates': {}}
+      board['bitrates'][str(bitrate)] = [list(entry) for entry
+                                         in entries[:LEADERBOARD_SIZE]]
+      self._Write(filename, board)
+
+  def Invalidate(self, bitrate, videofile, scorer_name):
+    """Forgets the leaderboard for a target, so that it gets rebuilt."""
+    filename = self._Filename(self.context.codec.SpeedGroup(bitrate),
+                              videofile.basename, scorer_name)
+    with self._Lock():
+      board = self._Read(filename)
+      if board.get('bitrates', {}).pop(str(bitrate), None) is not None:
+        self._Write(filename, board)
+
+  def RemoveAll(self):
+    if os.path.isdir(self.directory):
+      shutil.rmtree(self.directory)
+
+  def NoteStoredEncoding(self, encoding, old_fingerprint):
+    """Updates the leaderboards that an encoding's result may be on.
+
+    Must be called after the result is stored, with the CurrentFingerprint
+    from before. Boards that were stale before are emptied."""
+    speed_group = self.context.codec.SpeedGroup(encoding.bitrate)
+    hashname = encoding.encoder.Hashname()
+    fingerprint = None
+    for scorer_name in score_tools.ScorerNames():
+      filename = self._Filename(speed_group, encoding.videofile.basename,
+                                scorer_name)
+      if not os.path.isfile(filename):
+        continue
+      with self._Lock():
+        board = self._Read(filename)
+        if not board.get('bitrates'):
+          continue
+        if fingerprint is None:
+          fingerprint = self.CurrentFingerprint(encoding.bitrate,
+                                                encoding.videofile)
+        if board.get('fingerprint') != old_fingerprint:
+          self._Write(filename, {})
+          continue
+        board['fingerprint'] = fingerprint
+        bitrates = board['bitrates']
+        for bitrate in bitrates.keys():
+          try:
+            score = EncodingScore(score_tools.PickScorer(scorer_name),
+                                  int(bitrate), encoding.result,
+                                  encoding.encoder)
+          except (KeyError, TypeError):
+            # The score function can't handle this result. Let the next
+            # search deal with it.
+            del bitrates[bitrate]
+            continue
+          if not _UpdateEntries(bitrates[bitrate], score, hashname):
+            del bitrates[bitrate]
+        self._Write(filename, board)
+
+
+def _UpdateEntries(entries, score, hashname):
+  """Puts a new score for an encoder into a list of [score, hashname]
+  pairs, best first. Returns false if the list can't be updated without
+  knowing about encoders that are not on it."""
+  full = len(entries) >= LEADERBOARD_SIZE
+  lowered = False
+  for index, (old_score, old_hashname) in enumerate(entries):
+    if old_hashname == hashname:
+      lowered = score < old_score
+      del entries[index]
+      break
+  if lowered and full and entries and score < entries[-1][0]:
+    # Something that is not on the list may now be better.
+    return False
+  position = len(entries)
+  while position > 0 and entries[position - 1][0] < score:
+    position -= 1
+  entries.insert(position, [score, hashname])
+  del entries[LEADERBOARD_SIZE:]
+  return True
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the leaderboards."""
+
+import unittest
+
+import encoder
+import encoder_configuration
+import leaderboard
+import result_log
+import sqlite_cache
+import test_tools
+
+from sqlite_cache_unittest import MakeContextAndCache
+from sqlite_cache_unittest import MakeEncoding
+
+
+def PsnrEncoding(context, bitrate, psnr):
+  return MakeEncoding(context, bitrate, {'psnr': psnr, 'bitrate': bitrate})
+
+
+class TestUpdateEntries(unittest.TestCase):
+  # pylint: disable=protected-access
+  def testInsertKeepsOrder(self):
+    entries = [[5.0, 'a'], [3.0, 'b']]
+    self.assertTrue(leaderboard._UpdateEntries(entries, 4.0, 'c'))
+    self.assertEquals([[5.0, 'a'], [4.0, 'c'], [3.0, 'b']], entries)
+    # Ties go after the entries that were there first.
+    self.assertTrue(leaderboard._UpdateEntries(entries, 5.0, 'd'))
+    self.assertEquals('d', entries[1][1])
+
+  def testNewScoreReplacesOld(self):
+    entries = [[5.0, 'a'], [3.0, 'b']]
+    self.assertTrue(leaderboard._UpdateEntries(entries, 6.0, 'b'))
+    self.assertEquals([[6.0, 'b'], [5.0, 'a']], entries)
+    # Lowering a score is fine while everything is on the list.
+    self.assertTrue(leaderboard._UpdateEntries(entries, 1.0, 'b'))
+    self.assertEquals([[5.0, 'a'], [1.0, 'b']], entries)
+
+  def testListIsLimited(self):
+    entries = [[float(score), str(score)] for score
+               in range(leaderboard.LEADERBOARD_SIZE, 0, -1)]
+    self.assertTrue(leaderboard._UpdateEntries(entries, 0.5, 'new'))
+    self.assertEquals(leaderboard.LEADERBOARD_SIZE, len(entries))
+    self.assertNotIn([0.5, 'new'], entries)
+    # Lowering the score of the best one to the bottom of a full list
+    # needs a rebuild.
+    self.assertFalse(leaderboard._UpdateEntries(entries, 0.1, entries[0][1]))
+
+
+class TestLeaderboardStore(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestLeaderboardStore, self).setUp()
+    test_tools.EmptyWorkDirectory()
+
+  def testOnlyKnownTargetsAreUpdated(self):
+    context, cache = MakeContextAndCache(encoder.EncodingDiskCache)
+    my_encoding = PsnrEncoding(context, 123, 40.0)
+    my_encoding.Store()
+    self.assertIsNone(cache.leaderboards.Entries(123, my_encoding.videofile,
+                                                 'psnr'))
+    cache.leaderboards.Replace(
+        123, my_encoding.videofile, 'psnr', [],
+        cache.leaderboards.CurrentFingerprint(123, my_encoding.videofile))
+    my_encoding.Store()
+    entries = cache.leaderboards.Entries(123, my_encoding.videofile, 'psnr')
+    self.assertEquals([my_encoding.encoder.Hashname()],
+                      [hashname for _, hashname in entries])
+    self.assertIsNone(cache.leaderboards.Entries(246, my_encoding.videofile,
+                                                 'psnr'))
+
+  def testUnscorableResultInvalidates(self):
+    context, cache = MakeContextAndCache(encoder.EncodingDiskCache)
+    my_encoding = PsnrEncoding(context, 123, 40.0)
+    cache.leaderboards.Replace(
+        123, my_encoding.videofile, 'rt', [],
+        cache.leaderboards.CurrentFingerprint(123, my_encoding.videofile))
+    # The 'rt' score function needs CPU times, which this result lacks.
+    my_encoding.Store()
+    self.assertIsNone(cache.leaderboards.Entries(123, my_encoding.videofile,
+                                                 'rt'))
+
+  def testInvalidateAndRemoveAll(self):
+    context, cache = MakeContextAndCache(encoder.EncodingDiskCache)
+    videofile = PsnrEncoding(context, 123, 40.0).videofile
+    fingerprint = cache.leaderboards.CurrentFingerprint(123, videofile)
+    cache.leaderboards.Replace(123, videofile, 'psnr', [(1.0, 'abc')],
+                               fingerprint)
+    cache.leaderboards.Replace(246, videofile, 'psnr', [(1.0, 'abc')],
+                               fingerprint)
+    cache.leaderboards.Invalidate(123, videofile, 'psnr')
+    self.assertIsNone(cache.leaderboards.Entries(123, videofile, 'psnr'))
+    self.assertEquals([[1.0, 'abc']],
+                      cache.leaderboards.Entries(246, videofile, 'psnr'))
+    cache.leaderboards.RemoveAll()
+    self.assertIsNone(cache.leaderboards.Entries(246, videofile, 'psnr'))
+
+  def testResultsStoredElsewhereMakeBoardsStale(self):
+    for cache_class in (encoder.EncodingDiskCache,
+                        sqlite_cache.EncodingSqliteCache,
+                        result_log.EncodingLogCache):
+      test_tools.EmptyWorkDirectory()
+      context, cache = MakeContextAndCache(cache_class)
+      my_encoding = PsnrEncoding(context, 123, 40.0)
+      my_encoding.Store()
+      cache.leaderboards.Replace(
+          123, my_encoding.videofile, 'psnr',
+          [(40.0, my_encoding.encoder.Hashname())],
+          cache.leaderboards.CurrentFingerprint(123, my_encoding.videofile))
+      self.assertIsNotNone(cache.leaderboards.Entries(
+          123, my_encoding.videofile, 'psnr'))
+      # Storing through another cache is what another process, or an
+      # import, looks like to this one.
+      other_context, other_cache = MakeContextAndCache(cache_class)
+      other_encoder = encoder.Encoder(
+          other_context,
+          encoder.OptionValueSet(encoder.OptionSet(), '--other'))
+      other_encoding = other_encoder.Encoding(123, my_encoding.videofile)
+      other_encoding.result = {'psnr': 41.0, 'bitrate': 123}
+      other_cache.StoreEncoder(other_encoder)
+      other_cache.StoreEncoding(other_encoding)
+      self.assertIsNone(cache.leaderboards.Entries(
+          123, my_encoding.videofile, 'psnr'))
+      # A board that is stale is emptied by the next store, not updated.
+      my_encoding.Store()
+      self.assertIsNone(cache.leaderboards.Entries(
+          123, my_encoding.videofile, 'psnr'))
+
+  def testLocation(self):
+    _, cache = MakeContextAndCache(encoder.EncodingDiskCache)
+    self.assertTrue(cache.leaderboards.directory.startswith(
+        encoder_configuration.conf.workdir()))
+    # The memory cache has none.
+    memory_context = encoder.Context(cache.context.codec)
+    self.assertIsNone(memory_context.cache.leaderboards)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -64,9 +64,18 @@ class LibavcCodec(file_codec.FileCodec):
         encodedfile, yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = "%s -loglevel warning -codec:v h264 -i %s %s" % (
+        encoder.Tool('ffmpeg'),
+        encodedfile, file_codec.FFMPEG_PIPE_OUTPUT)
+    return commandline
+
   def ResultData(self, encodedfile):
     return {'frame': file_codec.FfmpegFrameInfo(encodedfile)}
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('avcenc')]
+
   def EncoderVersion(self):
     # libavc doesn't appear to have a built-in version string. Use the
     # git checksum instead.
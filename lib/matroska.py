@@ -0,0 +1,203 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Frame sizes and key frames from Matroska (and WebM) files.
+
+A Matroska file is a tree of EBML elements. Each element starts with
+a variable-length ID and a variable-length size. The frames are in
+SimpleBlock elements, or Block elements inside BlockGroups, which are
+inside Clusters inside the Segment. Everything else is skipped over
+without being read.
+
+A block may hold several frames ("lacing"). Frame sizes are given as
+the size of each frame's data, without the block header, which is what
+"mkvinfo -v" reports as "Frame with size".
+"""
+
+import os
+
+import encoder
+
+# Element IDs, with their length marker bits, as in the specification.
+SEGMENT = 0x18538067
+CLUSTER = 0x1F43B675
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+SIMPLE_BLOCK = 0xA3
+REFERENCE_BLOCK = 0xFB
+
+# Elements whose children are read, even if their size is unknown.
+_TRANSPARENT_ELEMENTS = (SEGMENT, CLUSTER)
+
+_KEY_FRAME_FLAG = 0x80
+_NO_LACING, _XIPH_LACING, _FIXED_LACING, _EBML_LACING = range(4)
+# Enough for the block header with the longest track number.
+_BLOCK_HEADER_MAX = 11
+
+
+def _VintLength(first_byte, max_length):
+  """Returns the length of a variable-length integer from its first byte."""
+  for length in range(1, max_length + 1):
+    if first_byte & (0x80 >> (length - 1)):
+      return length
+  raise encoder.Error('Invalid EBML variable-length integer')
+
+
+def _Vint(data, position, keep_marker=False, max_length=8):
+  """Returns (value, length) for a variable-length integer in a string.
+
+  Returns a value of None for sizes with all bits set, which mean
+  "unknown size"."""
+  first_byte = ord(data[position])
+  length = _VintLength(first_byte, max_length)
+  if position + length > len(data):
+    raise EOFError()
+  if keep_marker:
+    value = first_byte
+  else:
+    value = first_byte & ((0x80 >> (length - 1)) - 1)
+  all_ones = value == (0x80 >> (length - 1)) - 1
+  for byte in data[position + 1:position + length]:
+    value = (value << 8) | ord(byte)
+    all_ones = all_ones and byte == '\xff'
+  if all_ones and not keep_marker:
+    return None, length
+  return value, length
+
+
+def _ReadVint(the_file, keep_marker=False, max_length=8):
+  """Reads a variable-length integer from a file. Raises EOFError at the
+  end of the file."""
+  first = the_file.read(1)
+  if not first:
+    raise EOFError()
+  length = _VintLength(ord(first), max_length)
+  data = first + the_file.read(length - 1)
+  return _Vint(data, 0, keep_marker, max_length)[0]
+
+
+def _LaceSizes(data, size, header_length, lacing):
+  """Returns the sizes of the frames in a laced block."""
+  count = ord(data[header_length]) + 1
+  position = header_length + 1
+  sizes = []
+  if lacing == _XIPH_LACING:
+    for _ in range(count - 1):
+      frame_size = 0
+      while True:
+        byte = ord(data[position])
+        position += 1
+        frame_size += byte
+        if byte != 255:
+          break
+      sizes.append(frame_size)
+  elif lacing == _FIXED_LACING:
+    sizes = [(size - position) / count] * (count - 1)
+  else:
+    frame_size, length = _Vint(data, position)
+    position += length
+    sizes.append(frame_size)
+    for _ in range(count - 2):
+      difference, length = _Vint(data, position)
+      frame_size += difference - ((1 << (7 * length - 1)) - 1)
+      position += length
+      sizes.append(frame_size)
+  sizes.append(size - position - sum(sizes))
+  if min(sizes) < 0:
+    raise encoder.Error('Invalid lacing in Matroska block')
+  return sizes
+
+
+def _BlockFrameSizes(the_file, size):
+  """Reads a Block or SimpleBlock with its data at the current position.
+
+  Returns (frame sizes in bytes, block flags), and leaves the file
+  positioned after the block."""
+  start = the_file.tell()
+  data = the_file.read(min(size, _BLOCK_HEADER_MAX))
+  if len(data) < min(size, _BLOCK_HEADER_MAX):
+    raise EOFError()
+  track_length = _VintLength(ord(data[0]), 8)
+  header_length = track_length + 3
+  if header_length > size:
+    raise encoder.Error('Matroska block is too short')
+  flags = ord(data[header_length - 1])
+  lacing = (flags >> 1) & 3
+  if lacing == _NO_LACING:
+    sizes = [size - header_length]
+  else:
+    # Only laced blocks are read in full, to find the lace sizes.
+    the_file.seek(start)
+    data = the_file.read(size)
+    if len(data) < size:
+      raise EOFError()
+    sizes = _LaceSizes(data, size, header_length, lacing)
+  the_file.seek(start + size)
+  return sizes, flags
+
+
+def _BlockGroupFrames(the_file, size):
+  """Returns (frame sizes, key frame) for the BlockGroup at the current
+  position. A block group is a key frame if it references no others."""
+  end = the_file.tell() + size
+  sizes = []
+  key_frame = True
+  while the_file.tell() < end:
+    element_id = _ReadVint(the_file, keep_marker=True, max_length=4)
+    element_size = _ReadVint(the_file)
+    if element_size is None:
+      raise encoder.Error('Unknown size inside a Matroska block group')
+    if element_id == BLOCK:
+      sizes, _ = _BlockFrameSizes(the_file, element_size)
+    else:
+      if element_id == REFERENCE_BLOCK:
+        key_frame = False
+      the_file.seek(element_size, 1)
+  the_file.seek(end)
+  return sizes, key_frame
+
+
+def FrameInfo(filename):
+  """Returns a list with the size in bits of each frame in a Matroska
+  file, and whether it is a key frame, as {'size': size, 'keyframe': flag}
+  (the same form as in the bitstream module; Matroska has no frame type).
+
+  A truncated file gives the frames that are complete. Raises
+  encoder.Error if the file is not valid Matroska."""
+  frames = []
+  with open(filename, 'rb') as the_file:
+    file_size = os.fstat(the_file.fileno()).st_size
+    while True:
+      try:
+        element_id = _ReadVint(the_file, keep_marker=True, max_length=4)
+        size = _ReadVint(the_file)
+        if element_id in _TRANSPARENT_ELEMENTS:
+          continue
+        if size is None:
+          raise encoder.Error('Unknown size for Matroska element %x'
+                              % element_id)
+        if the_file.tell() + size > file_size:
+          break
+        if element_id == SIMPLE_BLOCK:
+          sizes, flags = _BlockFrameSizes(the_file, size)
+          key_frame = bool(flags & _KEY_FRAME_FLAG)
+        elif element_id == BLOCK_GROUP:
+          sizes, key_frame = _BlockGroupFrames(the_file, size)
+        else:
+          the_file.seek(size, 1)
+          continue
+      except (EOFError, IndexError):
+        break
+      frames.extend([{'size': frame_size * 8, 'keyframe': key_frame}
+                     for frame_size in sizes])
+  return frames
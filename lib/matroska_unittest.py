@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the Matroska frame parser."""
+
+import os
+import struct
+import tempfile
+import unittest
+
+import encoder
+import matroska
+
+EBML_HEADER = 0x1A45DFA3
+VOID = 0xEC
+UNKNOWN_SIZE = '\x01\xff\xff\xff\xff\xff\xff\xff'
+
+
+def ElementId(element_id):
+  data = struct.pack('>I', element_id)
+  return data.lstrip('\0')
+
+
+def Size(size):
+  # Always use the 8-byte form; parsers must handle every length.
+  return '\x01' + struct.pack('>Q', size)[1:]
+
+
+def Element(element_id, payload):
+  return ElementId(element_id) + Size(len(payload)) + payload
+
+
+def Block(frame_data, flags=0, lacing_header=''):
+  # Track number 1, timecode 0.
+  return '\x81\x00\x00' + chr(flags) + lacing_header + frame_data
+
+
+class TestMatroskaFrameInfo(unittest.TestCase):
+  def setUp(self):
+    handle, self.filename = tempfile.mkstemp(suffix='.webm')
+    os.close(handle)
+
+  def tearDown(self):
+    os.unlink(self.filename)
+
+  def FrameInfo(self, *clusters):
+    with open(self.filename, 'wb') as the_file:
+      the_file.write(Element(EBML_HEADER, 'webm header'))
+      the_file.write(Element(matroska.SEGMENT, ''.join(
+          Element(matroska.CLUSTER, cluster) for cluster in clusters)))
+    return matroska.FrameInfo(self.filename)
+
+  def test_SimpleBlocks(self):
+    frames = self.FrameInfo(
+        Element(matroska.SIMPLE_BLOCK, Block('x' * 10, flags=0x80)) +
+        Element(VOID, 'void') +
+        Element(matroska.SIMPLE_BLOCK, Block('y' * 3)))
+    self.assertEqual([{'size': 80, 'keyframe': True},
+                      {'size': 24, 'keyframe': False}], frames)
+
+  def test_BlockGroups(self):
+    frames = self.FrameInfo(
+        Element(matroska.BLOCK_GROUP, Element(matroska.BLOCK, Block('a'))),
+        Element(matroska.BLOCK_GROUP,
+                Element(matroska.BLOCK, Block('bb')) +
+                Element(matroska.REFERENCE_BLOCK, '\xff')))
+    self.assertEqual([{'size': 8, 'keyframe': True},
+                      {'size': 16, 'keyframe': False}], frames)
+
+  def test_XiphLacing(self):
+    frames = self.FrameInfo(Element(matroska.SIMPLE_BLOCK, Block(
+        'a' * 300 + 'b' * 2 + 'c' * 5, flags=0x82,
+        lacing_header='\x02\xff\x2d\x02')))
+    self.assertEqual([300 * 8, 2 * 8, 5 * 8],
+                     [frame['size'] for frame in frames])
+
+  def test_FixedLacing(self):
+    frames = self.FrameInfo(Element(matroska.SIMPLE_BLOCK, Block(
+        'a' * 12, flags=0x04, lacing_header='\x02')))
+    self.assertEqual([32, 32, 32], [frame['size'] for frame in frames])
+
+  def test_EbmlLacing(self):
+    # Sizes 10, then 10 - 3 = 7 (a signed difference), then the rest.
+    frames = self.FrameInfo(Element(matroska.SIMPLE_BLOCK, Block(
+        'a' * 10 + 'b' * 7 + 'c' * 4, flags=0x06,
+        lacing_header='\x02\x8a' + chr(0x80 | (63 - 3)))))
+    self.assertEqual([80, 56, 32], [frame['size'] for frame in frames])
+
+  def test_UnknownSizeClusters(self):
+    cluster = Element(matroska.SIMPLE_BLOCK, Block('a' * 4, flags=0x80))
+    with open(self.filename, 'wb') as the_file:
+      the_file.write(ElementId(matroska.SEGMENT) + UNKNOWN_SIZE)
+      for _ in range(3):
+        the_file.write(ElementId(matroska.CLUSTER) + UNKNOWN_SIZE + cluster)
+    self.assertEqual(3, len(matroska.FrameInfo(self.filename)))
+
+  def test_TruncatedFile(self):
+    frames = self.FrameInfo(
+        Element(matroska.SIMPLE_BLOCK, Block('a' * 10)) +
+        Element(matroska.SIMPLE_BLOCK, Block('b' * 20)))
+    with open(self.filename, 'r+b') as the_file:
+      the_file.truncate(os.path.getsize(self.filename) - 2)
+    self.assertEqual(frames[:1], matroska.FrameInfo(self.filename))
+
+  def test_InvalidFile(self):
+    with open(self.filename, 'wb') as the_file:
+      the_file.write('\0' * 16)
+    with self.assertRaises(encoder.Error):
+      matroska.FrameInfo(self.filename)
+
+
+if __name__ == '__main__':
+  unittest.main()
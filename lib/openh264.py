@@ -80,6 +80,9 @@ class OpenH264Codec(file_codec.FileCodec):
     more_results['frame'] = file_codec.FfmpegFrameInfo(encodedfile)
     return more_results
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('h264enc')]
+
   def EncoderVersion(self):
     # openh264 doesn't appear to have a built-in version string. Use the
     # git checksum instead.
@@ -18,8 +18,12 @@ It contains functions that allow to find and score encodings that will
 perform highly on the score function.
 """
 
+import collections
+import config_array
 import encoder
+import leaderboard
 import os
+import random
 import score_tools
 
 class Optimizer(object):
@@ -33,25 +37,31 @@ class Optimizer(object):
   - A score directory, normally null, which means "take from context".
 
   One should be able ask an optimizer to find the parameters that give the
-  best result on the score function for that codec."""
+  best result on the score function for that codec.
+
+  Leaderboards that are missing or stale are only written by optimizers
+  created with update_leaderboards, so that tools that only look at
+  results don't change the score directory."""
   def __init__(self, codec, file_set=None,
                cache_class=None, score_function=None,
-               scoredir=None):
+               scoredir=None, update_leaderboards=False):
     # pylint: disable=too-many-arguments
     self.context = encoder.Context(codec,
                                    cache_class or encoder.EncodingDiskCache,
                                    scoredir=scoredir)
     self.file_set = file_set
     self.score_function = score_function or score_tools.ScorePsnrBitrate
+    self.configuration_arrays = None
+    # Row key of each tried encoder's configuration, None if it has none.
+    self.encoder_keys = {}
+    self.update_leaderboards = update_leaderboards
 
   def Score(self, encoding):
     result = encoding.result
     if not result:
       raise encoder.Error('Trying to score an encoding without result')
-    score = self.score_function(encoding.bitrate, result)
-    # Weakly penalize long command lines.
-    score -= len(encoding.encoder.parameters.values) * 0.00001
-    return score
+    return leaderboard.EncodingScore(self.score_function, encoding.bitrate,
+                                     result, encoding.encoder)
 
   def RebaseEncoding(self, encoding):
     """Take an encoding from another context and rebase it to
@@ -63,22 +73,72 @@ class Optimizer(object):
     return encoder.Encoder(self.context, my_encoder.parameters)
 
   def BestEncoding(self, bitrate, videofile):
-    encodings = self.AllScoredEncodings(bitrate, videofile)
+    encodings = self.BestEncodings(bitrate, videofile, 1)
     if encodings:
-      return max(encodings, key=self.Score)
+      return encodings[0]
     else:
       return self.context.codec.StartEncoder(self.context).Encoding(bitrate,
                                                                     videofile)
 
+  def BestEncodings(self, bitrate, videofile, count):
+    """Returns up to count scored encodings for a target, best first.
+
+    When the cache keeps leaderboards, only the encodings on an up to
+    date leaderboard are read."""
+    scorer_name = score_tools.ScorerName(self.score_function)
+    leaderboards = self.context.cache.leaderboards
+    if (not scorer_name or not leaderboards
+        or count > leaderboard.LEADERBOARD_SIZE):
+      encodings = self.AllScoredEncodings(bitrate, videofile)
+      return sorted(encodings, key=self.Score, reverse=True)[:count]
+    entries = leaderboards.Entries(bitrate, videofile, scorer_name)
+    if entries is not None:
+      encodings = self._LeaderboardEncodings(entries[:count], bitrate,
+                                             videofile)
+      if encodings is not None:
+        return encodings
+    if not self.update_leaderboards:
+      encodings = self.AllScoredEncodings(bitrate, videofile)
+      return sorted(encodings, key=self.Score, reverse=True)[:count]
+    return self.RebuildLeaderboard(bitrate, videofile)[:count]
+
+  def _LeaderboardEncodings(self, entries, bitrate, videofile):
+    """Returns the encodings for leaderboard entries, or None if
+    any of them is no longer in the cache."""
+    encodings = []
+    for _, hashname in entries:
+      if not self.context.cache.ReadEncoderParameters(hashname):
+        return None
+      encoding = encoder.Encoding(encoder.Encoder(self.context,
+                                                  filename=hashname),
+                                  bitrate, videofile)
+      encoding.Recover()
+      if not encoding.Result():
+        return None
+      encodings.append(encoding)
+    return encodings
+
+  def RebuildLeaderboard(self, bitrate, videofile):
+    """Scores all encodings for a target, and stores the best ones on
+    the leaderboard. Returns all the encodings, best first."""
+    leaderboards = self.context.cache.leaderboards
+    # Taken before the scan, so that results stored meanwhile make the
+    # leaderboard stale rather than missing from it.
+    fingerprint = leaderboards.CurrentFingerprint(bitrate, videofile)
+    encodings = sorted(self.AllScoredEncodings(bitrate, videofile),
+                       key=self.Score, reverse=True)
+    leaderboards.Replace(
+        bitrate, videofile, score_tools.ScorerName(self.score_function),
+        [(self.Score(encoding), encoding.encoder.Hashname())
+         for encoding in encodings], fingerprint)
+    return encodings
+
   def AllScoredEncodings(self, bitrate, videofile):
     return self.context.cache.AllScoredEncodings(bitrate, videofile)
 
-  def _WorksBetterOnSomeOtherClip(self, encoding, bitrate, videofile):
-    """Find an encoder that works better than this one on some other file.
-
-    This function finds some encoding that works better on another
-    videofile than the current encoding, but hasn't been tried on this
-    encoding and bitrate."""
+  def _BetterOnOtherClips(self, encoding, bitrate, videofile):
+    """Yields encodings for this file and bitrate with the encoders that
+    work better than this one on other files. They may have been tried."""
 
     # First, find all encodings with this encoder, and look at their files
     # and bitrates.
@@ -91,12 +151,18 @@ class Optimizer(object):
         continue
       best_candidate = self.BestEncoding(bitrate, candidate.videofile)
       if best_candidate != candidate:
-        # Construct an encoding based on this encoder, and check if it
-        # has been tried. If it hasn't been tried, this is the one to try.
-        best_on_this = best_candidate.encoder.Encoding(bitrate, videofile)
-        best_on_this.Recover()
-        if not best_on_this.Result():
-          return best_on_this
+        yield best_candidate.encoder.Encoding(bitrate, videofile)
+
+  def _WorksBetterOnSomeOtherClip(self, encoding, bitrate, videofile):
+    """Find an encoder that works better than this one on some other file.
+
+    This function finds some encoding that works better on another
+    videofile than the current encoding, but hasn't been tried on this
+    encoding and bitrate."""
+    for best_on_this in self._BetterOnOtherClips(encoding, bitrate,
+                                                 videofile):
+      if not best_on_this.Tried():
+        return best_on_this
     return None
 
   def _EncodingWithOneLessParameter(self, encoding, bitrate, videofile,
@@ -110,24 +176,29 @@ class Optimizer(object):
     if new_encoder.Hashname() in hashnames_to_ignore:
       return None
     new_encoding = new_encoder.Encoding(bitrate, videofile)
-    new_encoding.Recover()
+    if new_encoding.Tried():
+      return None
     return new_encoding
 
+  def _GoodOnOtherRates(self, bitrate, videofile):
+    """Yields encodings for this file and bitrate with the encoders that
+    are "best" on other bitrates. They may have been tried."""
+    if not self.file_set:
+      return
+    for other_rate in self.file_set.AllRatesForFile(videofile.filename):
+      yield self.BestEncoding(other_rate, videofile).encoder.Encoding(
+          bitrate, videofile)
+
   # pylint: disable=W0613
   def _EncodingGoodOnOtherRate(self, encoding, bitrate, videofile,
                                hashnames_to_ignore):
     """Find an untried encoder that is "best" on some other bitrate."""
 
     hashnames_to_ignore = hashnames_to_ignore or set()
-    if not self.file_set:
-      return None
-    for other_rate in self.file_set.AllRatesForFile(videofile.filename):
-      new_encoder = self.BestEncoding(other_rate, videofile).encoder
-      if new_encoder.Hashname() in hashnames_to_ignore:
+    for new_encoding in self._GoodOnOtherRates(bitrate, videofile):
+      if new_encoding.encoder.Hashname() in hashnames_to_ignore:
         continue
-      new_encoding = new_encoder.Encoding(bitrate, videofile)
-      new_encoding.Recover()
-      if not new_encoding.Result():
+      if not new_encoding.Tried():
         return new_encoding
     return None
 
@@ -152,16 +223,146 @@ class Optimizer(object):
       return might_work_better
     might_work_better = self._EncodingWithOneLessParameter(
         current_best, bitrate, videofile, hashnames_to_ignore)
-    if might_work_better and not might_work_better.Result():
+    if might_work_better:
       return might_work_better
-    # Randomly vary some parameters and see if things improve.
-    # This is the final fallback.
-    encodings = current_best.SomeUntriedVariants()
-    for encoding in encodings:
-      if not encoding.Result():
-        return encoding
+    return self._UntriedVariant(current_best, hashnames_to_ignore)
+
+  def _UntriedVariant(self, encoding, hashnames_to_ignore):
+    """Find an untried encoding with some options of this one changed.
+
+    The codec's own suggestion is tried first, then all the configurations
+    with one option changed, and only then random changes of two options."""
+    suggested_tweak = self.context.codec.SuggestTweak(encoding)
+    if (suggested_tweak and
+        suggested_tweak.encoder.Hashname() not in hashnames_to_ignore and
+        not suggested_tweak.Tried()):
+      return suggested_tweak
+    neighbours = self.UntriedNeighbours(encoding, hashnames_to_ignore)
+    if neighbours:
+      return neighbours[0]
+    for variant in encoding.SomeUntriedVariants():
+      if variant.encoder.Hashname() not in hashnames_to_ignore:
+        return variant
     return None
 
+  def _WithOneLessParameter(self, encoding):
+    """Yields the encodings with one of this one's parameters removed, in
+    random order. They may have been tried."""
+    parameters = encoding.encoder.parameters
+    names = [name for name in parameters.values
+             if not self.context.codec.option_set.Option(name).mandatory]
+    random.shuffle(names)
+    for name in names:
+      yield encoder.Encoder(self.context,
+                            parameters.RemoveValue(name)).Encoding(
+                                encoding.bitrate, encoding.videofile)
+
+  def _NeighboursByOption(self, encoding, hashnames_to_ignore):
+    """Yields the untried neighbours of an encoding, taking them in turn
+    from each set of options that they change."""
+    by_option = collections.OrderedDict()
+    for neighbour in self.UntriedNeighbours(encoding, hashnames_to_ignore):
+      by_option.setdefault(
+          _ChangedOptions(encoding.encoder.parameters,
+                          neighbour.encoder.parameters), []).append(neighbour)
+    return _RoundRobin(by_option.values())
+
+  def BestUntriedEncodings(self, bitrate, videofile, count,
+                           hashnames_to_ignore=None):
+    """Returns up to count different untried encodings for this file and
+    rate, to be executed together.
+
+    The candidates come from the same places as for BestUntriedEncoding:
+    encoders that are better on other files and on other rates, removal
+    of a parameter, the codec's suggestion and one-option changes. To
+    keep a batch diverse, the candidates are taken in turn from each of
+    these, and the one-option changes in turn from each option changed.
+    Random two-option changes fill the batch if these run out."""
+    hashnames_to_ignore = hashnames_to_ignore or set()
+    current_best = self.BestEncoding(bitrate, videofile)
+    suggested_tweak = self.context.codec.SuggestTweak(current_best)
+    candidates = _RoundRobin([
+        self._BetterOnOtherClips(current_best, bitrate, videofile),
+        self._GoodOnOtherRates(bitrate, videofile),
+        self._WithOneLessParameter(current_best),
+        [suggested_tweak] if suggested_tweak else [],
+        self._NeighboursByOption(current_best, hashnames_to_ignore),
+    ])
+    seen = set(hashnames_to_ignore)
+    seen.add(current_best.encoder.Hashname())
+    chosen = []
+    def Choose(candidates):
+      for candidate in candidates:
+        if len(chosen) >= count:
+          return
+        hashname = candidate.encoder.Hashname()
+        if hashname in seen:
+          continue
+        seen.add(hashname)
+        if not candidate.Tried():
+          chosen.append(candidate)
+    Choose(candidates)
+    if len(chosen) < count:
+      Choose(current_best.SomeUntriedVariants())
+    return chosen
+
+  def _TriedKeys(self, hashnames):
+    """Returns the row keys of the configurations of the encoders with
+    these hashnames. Each encoder's parameters are read only once."""
+    arrays = self.configuration_arrays
+    for hashname in hashnames:
+      if hashname not in self.encoder_keys:
+        parameters = self.context.cache.ReadEncoderParameters(hashname)
+        key = None
+        if parameters is not None:
+          try:
+            key = int(arrays.Keys(arrays.FromValueSet(parameters)))
+          except encoder.Error:
+            pass
+        self.encoder_keys[hashname] = key
+    return [self.encoder_keys[hashname] for hashname in hashnames
+            if self.encoder_keys[hashname] is not None]
+
+  def UntriedNeighbours(self, encoding, hashnames_to_ignore=None):
+    """Returns the untried encodings whose configuration differs from that
+    of encoding in one option, after the codec's fixups, in random order.
+
+    All changeable options are changed to all their other values, and
+    options that are not mandatory are also removed. Duplicates and tried
+    configurations are dropped as rows, so that encoders are only made
+    for the rest."""
+    hashnames_to_ignore = hashnames_to_ignore or set()
+    if self.configuration_arrays is None:
+      self.configuration_arrays = config_array.ConfigurationArrays(
+          self.context.codec.option_set)
+    arrays = self.configuration_arrays
+    try:
+      row = arrays.FromValueSet(encoding.encoder.parameters)
+    except encoder.Error:
+      # A value that the options do not list, set by the codec.
+      return []
+    tried = self.context.cache.TriedHashnames(encoding.bitrate,
+                                              encoding.videofile)
+    rows = arrays.Untried(arrays.Unique(arrays.Neighbours(row)),
+                          self._TriedKeys(tried))
+    # The codec's fixups may still turn different rows into the same or
+    # a tried configuration.
+    seen = set(hashnames_to_ignore)
+    seen.add(encoding.encoder.Hashname())
+    neighbours = []
+    for neighbour_row in rows:
+      neighbour_encoder = encoder.Encoder(
+          self.context,
+          arrays.ToValueSet(neighbour_row, encoding.encoder.parameters))
+      if (neighbour_encoder.Hashname() in seen or
+          neighbour_encoder.Hashname() in tried):
+        continue
+      seen.add(neighbour_encoder.Hashname())
+      neighbours.append(neighbour_encoder.Encoding(encoding.bitrate,
+                                                   encoding.videofile))
+    random.shuffle(neighbours)
+    return neighbours
+
   def BestOverallEncoder(self):
     """Returns the configuration that is best over all files.
 
@@ -199,6 +400,26 @@ class Optimizer(object):
     return best_encoder
 
 
+def _RoundRobin(iterables):
+  """Yields the first item of each iterable, then the second of each, and
+  so on, until all are exhausted."""
+  iterators = [iter(iterable) for iterable in iterables]
+  while iterators:
+    for iterator in list(iterators):
+      try:
+        yield next(iterator)
+      except StopIteration:
+        iterators.remove(iterator)
+
+
+def _ChangedOptions(parameters, other_parameters):
+  """Returns the names of the options whose values differ."""
+  names = set(parameters.values) | set(other_parameters.values)
+  return tuple(sorted(name for name in names
+                      if parameters.values.get(name) !=
+                      other_parameters.values.get(name)))
+
+
 class FileAndRateSet(object):
   def __init__(self, verify_files_present=True):
     self.rates_and_files = set()
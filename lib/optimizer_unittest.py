@@ -132,6 +132,83 @@ class TestOptimizer(unittest.TestCase):
     self.assertNotEqual(first_encoding.encoder.parameters.ToString(),
                         other_encoding.encoder.parameters.ToString())
 
+  def test_UntriedNeighbours(self):
+    my_optimizer = self.StdOptimizer()
+    first_encoding = my_optimizer.BestEncoding(100, self.videofile)
+    first_encoding.Execute().Store()
+    neighbours = my_optimizer.UntriedNeighbours(first_encoding)
+    # Ten other values of score, and no score at all.
+    self.assertEquals(11, len(neighbours))
+    self.assertEquals(11, len(set(neighbour.encoder.Hashname()
+                                  for neighbour in neighbours)))
+    stored = neighbours[0]
+    stored.Execute().Store()
+    ignored = neighbours[1].encoder.Hashname()
+    neighbours = my_optimizer.UntriedNeighbours(first_encoding,
+                                                set([ignored]))
+    self.assertEquals(9, len(neighbours))
+    self.assertNotIn(ignored, [neighbour.encoder.Hashname()
+                               for neighbour in neighbours])
+    # The parameters of the tried encoders were read once, for their keys.
+    self.assertEquals(set([first_encoding.encoder.Hashname(),
+                           stored.encoder.Hashname()]),
+                      set(my_optimizer.encoder_keys))
+
+  def test_BestUntriedEncodingTriesAllNeighbours(self):
+    my_optimizer = self.StdOptimizer()
+    best_encoding = my_optimizer.BestEncoding(100, self.videofile)
+    best_encoding.Execute().Store()
+    # Nothing more is executed, so the best encoding stays the same, and
+    # each of its neighbours is returned once before giving up.
+    returned = set()
+    while True:
+      next_encoding = my_optimizer.BestUntriedEncoding(100, self.videofile,
+                                                       returned)
+      if not next_encoding:
+        break
+      self.assertNotIn(next_encoding.encoder.Hashname(), returned)
+      returned.add(next_encoding.encoder.Hashname())
+    self.assertLessEqual(11, len(returned))
+
+  def test_BestUntriedEncodingsAreDistinctAndUntried(self):
+    my_optimizer = self.StdOptimizer()
+    first_encoding = my_optimizer.BestEncoding(100, self.videofile)
+    first_encoding.Execute().Store()
+    encodings = my_optimizer.BestUntriedEncodings(100, self.videofile, 5)
+    self.assertEquals(5, len(encodings))
+    hashnames = set(encoding.encoder.Hashname() for encoding in encodings)
+    self.assertEquals(5, len(hashnames))
+    self.assertNotIn(first_encoding.encoder.Hashname(), hashnames)
+    for encoding in encodings:
+      self.assertFalse(encoding.Tried())
+    # Asking for more than there are returns all of them once.
+    encodings[0].Execute().Store()
+    encodings = my_optimizer.BestUntriedEncodings(100, self.videofile, 100,
+                                                  hashnames)
+    self.assertFalse(hashnames & set(encoding.encoder.Hashname()
+                                     for encoding in encodings))
+    self.assertEquals(len(encodings), len(set(
+        encoding.encoder.Hashname() for encoding in encodings)))
+
+  def test_BestUntriedEncodingsChangeDifferentOptions(self):
+    self.codec.option_set.RegisterOption(
+        encoder.Option('third_parameter', ['a', 'b', 'c']))
+    my_optimizer = self.StdOptimizer()
+    best = my_optimizer.BestEncoding(100, self.videofile)
+    best.Execute().Store()
+    encodings = my_optimizer.BestUntriedEncodings(100, self.videofile, 3)
+    changed = set()
+    for encoding in encodings:
+      changed.update(optimizer._ChangedOptions(  # pylint: disable=W0212
+          best.encoder.parameters, encoding.encoder.parameters))
+    self.assertEquals(set(['score', 'third_parameter']), changed)
+
+  def test_RoundRobin(self):
+    self.assertEquals(
+        [1, 'a', 2, 'b', 3, 4],
+        list(optimizer._RoundRobin(  # pylint: disable=W0212
+            [[1, 2, 3, 4], [], iter(['a', 'b'])])))
+
   def test_WorksBetterOnSomeOtherClip(self):
     my_optimizer = self.StdOptimizer()
     videofile2 = DummyVideofile('barfile_640_480_30.yuv', clip_time=1)
@@ -179,6 +256,10 @@ class TestOptimizer(unittest.TestCase):
                                                               None)
     self.assertTrue(next_encoding)
     self.assertEqual(next_encoding.encoder.parameters.ToString(), '')
+    # Once it has been tried, it is no longer suggested.
+    next_encoding.Execute().Store()
+    self.assertIsNone(my_optimizer._EncodingWithOneLessParameter(
+        first_encoding, 100, self.videofile, None))
 
   def test_EncodingGoodOnOtherRate(self):
     self.file_set = optimizer.FileAndRateSet(verify_files_present=False)
@@ -292,6 +373,73 @@ class TestOptimizerWithRealFiles(test_tools.FileUsingCodecTest):
     another_encoding.Recover()
     self.assertFalse(another_encoding.Result())
 
+  def test_BestEncodingsFromLeaderboard(self):
+    test_tools.EmptyWorkDirectory()
+    self.optimizer = optimizer.Optimizer(self.codec, update_leaderboards=True)
+    for score in (3, 7, 5):
+      self.EncoderFromParameterString('--score=%d' % score).Encoding(
+          100, self.videofile).Execute().Store()
+    # The first search fills in the leaderboard.
+    best = self.optimizer.BestEncodings(100, self.videofile, 2)
+    self.assertEquals([7, 5], [encoding.result['psnr'] for encoding in best])
+    entries = self.optimizer.context.cache.leaderboards.Entries(
+        100, self.videofile, 'psnr')
+    self.assertEquals(3, len(entries))
+    # Later stores update it.
+    self.EncoderFromParameterString('--score=9').Encoding(
+        100, self.videofile).Execute().Store()
+    self.assertEquals(4, len(self.optimizer.context.cache.leaderboards.Entries(
+        100, self.videofile, 'psnr')))
+    self.assertEquals(9, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+
+  def test_StaleLeaderboardIsRebuilt(self):
+    test_tools.EmptyWorkDirectory()
+    self.optimizer = optimizer.Optimizer(self.codec, update_leaderboards=True)
+    best_encoding = self.EncoderFromParameterString('--score=7').Encoding(
+        100, self.videofile)
+    best_encoding.Execute().Store()
+    self.EncoderFromParameterString('--score=5').Encoding(
+        100, self.videofile).Execute().Store()
+    self.assertEquals(7, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+    self.optimizer.context.cache.RemoveEncoder(
+        best_encoding.encoder.Hashname())
+    self.assertEquals(5, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+
+  def test_LeaderboardSeesResultsStoredElsewhere(self):
+    test_tools.EmptyWorkDirectory()
+    encoder_configuration.conf.override_scorepath_for_test([])
+    self.optimizer = optimizer.Optimizer(self.codec, update_leaderboards=True)
+    self.EncoderFromParameterString('--score=5').Encoding(
+        100, self.videofile).Execute().Store()
+    self.assertEquals(5, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+    # Another optimizer has its own cache, which this one's leaderboards
+    # are not told about.
+    other_optimizer = optimizer.Optimizer(self.codec)
+    other_encoding = encoder.Encoder(
+        other_optimizer.context,
+        encoder.OptionValueSet(self.codec.option_set, '--score=7')).Encoding(
+            100, self.videofile)
+    other_encoding.Execute()
+    other_optimizer.context.cache.StoreEncoder(other_encoding.encoder)
+    other_optimizer.context.cache.StoreEncoding(other_encoding)
+    self.assertEquals(7, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+
+  def test_ReadOnlyOptimizerWritesNoLeaderboards(self):
+    test_tools.EmptyWorkDirectory()
+    encoder_configuration.conf.override_scorepath_for_test([])
+    self.optimizer = optimizer.Optimizer(self.codec)
+    self.EncoderFromParameterString('--score=5').Encoding(
+        100, self.videofile).Execute().Store()
+    self.assertEquals(5, self.optimizer.BestEncoding(
+        100, self.videofile).result['psnr'])
+    self.assertFalse(os.path.isdir(
+        self.optimizer.context.cache.leaderboards.directory))
+
 
 
 class TestFileAndRateSet(unittest.TestCase):
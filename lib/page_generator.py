@@ -0,0 +1,258 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generation of the JSON files that the website shows.
+
+For each criterion, the results of all its codecs are loaded once, into
+a datatable of the best encodings and a datatable of the best single
+configurations. All the pairwise comparisons (what compare_json prints)
+and cross performance tables (what write_cross_performance_tables
+prints) are computed from those two datatables. Criteria are generated
+in parallel, one worker process each.
+
+Incremental generation (see page_manifest) writes only the files for
+codecs whose results have changed, and keeps each codec's datatables
+between runs, so that only changed codecs are loaded again.
+"""
+
+import json
+import multiprocessing
+import os
+import StringIO
+
+import json_stream
+import page_manifest
+import pick_codec
+import score_tools
+import visual_metrics
+
+# Kept in the output directory by incremental generation. The names start
+# with a dot, so that they are not taken for generated pages.
+MANIFEST_FILENAME = '.manifest-%s.json'
+DATATABLE_DIRECTORY = '.datatables'
+
+# The criteria shown on the website, with the codecs compared for each.
+WEBSITE_CRITERIA = (
+    ('psnr', ('x264', 'x264_base', 'vp8', 'vp9', 'x265', 'openh264',
+              'libavc')),
+    ('rt', ('x264_rt', 'x264_base', 'vp8', 'vp9', 'openh264')),
+)
+
+
+def LoadDatatables(codecs, criterion, do_score=False):
+  """Returns (datatable, single config datatable) for the codecs."""
+  score_function = score_tools.PickScorer(criterion)
+  single_config_datatable = {}
+  visual_metrics.ListMpegSingleConfigResults(codecs, single_config_datatable,
+                                             score_function=score_function)
+  datatable = {}
+  visual_metrics.ListMpegResults(codecs, do_score, datatable,
+                                 score_function=score_function)
+  return datatable, single_config_datatable
+
+
+def _SubTable(datatable, codecs):
+  return dict((codec, datatable[codec]) for codec in codecs
+              if codec in datatable)
+
+
+def ComparisonInfo(codec_names, datatable, baseline_datatable):
+  """Returns the comparison of the other codecs with the first one,
+  in the form that compare_json prints.
+
+  codec_names is a list of (codec, long name). The datatables may hold
+  other codecs too; only the compared ones are included."""
+  codecs = [codec for codec, _ in codec_names]
+  datatable = _SubTable(datatable, codecs)
+  if baseline_datatable is not None:
+    baseline_datatable = _SubTable(baseline_datatable, codecs)
+  overall = {}
+  for metric in ['avg', 'dsnr', 'drate']:
+    overall[metric] = visual_metrics.BuildComparisonTable(datatable, metric,
+                                                          codecs[0],
+                                                          codecs[1:])
+  return {'codecs': codec_names,
+          'overall': overall,
+          'detailed': datatable,
+          'baseline': baseline_datatable}
+
+
+def CrossPerformanceJson(datatable, codecs, criterion):
+  """Returns the cross performance table, as write_cross_performance_tables
+  prints it."""
+  matrix = visual_metrics.CrossPerformanceGvizTable(datatable, 'avg',
+                                                    codecs, criterion)
+  return matrix.ToJSon(columns_order=['codec'] + list(codecs))
+
+
+def CriterionOutputs(criterion, codecs):
+  """Returns the files generated for one criterion, as a dictionary of
+  filename -> the codecs whose results the file shows."""
+  outputs = {}
+  for codec1 in codecs:
+    for codec2 in codecs:
+      if codec1 != codec2:
+        outputs['%s-%s-%s.json' % (codec1, codec2, criterion)] = [codec1,
+                                                                  codec2]
+        outputs['%s-%s-%s-single.json' % (codec1, codec2, criterion)] = [
+            codec1, codec2]
+  outputs['toplevel-%s-new.json' % criterion] = list(codecs)
+  outputs['toplevel-%s-single.json' % criterion] = list(codecs)
+  return outputs
+
+
+def _JsonText(value):
+  """Returns a page's JSON text, written the way compare_json writes it."""
+  output = StringIO.StringIO()
+  json_stream.JsonWriter(output).Write(value)
+  return output.getvalue()
+
+
+def CriterionFiles(criterion, codec_names, datatable,
+                   single_config_datatable, filenames=None):
+  """Returns the generated files for one criterion, as a dictionary of
+  filename -> contents. If filenames is given, only those files are
+  generated."""
+  # pylint: disable=too-many-locals
+  codecs = [codec for codec, _ in codec_names]
+  def Wanted(filename):
+    return filenames is None or filename in filenames
+  files = {}
+  for codec1, name1 in codec_names:
+    for codec2, name2 in codec_names:
+      if codec1 == codec2:
+        continue
+      pair = [(codec1, name1), (codec2, name2)]
+      filename = '%s-%s-%s.json' % (codec1, codec2, criterion)
+      if Wanted(filename):
+        files[filename] = _JsonText(
+            ComparisonInfo(pair, datatable, single_config_datatable))
+      filename = '%s-%s-%s-single.json' % (codec1, codec2, criterion)
+      if Wanted(filename):
+        files[filename] = _JsonText(
+            ComparisonInfo(pair, single_config_datatable, None))
+  filename = 'toplevel-%s-new.json' % criterion
+  if Wanted(filename):
+    files[filename] = CrossPerformanceJson(datatable, codecs,
+                                           criterion) + '\n'
+  filename = 'toplevel-%s-single.json' % criterion
+  if Wanted(filename):
+    files[filename] = CrossPerformanceJson(single_config_datatable, codecs,
+                                           '%s-single' % criterion) + '\n'
+  return files
+
+
+def WriteFiles(directory, files):
+  """Writes a dictionary of filename -> contents into a directory.
+  Each file is replaced in one step, so that the website never serves
+  a partly written file."""
+  for filename, contents in files.iteritems():
+    with json_stream.OutputFile(os.path.join(directory,
+                                             filename)) as output_file:
+      output_file.write(contents)
+
+
+def _CodecDatatables(codec, criterion, fingerprint, cache_directory):
+  """Returns (datatable, single config datatable) for one codec.
+
+  The datatables are kept in cache_directory, and loaded from the
+  results again only when the codec's results fingerprint changes."""
+  cache_filename = os.path.join(cache_directory,
+                                '%s-%s.json' % (criterion, codec))
+  try:
+    with open(cache_filename, 'r') as cache_file:
+      cached = json.load(cache_file)
+    if cached['fingerprint'] == fingerprint:
+      return cached['datatable'], cached['single_config']
+  except (IOError, ValueError, KeyError):
+    pass
+  datatable, single_config_datatable = LoadDatatables([codec], criterion)
+  if not os.path.isdir(cache_directory):
+    os.makedirs(cache_directory)
+  WriteFiles(cache_directory, {os.path.basename(cache_filename): json.dumps(
+      {'fingerprint': fingerprint,
+       'datatable': datatable,
+       'single_config': single_config_datatable})})
+  return datatable, single_config_datatable
+
+
+def GenerateCriterion(criterion, codecs, directory, incremental=False):
+  """Loads the results for one criterion and writes its files.
+  Returns the names of the files written.
+
+  If incremental is true, only the files showing codecs whose results
+  have changed since they were last generated are written, and only
+  those codecs' results are loaded again."""
+  # pylint: disable=too-many-locals
+  codec_names = [(codec, pick_codec.LongName(codec)) for codec in codecs]
+  if not incremental:
+    datatable, single_config_datatable = LoadDatatables(codecs, criterion)
+    files = CriterionFiles(criterion, codec_names, datatable,
+                           single_config_datatable)
+    WriteFiles(directory, files)
+    return sorted(files)
+
+  manifest = page_manifest.Manifest(
+      os.path.join(directory, MANIFEST_FILENAME % criterion))
+  fingerprints = dict((codec, page_manifest.CodecResultsFingerprint(codec))
+                      for codec in codecs)
+  inputs = {}
+  for filename, shown_codecs in CriterionOutputs(criterion,
+                                                 codecs).iteritems():
+    inputs[filename] = dict((codec, fingerprints[codec])
+                            for codec in shown_codecs)
+  stale = set(filename for filename in inputs
+              if not manifest.IsCurrent(os.path.join(directory, filename),
+                                        inputs[filename]))
+  if not stale:
+    return []
+  datatable = {}
+  single_config_datatable = {}
+  for codec in codecs:
+    codec_datatable, codec_single_config_datatable = _CodecDatatables(
+        codec, criterion, fingerprints[codec],
+        os.path.join(directory, DATATABLE_DIRECTORY))
+    datatable.update(codec_datatable)
+    single_config_datatable.update(codec_single_config_datatable)
+  files = CriterionFiles(criterion, codec_names, datatable,
+                         single_config_datatable, filenames=stale)
+  WriteFiles(directory, files)
+  for filename in files:
+    manifest.Record(os.path.join(directory, filename), inputs[filename])
+  manifest.Save()
+  return sorted(files)
+
+
+def _GenerateCriterionJob(arguments):
+  return GenerateCriterion(*arguments)
+
+
+def GeneratePages(directory, criteria=WEBSITE_CRITERIA, jobs=None,
+                  incremental=False):
+  """Writes the files for all the criteria into a directory, generating
+  the criteria in parallel. Returns the names of the files written."""
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  jobs = min(jobs or len(criteria), len(criteria))
+  arguments = [(criterion, codecs, directory, incremental)
+               for criterion, codecs in criteria]
+  if jobs <= 1:
+    written = [_GenerateCriterionJob(argument) for argument in arguments]
+  else:
+    pool = multiprocessing.Pool(jobs)
+    try:
+      written = pool.map(_GenerateCriterionJob, arguments)
+    finally:
+      pool.terminate()
+      pool.join()
+  return [filename for filenames in written for filename in filenames]
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the website page generator."""
+
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import json_stream
+import page_generator
+import visual_metrics
+
+
+def Results(*points):
+  return {'dummyfile': [{'result': {'bitrate': bitrate, 'psnr': psnr}}
+                        for bitrate, psnr in points]}
+
+
+DATATABLE = {
+    'codec1': Results((100, 30.0), (200, 40.0)),
+    'codec2': Results((100, 31.0), (200, 42.0)),
+    'codec3': Results((100, 29.0), (200, 39.0)),
+}
+SINGLE_CONFIG_DATATABLE = {
+    'codec1': Results((100, 29.0), (200, 39.0)),
+    'codec2': Results((100, 30.0), (200, 41.0)),
+    'codec3': Results((100, 28.0), (200, 38.0)),
+}
+CODEC_NAMES = [('codec1', 'Codec one'), ('codec2', 'Codec two'),
+               ('codec3', 'Codec three')]
+
+
+class TestPageGenerator(unittest.TestCase):
+  def test_ComparisonInfoHoldsOnlyComparedCodecs(self):
+    info = page_generator.ComparisonInfo(CODEC_NAMES[:2], DATATABLE,
+                                         SINGLE_CONFIG_DATATABLE)
+    self.assertEquals(['codec1', 'codec2'], sorted(info['detailed']))
+    self.assertEquals(['codec1', 'codec2'], sorted(info['baseline']))
+    self.assertEquals(
+        visual_metrics.BuildComparisonTable(DATATABLE, 'avg', 'codec1',
+                                            ['codec2']),
+        info['overall']['avg'])
+
+  def test_ComparisonInfoWithoutBaseline(self):
+    info = page_generator.ComparisonInfo(CODEC_NAMES[:2],
+                                         SINGLE_CONFIG_DATATABLE, None)
+    self.assertIsNone(info['baseline'])
+
+  def test_CriterionFiles(self):
+    files = page_generator.CriterionFiles('psnr', CODEC_NAMES, DATATABLE,
+                                          SINGLE_CONFIG_DATATABLE)
+    # Two files for each ordered pair, and two cross performance tables.
+    self.assertEquals(3 * 2 * 2 + 2, len(files))
+    pair = json.loads(files['codec2-codec3-psnr.json'])
+    self.assertEquals([['codec2', 'Codec two'], ['codec3', 'Codec three']],
+                      pair['codecs'])
+    single = json.loads(files['codec2-codec3-psnr-single.json'])
+    self.assertEquals(SINGLE_CONFIG_DATATABLE['codec2'],
+                      single['detailed']['codec2'])
+    self.assertEquals(
+        page_generator.CrossPerformanceJson(DATATABLE,
+                                            ['codec1', 'codec2', 'codec3'],
+                                            'psnr') + '\n',
+        files['toplevel-psnr-new.json'])
+    self.assertIn('toplevel-psnr-single.json', files)
+
+  def test_CriterionFilesAreWrittenLikeCompareJson(self):
+    files = page_generator.CriterionFiles('psnr', CODEC_NAMES, DATATABLE,
+                                          SINGLE_CONFIG_DATATABLE)
+    output = StringIO.StringIO()
+    json_stream.JsonWriter(output).Write(page_generator.ComparisonInfo(
+        CODEC_NAMES[1:], DATATABLE, SINGLE_CONFIG_DATATABLE))
+    self.assertEquals(output.getvalue(), files['codec2-codec3-psnr.json'])
+    self.assertNotIn(' \n', files['codec2-codec3-psnr.json'])
+
+  def test_CriterionOutputsMatchFiles(self):
+    files = page_generator.CriterionFiles('psnr', CODEC_NAMES, DATATABLE,
+                                          SINGLE_CONFIG_DATATABLE)
+    outputs = page_generator.CriterionOutputs(
+        'psnr', ['codec1', 'codec2', 'codec3'])
+    self.assertEquals(sorted(files), sorted(outputs))
+    self.assertEquals(['codec2', 'codec3'],
+                      outputs['codec2-codec3-psnr-single.json'])
+    self.assertEquals(['codec1', 'codec2', 'codec3'],
+                      outputs['toplevel-psnr-new.json'])
+
+  def test_CriterionFilesOnlyWritesRequestedFiles(self):
+    wanted = set(['codec1-codec2-psnr.json', 'toplevel-psnr-single.json'])
+    files = page_generator.CriterionFiles('psnr', CODEC_NAMES, DATATABLE,
+                                          SINGLE_CONFIG_DATATABLE,
+                                          filenames=wanted)
+    self.assertEquals(wanted, set(files))
+
+  def test_WriteFiles(self):
+    directory = tempfile.mkdtemp()
+    try:
+      page_generator.WriteFiles(directory, {'a.json': '{}\n',
+                                            'b.json': '[]\n'})
+      self.assertEquals(['a.json', 'b.json'], sorted(os.listdir(directory)))
+      with open(os.path.join(directory, 'b.json')) as written_file:
+        self.assertEquals('[]\n', written_file.read())
+    finally:
+      shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Records of what each generated page was computed from.
+
+A Manifest maps the name of each generated file to the fingerprints of
+its inputs: the result files of a codec, or another generated file.
+When the fingerprints are the same as last time, and the file is still
+there, the file does not need to be generated again.
+
+The fingerprint of a codec's results covers the name, size and
+modification time of every result file in the codec's score
+directories, so it changes whenever an encoding is added or rescored.
+"""
+
+import hashlib
+import json
+import os
+
+import encoder_configuration
+import score_index
+
+
+def CodecScoreDirectories(codec_name):
+  """Returns the directories where scores for a codec are searched for,
+  as EncodingDiskCache.SearchPathForScores gives them."""
+  return [os.path.join(path, codec_name) for path in
+          [encoder_configuration.conf.workdir()] +
+          list(encoder_configuration.conf.scorepath())]
+
+
+def CodecResultsFingerprint(codec_name):
+  """Returns a string that changes when any result of a codec changes."""
+  digest = hashlib.sha1()
+  for directory in CodecScoreDirectories(codec_name):
+    filenames = score_index.IndexForDirectory(directory).ResultFilenames()
+    for filename in sorted(filenames):
+      try:
+        stat = os.stat(filename)
+      except OSError:
+        continue
+      digest.update('%s %d %r\n' % (filename, stat.st_size, stat.st_mtime))
+  return digest.hexdigest()
+
+
+def FileFingerprint(filename):
+  """Returns a hash of a file's contents, or None if it does not exist."""
+  try:
+    with open(filename, 'rb') as the_file:
+      return hashlib.sha1(the_file.read()).hexdigest()
+  except IOError:
+    return None
+
+
+class Manifest(object):
+  """The inputs of generated files, stored in a file."""
+  def __init__(self, filename):
+    self.filename = filename
+    try:
+      with open(filename, 'r') as manifest_file:
+        self.outputs = json.load(manifest_file)
+    except (IOError, ValueError):
+      self.outputs = {}
+
+  def IsCurrent(self, output_filename, inputs):
+    """Returns true if output_filename exists, and was last generated from
+    inputs, a dictionary of input name -> fingerprint."""
+    return (os.path.exists(output_filename) and
+            self.outputs.get(os.path.basename(output_filename)) == inputs)
+
+  def Record(self, output_filename, inputs):
+    self.outputs[os.path.basename(output_filename)] = inputs
+
+  def Save(self):
+    temp_filename = '%s.%d' % (self.filename, os.getpid())
+    with open(temp_filename, 'w') as manifest_file:
+      json.dump(self.outputs, manifest_file, indent=2, sort_keys=True)
+    os.rename(temp_filename, self.filename)
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the manifest of generated pages."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import encoder_configuration
+import page_manifest
+
+
+def WriteFile(filename, contents):
+  if not os.path.isdir(os.path.dirname(filename)):
+    os.makedirs(os.path.dirname(filename))
+  with open(filename, 'w') as the_file:
+    the_file.write(contents)
+
+
+class TestManifest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.manifest_filename = os.path.join(self.directory, '.manifest.json')
+    self.output = os.path.join(self.directory, 'page.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_NewOutputIsNotCurrent(self):
+    manifest = page_manifest.Manifest(self.manifest_filename)
+    WriteFile(self.output, '{}')
+    self.assertFalse(manifest.IsCurrent(self.output, {'vp8': 'abc'}))
+
+  def test_RecordedOutputIsCurrentAfterReload(self):
+    manifest = page_manifest.Manifest(self.manifest_filename)
+    WriteFile(self.output, '{}')
+    manifest.Record(self.output, {'vp8': 'abc'})
+    manifest.Save()
+    manifest = page_manifest.Manifest(self.manifest_filename)
+    self.assertTrue(manifest.IsCurrent(self.output, {'vp8': 'abc'}))
+    self.assertFalse(manifest.IsCurrent(self.output, {'vp8': 'abd'}))
+    self.assertFalse(manifest.IsCurrent(self.output, {'vp8': 'abc',
+                                                      'vp9': 'def'}))
+
+  def test_MissingOutputIsNotCurrent(self):
+    manifest = page_manifest.Manifest(self.manifest_filename)
+    manifest.Record(self.output, {'vp8': 'abc'})
+    self.assertFalse(manifest.IsCurrent(self.output, {'vp8': 'abc'}))
+
+  def test_FileFingerprint(self):
+    WriteFile(self.output, '{}')
+    fingerprint = page_manifest.FileFingerprint(self.output)
+    self.assertEquals(fingerprint, page_manifest.FileFingerprint(self.output))
+    WriteFile(self.output, '[]')
+    self.assertNotEquals(fingerprint,
+                         page_manifest.FileFingerprint(self.output))
+    self.assertIsNone(page_manifest.FileFingerprint(
+        os.path.join(self.directory, 'nonexistent')))
+
+
+class TestCodecResultsFingerprint(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.old_workdir = encoder_configuration.conf.workdir()
+    self.old_scorepath = encoder_configuration.conf.scorepath()
+    encoder_configuration.conf.override_workdir_for_test(
+        os.path.join(self.directory, 'work'))
+    encoder_configuration.conf.override_scorepath_for_test(
+        [os.path.join(self.directory, 'scores')])
+
+  def tearDown(self):
+    encoder_configuration.conf.override_workdir_for_test(self.old_workdir)
+    encoder_configuration.conf.override_scorepath_for_test(
+        self.old_scorepath)
+    shutil.rmtree(self.directory)
+
+  def test_FingerprintChangesWithResults(self):
+    empty = page_manifest.CodecResultsFingerprint('vp8')
+    WriteFile(os.path.join(self.directory, 'work', 'vp8', 'hash1', '1000',
+                           'clip.result'), '{"psnr": 30.0}')
+    one_result = page_manifest.CodecResultsFingerprint('vp8')
+    self.assertNotEquals(empty, one_result)
+    self.assertEquals(one_result,
+                      page_manifest.CodecResultsFingerprint('vp8'))
+    # Results in the score path count too.
+    WriteFile(os.path.join(self.directory, 'scores', 'vp8', 'hash2', '1000',
+                           'clip.result'), '{"psnr": 31.0}')
+    self.assertNotEquals(one_result,
+                         page_manifest.CodecResultsFingerprint('vp8'))
+    # Other codecs don't.
+    self.assertEquals(empty, page_manifest.CodecResultsFingerprint('vp9'))
+
+
+if __name__ == '__main__':
+  unittest.main()
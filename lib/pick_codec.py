@@ -11,52 +11,52 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""A codec picker."""
+"""A codec picker.
+
+The codec modules are imported when a codec is first picked, not when
+this module is imported, so that tools that only need codec names
+start quickly."""
+
+import importlib
 
 import encoder
-import ffmpeg
-import h261
-import h263
-import hevc_jm
-import libavc
-import mjpeg
-import openh264
-import vp8
-import vp8_mpeg
-import vp8_mpeg_1d
-import vp9
-import x264
-import x264_baseline
-import x264_realtime
-import x265
 
 class CodecInfo(object):
-  def __init__(self, constructor, shortname, longname):
-    self.constructor = constructor
+  def __init__(self, module_name, class_name, shortname, longname):
+    self.module_name = module_name
+    self.class_name = class_name
     self.shortname = shortname
     self.longname = longname
 
+  @property
+  def constructor(self):
+    module = importlib.import_module(self.module_name)
+    return getattr(module, self.class_name)
+
 CODEC_MAP = {
-  'vp8': CodecInfo(vp8.Vp8Codec, 'VP8', 'VP8'),
-  'vp8_mpeg' : CodecInfo(vp8_mpeg.Vp8CodecMpegMode, 'VP8MP',
+  'vp8': CodecInfo('vp8', 'Vp8Codec', 'VP8', 'VP8'),
+  'vp8_mpeg' : CodecInfo('vp8_mpeg', 'Vp8CodecMpegMode', 'VP8MP',
                          'VP8 in MPEG-compatible mode'),
-  'vp8_mpeg_1d' : CodecInfo(vp8_mpeg_1d.Vp8CodecMpeg1dMode, 'VP8M1',
+  'vp8_mpeg_1d' : CodecInfo('vp8_mpeg_1d', 'Vp8CodecMpeg1dMode', 'VP8M1',
                             'VP8 in 1-variable MPEG mode'),
-  'vp9': CodecInfo(vp9.Vp9Codec, 'VP9', 'VP9'),
-  'ffmpeg' : CodecInfo(ffmpeg.FfmpegCodec, 'FFMPEG', 'FFMPEG'),
-  'mjpeg' : CodecInfo(mjpeg.MotionJpegCodec, 'MJPEG', 'Motion JPEG'),
-  'h261': CodecInfo(h261.H261Codec, 'H261', 'H.261'),
-  'h263': CodecInfo(h263.H263Codec, 'H263', 'H.263'),
-  'x264': CodecInfo(x264.X264Codec, 'X264', 'H.264 - x264 implementation'),
-  'x264_base': CodecInfo(x264_baseline.X264BaselineCodec, 'H264-BL',
+  'vp9': CodecInfo('vp9', 'Vp9Codec', 'VP9', 'VP9'),
+  'ffmpeg' : CodecInfo('ffmpeg', 'FfmpegCodec', 'FFMPEG', 'FFMPEG'),
+  'mjpeg' : CodecInfo('mjpeg', 'MotionJpegCodec', 'MJPEG', 'Motion JPEG'),
+  'h261': CodecInfo('h261', 'H261Codec', 'H261', 'H.261'),
+  'h263': CodecInfo('h263', 'H263Codec', 'H263', 'H.263'),
+  'x264': CodecInfo('x264', 'X264Codec', 'X264',
+                    'H.264 - x264 implementation'),
+  'x264_base': CodecInfo('x264_baseline', 'X264BaselineCodec', 'H264-BL',
                          'H264 Baseline - x264 implementation'),
-  'x264_rt': CodecInfo(x264_realtime.X264RealtimeCodec, 'H264-RT',
+  'x264_rt': CodecInfo('x264_realtime', 'X264RealtimeCodec', 'H264-RT',
                        'H264 - x264 implementation, realtime settings'),
-  'x265': CodecInfo(x265.X265Codec, 'H265', 'HEVC - x265 implementation'),
-  'hevc': CodecInfo(hevc_jm.HevcCodec, 'HEVC', 'HEVC - JM implementation'),
-  'openh264': CodecInfo(openh264.OpenH264Codec, 'OpenH264',
+  'x265': CodecInfo('x265', 'X265Codec', 'H265',
+                    'HEVC - x265 implementation'),
+  'hevc': CodecInfo('hevc_jm', 'HevcCodec', 'HEVC',
+                    'HEVC - JM implementation'),
+  'openh264': CodecInfo('openh264', 'OpenH264Codec', 'OpenH264',
                         'H.264 - OpenH264 implementation'),
-  'libavc' : CodecInfo(libavc.LibavcCodec, 'LibAVC',
+  'libavc' : CodecInfo('libavc', 'LibavcCodec', 'LibAVC',
                        'H.264 - Android LibAVC implementation'),
 }
 
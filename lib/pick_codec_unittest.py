@@ -16,6 +16,8 @@
 This file is also the place for tests that cover several codecs."""
 
 import os
+import subprocess
+import sys
 import unittest
 
 import encoder
@@ -33,6 +35,26 @@ class TestPickCodec(unittest.TestCase):
                        (workdir, codec_name))
       seen_dirs.add(workdir)
 
+  def test_NamesWithoutImportingCodecs(self):
+    # Run in a fresh process, since this one has imported the codecs.
+    output = subprocess.check_output([sys.executable, '-c', '''
+import sys
+import pick_codec
+pick_codec.LongName('vp8')
+print sorted(name for name in ['vp8', 'x264', 'numpy'] if name in sys.modules)
+'''])
+    self.assertEquals('[]', output.strip())
+
+  def test_RegistryNamesCodecClasses(self):
+    for codec_name in pick_codec.AllCodecNames():
+      constructor = pick_codec.CODEC_MAP[codec_name].constructor
+      self.assertEquals(pick_codec.CODEC_MAP[codec_name].class_name,
+                        constructor.__name__)
+
+  def test_UnknownCodec(self):
+    with self.assertRaises(encoder.Error):
+      pick_codec.PickCodec('no_such_codec')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,651 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An encoding cache that keeps encoders and results in append-only logs.
+
+The EncodingDiskCache uses one file per encoder and one per result, which
+adds up to millions of small files. The EncodingLogCache instead appends
+records to a few large segment files per codec, in
+<workdir>/resultlog/<codec>/<number>.segment.
+
+Each record is a header line, "<kind> <hashname> <speed group> <clip>
+<length>", followed by <length> bytes of payload and a newline. The kinds
+are parameters (P), results as JSON without frame data (R), frame data in
+the frame_data format (F), and removal of an encoder (D). A later record
+overrides an earlier one for the same key.
+
+Every process keeps an index from key to payload offset, built by
+reading the record headers once and then only the records appended since.
+Appends and the switch to compacted segments are done under a lock, so
+several processes can share a log. A writer that dies in the middle of an
+append leaves an incomplete record at the end of a segment; readers stop
+before it, and the next append writes over it.
+
+Compaction rewrites all segments except the one being appended to into a
+single segment with only the records that are still in use. It is started
+in a background thread when enough segments have filled up, and can be
+run by hand with bin/manage_result_log, which also imports and exports the
+directory layout used by the EncodingDiskCache.
+"""
+
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import threading
+
+import encoder
+import encoder_configuration
+import frame_data
+import leaderboard
+import score_index
+
+LOG_DIRECTORY = 'resultlog'
+SEGMENT_SUFFIX = '.segment'
+# Appends go to a new segment when the last one grows past this size.
+SEGMENT_SIZE = 64 * 1024 * 1024
+# Compaction starts when there are more full segments than this.
+COMPACT_SEGMENTS = 4
+
+_PARAMETERS = 'P'
+_RESULT = 'R'
+_FRAMES = 'F'
+_REMOVE = 'D'
+_NO_PART = '-'
+_LOCK_NAME = 'lock'
+_COMPACT_LOCK_NAME = 'compact.lock'
+_COMPACT_TEMP_NAME = 'compact.tmp'
+
+
+class Error(Exception):
+  pass
+
+
+def LogDirectory(root, codec_name):
+  """Returns the log directory for a codec under a work or score directory."""
+  return os.path.join(root, LOG_DIRECTORY, codec_name)
+
+
+def _SegmentName(number):
+  return '%08d%s' % (number, SEGMENT_SUFFIX)
+
+
+def _SegmentNumber(name):
+  return int(name[:-len(SEGMENT_SUFFIX)])
+
+
+def _Record(kind, hashname, speed_group, clip, payload):
+  # pylint: disable=too-many-arguments
+  for part in (hashname, speed_group, clip):
+    if part is not None and (not part or len(part.split()) != 1):
+      raise Error('Name "%s" can not be used in a log record' % part)
+  return '%s %s %s %s %d\n%s\n' % (kind, hashname, speed_group or _NO_PART,
+                                   clip or _NO_PART, len(payload), payload)
+
+
+class ResultLog(object):
+  """The records in one log directory, and an index over them."""
+  # pylint: disable=too-many-instance-attributes
+  def __init__(self, directory):
+    self.directory = directory
+    # Segment name -> (inode, length of the part that has been indexed).
+    self.segments = {}
+    self._ClearIndex()
+
+  def _ClearIndex(self):
+    self.segments = {}
+    # Hashname -> location of the parameters.
+    self.parameters = {}
+    # (hashname, speed group, clip) -> location of the result / frames.
+    # A location is a (segment name, offset, length) tuple.
+    self.results = {}
+    self.frames = {}
+    # Hashname -> set of (speed group, clip), and the reverse.
+    self.by_encoder = {}
+    self.by_target = {}
+    # (speed group, clip) -> XOR of the score_index.HashnameValue of the
+    # encoders with a result for it.
+    self.fingerprints = {}
+
+  def _Filename(self, name):
+    return os.path.join(self.directory, name)
+
+  @contextlib.contextmanager
+  def _Lock(self, exclusive, name=_LOCK_NAME, wait=True):
+    """Holds a lock on the log. Yields false if a non-waiting lock was
+    not granted. Logs that can't be written to are read without locking."""
+    try:
+      lockfile = open(self._Filename(name), 'a')
+    except IOError:
+      lockfile = None
+    try:
+      granted = True
+      if lockfile:
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not wait:
+          operation |= fcntl.LOCK_NB
+        try:
+          fcntl.flock(lockfile, operation)
+        except IOError:
+          granted = False
+      yield granted
+    finally:
+      if lockfile:
+        lockfile.close()
+
+  def _SegmentNames(self):
+    return sorted([os.path.basename(name) for name in
+                   glob.glob(self._Filename('*' + SEGMENT_SUFFIX))])
+
+  def Refresh(self):
+    """Indexes the records added since the last refresh, by any process."""
+    if not os.path.isdir(self.directory):
+      self._ClearIndex()
+      return
+    with self._Lock(exclusive=False):
+      self._RefreshLocked()
+
+  def _RefreshLocked(self):
+    names = self._SegmentNames()
+    inodes = dict((name, os.stat(self._Filename(name)).st_ino)
+                  for name in names)
+    for name, (inode, _) in self.segments.items():
+      if inodes.get(name) != inode:
+        # Segments have been compacted; start over.
+        self._ClearIndex()
+        break
+    for name in names:
+      self._ScanSegment(name, inodes[name])
+
+  def _ScanSegment(self, name, inode):
+    """Indexes the records of a segment from where the last scan ended.
+
+    The scan ends before an incomplete record at the end of the segment."""
+    offset = self.segments.get(name, (inode, 0))[1]
+    with open(self._Filename(name), 'rb') as segment:
+      size = os.fstat(segment.fileno()).st_size
+      segment.seek(offset)
+      while True:
+        header = segment.readline()
+        if not header.endswith('\n'):
+          break
+        parts = header.split()
+        if len(parts) != 5 or not parts[4].isdigit():
+          raise Error('Bad record header in %s at offset %d' %
+                      (self._Filename(name), offset))
+        kind, hashname, speed_group, clip, length = parts
+        payload_offset = offset + len(header)
+        end = payload_offset + int(length) + 1
+        if end > size:
+          break
+        segment.seek(end - 1)
+        if segment.read(1) != '\n':
+          raise Error('Bad record in %s at offset %d' %
+                      (self._Filename(name), offset))
+        self._Apply(kind, hashname, speed_group, clip,
+                    (name, payload_offset, int(length)))
+        offset = end
+    self.segments[name] = (inode, offset)
+
+  def _Apply(self, kind, hashname, speed_group, clip, location):
+    # pylint: disable=too-many-arguments
+    key = (hashname, speed_group, clip)
+    if kind == _PARAMETERS:
+      self.parameters[hashname] = location
+    elif kind == _RESULT:
+      self.results[key] = location
+      self.frames.pop(key, None)
+      self.by_encoder.setdefault(hashname, set()).add((speed_group, clip))
+      hashnames = self.by_target.setdefault((speed_group, clip), set())
+      if hashname not in hashnames:
+        hashnames.add(hashname)
+        self._ToggleFingerprint(hashname, (speed_group, clip))
+    elif kind == _FRAMES:
+      self.frames[key] = location
+    elif kind == _REMOVE:
+      self.parameters.pop(hashname, None)
+      for target in self.by_encoder.pop(hashname, set()):
+        self.results.pop((hashname,) + target, None)
+        self.frames.pop((hashname,) + target, None)
+        self.by_target[target].discard(hashname)
+        self._ToggleFingerprint(hashname, target)
+    else:
+      raise Error('Unknown record kind %s in %s' % (kind, self.directory))
+
+  def _ToggleFingerprint(self, hashname, target):
+    self.fingerprints[target] = (self.fingerprints.get(target, 0) ^
+                                 score_index.HashnameValue(hashname))
+
+  def Fingerprint(self, speed_group, clip):
+    """Returns the XOR of the score_index.HashnameValue of the encoders
+    with a result for a speed group and clip."""
+    return self.fingerprints.get((speed_group, clip), 0)
+
+  def _ReadPayload(self, table_name, key):
+    """Returns the payload stored at key in one of the index tables,
+    or None if there is none.
+
+    The index is refreshed once if the segment has been compacted away."""
+    for _ in range(2):
+      location = getattr(self, table_name).get(key)
+      if location is None:
+        return None
+      name, offset, length = location
+      try:
+        with open(self._Filename(name), 'rb') as segment:
+          if os.fstat(segment.fileno()).st_ino == self.segments[name][0]:
+            segment.seek(offset)
+            return segment.read(length)
+      except IOError:
+        pass
+      self.Refresh()
+    raise Error('Log %s changed while reading' % self.directory)
+
+  def Append(self, records):
+    """Appends (kind, hashname, speed group, clip, payload) records."""
+    if not os.path.isdir(self.directory):
+      os.makedirs(self.directory)
+    data = ''.join([_Record(*record) for record in records])
+    with self._Lock(exclusive=True):
+      self._RefreshLocked()
+      names = self._SegmentNames()
+      if not names:
+        name = _SegmentName(1)
+      elif os.path.getsize(self._Filename(names[-1])) >= SEGMENT_SIZE:
+        name = _SegmentName(_SegmentNumber(names[-1]) + 1)
+        names.append(name)
+      else:
+        name = names[-1]
+      with open(self._Filename(name), 'ab') as segment:
+        # Drop what a writer that died left of its records.
+        segment.truncate(self.segments.get(name, (None, 0))[1])
+        # One write, so that a reader without the lock (on a read-only
+        # log) sees as little of a half record as possible.
+        segment.write(data)
+      self._RefreshLocked()
+    if len(names) > COMPACT_SEGMENTS + 1:
+      CompactInBackground(self.directory)
+
+  def Hashnames(self):
+    return self.parameters.keys()
+
+  def HasParameters(self, hashname):
+    return hashname in self.parameters
+
+  def ReadParameters(self, hashname):
+    return self._ReadPayload('parameters', hashname)
+
+  def ResultKeys(self, hashname=None, speed_group=None, clip=None):
+    """Returns the (hashname, speed group, clip) keys of stored results
+    matching the parts that are given."""
+    if hashname is not None:
+      keys = [(hashname, this_speed_group, this_clip)
+              for this_speed_group, this_clip
+              in self.by_encoder.get(hashname, ())]
+    elif speed_group is not None and clip is not None:
+      return [(this_hashname, speed_group, clip)
+              for this_hashname in self.by_target.get((speed_group, clip), ())]
+    else:
+      keys = self.results.keys()
+    return [key for key in keys
+            if (speed_group is None or key[1] == speed_group)
+            and (clip is None or key[2] == clip)]
+
+  def HasResult(self, key):
+    return key in self.results
+
+  def ReadResult(self, key):
+    return self._ReadPayload('results', key)
+
+  def ReadFrames(self, key):
+    """Returns the frame entries stored for a result, or None."""
+    data = self._ReadPayload('frames', key)
+    if data is None:
+      return None
+    return frame_data.UnpackFrames(data, name='Frames for %s/%s/%s' % key)
+
+  def Compact(self):
+    """Rewrites all segments but the last into one, dropping the records
+    that have been overridden. Returns false if another compaction is
+    running."""
+    with self._Lock(exclusive=True, name=_COMPACT_LOCK_NAME,
+                    wait=False) as granted:
+      if not granted:
+        return False
+      with self._Lock(exclusive=True):
+        names = self._SegmentNames()
+        if not names:
+          return True
+        # New records go to a new segment while the old ones are rewritten.
+        open(self._Filename(
+            _SegmentName(_SegmentNumber(names[-1]) + 1)), 'ab').close()
+      snapshot = ResultLog(self.directory)
+      for name in names:
+        snapshot._ScanSegment(  # pylint: disable=protected-access
+            name, os.stat(self._Filename(name)).st_ino)
+      temp_filename = self._Filename(_COMPACT_TEMP_NAME)
+      with open(temp_filename, 'wb') as compacted:
+        snapshot._WriteLiveRecords(compacted)  # pylint: disable=protected-access
+        compacted.flush()
+        os.fsync(compacted.fileno())
+      with self._Lock(exclusive=True):
+        os.rename(temp_filename, self._Filename(names[-1]))
+        for name in names[:-1]:
+          os.remove(self._Filename(name))
+    return True
+
+  def _WriteLiveRecords(self, output):
+    for hashname in sorted(self.parameters):
+      output.write(_Record(_PARAMETERS, hashname, None, None,
+                           self.ReadParameters(hashname)))
+    for key in sorted(self.results):
+      output.write(_Record(_RESULT, key[0], key[1], key[2],
+                           self.ReadResult(key)))
+      if key in self.frames:
+        output.write(_Record(_FRAMES, key[0], key[1], key[2],
+                             self._ReadPayload('frames', key)))
+
+
+# pylint: disable=invalid-name
+_compactions = {}
+_logs = {}
+
+
+def CompactInBackground(directory):
+  """Starts compacting a log in a separate thread, and returns the thread.
+
+  If this process is already compacting the log, that thread is returned.
+  The thread uses its own ResultLog object; other objects for the same
+  directory see the compacted segments on their next refresh."""
+  thread = _compactions.get(directory)
+  if thread is None or not thread.is_alive():
+    thread = threading.Thread(target=ResultLog(directory).Compact,
+                              name='compact %s' % directory)
+    thread.start()
+    _compactions[directory] = thread
+  return thread
+
+
+def LogForDirectory(directory):
+  """Returns the process-wide ResultLog for a log directory."""
+  directory = os.path.abspath(directory)
+  if directory not in _logs:
+    _logs[directory] = ResultLog(directory)
+  return _logs[directory]
+
+
+class EncodingLogCache(object):
+  """Encoder and encoding information, saved in append-only logs."""
+  def __init__(self, context, scoredir=None):
+    self.context = context
+    self.bad_encodings = {}
+    if scoredir:
+      root = os.path.join(encoder_configuration.conf.sysdir(), scoredir)
+    else:
+      root = encoder_configuration.conf.workdir()
+    # The workdir is still needed as scratch space for executing encodings.
+    self.workdir = os.path.join(root, context.codec.name)
+    if not os.path.isdir(self.workdir):
+      os.mkdir(self.workdir)
+    self.log = LogForDirectory(LogDirectory(root, context.codec.name))
+    self.leaderboards = leaderboard.LeaderboardStore(context, root)
+    # Parsed parameter sets, keyed by hashname.
+    self.parameters = {}
+
+  def WorkDir(self):
+    return self.workdir
+
+  def SearchPathForScores(self):
+    """Returns the logs that will be searched for scores, refreshed.
+
+    This is the log in the work directory (always first) and the logs
+    in the directories of the "scorepath"."""
+    logs = [self.log]
+    logs.extend([LogForDirectory(LogDirectory(this_path,
+                                              self.context.codec.name))
+                 for this_path in encoder_configuration.conf.scorepath()])
+    for log in logs:
+      log.Refresh()
+    return logs
+
+  def _ParseResult(self, log, key):
+    # pylint: disable=no-self-use
+    try:
+      result = json.loads(log.ReadResult(key))
+    except ValueError:
+      raise encoder.Error('Unexpected JSON error in %s, encoding was %s/%s/%s'
+                          % ((log.directory,) + key))
+    if 'frame' in result:
+      return result
+    return frame_data.LazyFrameResult(result, key, reader=log.ReadFrames)
+
+  def _QueryScoredEncodings(self, my_encoder=None, bitrate=None,
+                            videofile=None):
+    hashname = my_encoder.Hashname() if my_encoder else None
+    speed_group = self.context.codec.SpeedGroup(bitrate) if bitrate else None
+    clip = videofile.basename if videofile else None
+    candidates = []
+    for log in self.SearchPathForScores():
+      for key in log.ResultKeys(hashname, speed_group, clip):
+        try:
+          candidate = encoder.Encoding(
+              my_encoder or encoder.Encoder(self.context, filename=key[0]),
+              bitrate or _SpeedGroupToBitrate(key[1]),
+              videofile or encoder.Videofile(key[2] + '.yuv'))
+          candidate.result = self._ParseResult(log, key)
+          candidates.append(candidate)
+        except encoder.Error as err:
+          self.bad_encodings[key] = err
+    return candidates
+
+  def AllScoredEncodings(self, bitrate, videofile):
+    return self._QueryScoredEncodings(bitrate=bitrate, videofile=videofile)
+
+  def AllScoredRates(self, my_encoder, videofile):
+    return self._QueryScoredEncodings(my_encoder=my_encoder,
+                                      videofile=videofile)
+
+  def AllScoredEncodingsForEncoder(self, my_encoder):
+    return self._QueryScoredEncodings(my_encoder=my_encoder)
+
+  def StoreEncoder(self, my_encoder):
+    """Appends an encoder to the log, unless it is there already."""
+    if my_encoder.stored:
+      return
+    self.log.Refresh()
+    if not self.log.HasParameters(my_encoder.Hashname()):
+      self.log.Append([(_PARAMETERS, my_encoder.Hashname(), None, None,
+                        my_encoder.parameters.ToString())])
+    my_encoder.stored = True
+
+  def ReadEncoderParameters(self, filename):
+    """Returns the parameters of an encoder.
+
+    The filename may be a hashname or a path ending in the hashname."""
+    hashname = os.path.basename(filename)
+    if hashname not in self.parameters:
+      for log in self.SearchPathForScores():
+        parameters = log.ReadParameters(hashname)
+        if parameters is not None:
+          self.parameters[hashname] = encoder.OptionValueSet(
+              self.context.codec.option_set, parameters,
+              formatter=self.context.codec.option_formatter)
+          break
+      else:
+        return None
+    return self.parameters[hashname]
+
+  def AllEncoderFilenames(self, only_workdir=False):
+    if only_workdir:
+      logs = [self.log]
+      self.log.Refresh()
+    else:
+      logs = self.SearchPathForScores()
+    filenames = []
+    for log in logs:
+      filenames.extend([os.path.join(self.workdir, hashname)
+                        for hashname in log.Hashnames()])
+    return filenames
+
+  def RemoveEncoder(self, hashname):
+    hashname = os.path.basename(hashname)
+    self.log.Append([(_REMOVE, hashname, None, None, '')])
+    self.parameters.pop(hashname, None)
+
+  def StoreEncoding(self, encoding):
+    """Appends the result of an encoding to the log, if it has been
+    executed."""
+    if not encoding.result:
+      return
+    self.log.Append(_ResultRecords(
+        (encoding.encoder.Hashname(),
+         self.context.codec.SpeedGroup(encoding.bitrate),
+         encoding.videofile.basename),
+        encoding.result))
+
+  def HasResult(self, encoding):
+    key = (encoding.encoder.Hashname(),
+           self.context.codec.SpeedGroup(encoding.bitrate),
+           encoding.videofile.basename)
+    return any(log.HasResult(key) for log in self.SearchPathForScores())
+
+  def TriedHashnames(self, bitrate, videofile):
+    """Returns the set of hashnames of the encoders with a stored result
+    for a target."""
+    speed_group = self.context.codec.SpeedGroup(bitrate)
+    hashnames = set()
+    for log in self.SearchPathForScores():
+      hashnames.update(key[0] for key in
+                       log.ResultKeys(None, speed_group, videofile.basename))
+    return hashnames
+
+  def ScoredFingerprint(self, bitrate, videofile):
+    """Returns a string that changes when the set of encoders with a
+    result for a target's speed group and clip changes."""
+    speed_group = self.context.codec.SpeedGroup(bitrate)
+    return ','.join('%x' % log.Fingerprint(speed_group, videofile.basename)
+                    for log in self.SearchPathForScores())
+
+  def ReadEncodingResult(self, encoding):
+    """Reads an encoding result back from the logs, if present.
+
+    None is returned if there is no result stored."""
+    key = (encoding.encoder.Hashname(),
+           self.context.codec.SpeedGroup(encoding.bitrate),
+           encoding.videofile.basename)
+    for log in self.SearchPathForScores():
+      if log.HasResult(key):
+        return self._ParseResult(log, key)
+    return None
+
+  def ImportDiskCache(self, directories=None):
+    """Copies encoders and results from a directory tree into the log.
+
+    The directories default to the search path of the EncodingDiskCache
+    for this codec. Entries that are already in the log, or that come
+    from a directory later on the path, are not copied.
+    Returns the number of encoders and results imported."""
+    if directories is None:
+      directories = [self.workdir]
+      directories.extend(
+          [os.path.join(this_path, self.context.codec.name)
+           for this_path in encoder_configuration.conf.scorepath()])
+    self.log.Refresh()
+    encoder_count = 0
+    result_count = 0
+    for directory in directories:
+      for parameterfile_name in glob.glob(os.path.join(directory, '*',
+                                                       'parameters')):
+        encoder_dir = os.path.dirname(parameterfile_name)
+        hashname = os.path.basename(encoder_dir)
+        records = []
+        if not self.log.HasParameters(hashname):
+          with open(parameterfile_name, 'r') as parameterfile:
+            records.append((_PARAMETERS, hashname, None, None,
+                            parameterfile.read()))
+          encoder_count += 1
+        for result_filename in glob.glob(os.path.join(encoder_dir, '*',
+                                                      '*.result')):
+          key = (hashname,
+                 os.path.basename(os.path.dirname(result_filename)),
+                 os.path.splitext(os.path.basename(result_filename))[0])
+          if self.log.HasResult(key):
+            continue
+          records.extend(_ResultFileRecords(key, result_filename))
+          result_count += 1
+        if records:
+          self.log.Append(records)
+    return encoder_count, result_count
+
+  def ExportDiskCache(self, directory):
+    """Writes the encoders and results in the log to a directory tree,
+    in the layout used by the EncodingDiskCache.
+
+    Returns the number of encoders and results exported."""
+    self.log.Refresh()
+    for hashname in self.log.Hashnames():
+      encoder_dir = os.path.join(directory, hashname)
+      if not os.path.isdir(encoder_dir):
+        os.makedirs(encoder_dir)
+      with open(os.path.join(encoder_dir, 'parameters'), 'w') as parameterfile:
+        parameterfile.write(self.log.ReadParameters(hashname))
+    result_keys = self.log.ResultKeys()
+    for key in result_keys:
+      dirname = os.path.join(directory, key[0], key[1])
+      if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+      filename = os.path.join(dirname, key[2] + '.result')
+      entries = self.log.ReadFrames(key)
+      if entries is not None:
+        frame_data.WriteFrameFile(frame_data.FrameFilename(filename), entries)
+      with open(filename, 'w') as resultfile:
+        resultfile.write(self.log.ReadResult(key))
+    return len(self.log.Hashnames()), len(result_keys)
+
+
+def _SpeedGroupToBitrate(speed_group):
+  # Same convention as the disk cache: speed groups that are not numbers
+  # give an unknown (zero) bitrate.
+  try:
+    return int(speed_group)
+  except ValueError:
+    return 0
+
+
+def _ResultRecords(key, result):
+  """Returns the records for storing a result, with the frame data
+  in a record of its own if it can be packed."""
+  entries = frame_data.FrameEntries(result)
+  if not entries or not frame_data.Packable(entries):
+    return [(_RESULT, key[0], key[1], key[2],
+             json.dumps(frame_data.FullResult(result)))]
+  return [(_RESULT, key[0], key[1], key[2],
+           json.dumps(frame_data.WithoutFrames(result))),
+          (_FRAMES, key[0], key[1], key[2], frame_data.PackFrames(entries))]
+
+
+def _ResultFileRecords(key, result_filename):
+  """Returns the records for a result file written by the disk cache."""
+  with open(result_filename, 'r') as resultfile:
+    result_string = resultfile.read()
+  try:
+    result = json.loads(result_string)
+  except ValueError:
+    # Kept as it is; it will show up in bad_encodings when read.
+    return [(_RESULT, key[0], key[1], key[2], result_string)]
+  entries = frame_data.ReadFrameFile(
+      frame_data.FrameFilename(result_filename))
+  if entries is not None:
+    result.update(entries)
+  return _ResultRecords(key, result)
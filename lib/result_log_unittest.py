@@ -0,0 +1,271 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the append-only result log."""
+
+import glob
+import os
+import unittest
+
+import encoder
+import encoder_configuration
+import optimizer
+import test_tools
+
+import result_log
+from sqlite_cache_unittest import MakeContextAndCache
+from sqlite_cache_unittest import MakeEncoding
+from sqlite_cache_unittest import StorageOnlyCodec
+from sqlite_cache_unittest import StorageOnlyContext
+
+
+def MakeLogCache(scoredir=None):
+  return MakeContextAndCache(result_log.EncodingLogCache, scoredir)
+
+
+class TestResultLog(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestResultLog, self).setUp()
+    test_tools.EmptyWorkDirectory()
+    self.directory = os.path.join(encoder_configuration.conf.workdir(),
+                                  'testlog')
+
+  def testEmptyLog(self):
+    log = result_log.ResultLog(self.directory)
+    log.Refresh()
+    self.assertEquals([], log.ResultKeys())
+    self.assertIsNone(log.ReadResult(('abc', '100', 'clip')))
+
+  def testAppendAndRead(self):
+    log = result_log.ResultLog(self.directory)
+    log.Append([('P', 'abc', None, None, '--foo=bar'),
+                ('R', 'abc', '100', 'clip', '{"psnr": 40.0}\nmore')])
+    self.assertEquals('--foo=bar', log.ReadParameters('abc'))
+    self.assertEquals('{"psnr": 40.0}\nmore',
+                      log.ReadResult(('abc', '100', 'clip')))
+    self.assertEquals([('abc', '100', 'clip')],
+                      log.ResultKeys(speed_group='100', clip='clip'))
+    self.assertEquals([], log.ResultKeys(hashname='abc', clip='other'))
+
+  def testOtherWritersAreSeen(self):
+    log = result_log.ResultLog(self.directory)
+    log.Append([('R', 'abc', '100', 'clip', '1')])
+    other_log = result_log.ResultLog(self.directory)
+    other_log.Append([('R', 'abc', '100', 'clip', '2'),
+                      ('R', 'def', '100', 'clip', '3')])
+    log.Refresh()
+    self.assertEquals('2', log.ReadResult(('abc', '100', 'clip')))
+    self.assertEquals(2, len(log.ResultKeys(speed_group='100', clip='clip')))
+
+  def testTornRecordIsOverwritten(self):
+    log = result_log.ResultLog(self.directory)
+    log.Append([('R', 'abc', '100', 'clip', '1')])
+    segment_name = os.path.join(self.directory, log.segments.keys()[0])
+    for torn in ('R bbbb 1000 clip', 'R bbbb 100 clip 5\n12'):
+      with open(segment_name, 'ab') as segment:
+        segment.write(torn)
+      other_log = result_log.ResultLog(self.directory)
+      other_log.Refresh()
+      self.assertEquals([('abc', '100', 'clip')], other_log.ResultKeys())
+      other_log.Append([('R', 'def', '100', 'clip', '2')])
+      log.Refresh()
+      self.assertEquals('2', log.ReadResult(('def', '100', 'clip')))
+      self.assertEquals('1', log.ReadResult(('abc', '100', 'clip')))
+      self.assertNotIn('bbbb', open(segment_name).read())
+      log.Append([('D', 'def', None, None, '')])
+
+  def testRemoveEncoder(self):
+    log = result_log.ResultLog(self.directory)
+    log.Append([('P', 'abc', None, None, '--foo=bar'),
+                ('R', 'abc', '100', 'clip', '1'),
+                ('D', 'abc', None, None, '')])
+    self.assertEquals([], log.Hashnames())
+    self.assertEquals([], log.ResultKeys())
+
+  def testBadNamesAreRejected(self):
+    log = result_log.ResultLog(self.directory)
+    with self.assertRaises(result_log.Error):
+      log.Append([('R', 'abc', '100', 'clip with spaces', '1')])
+
+  def testCompaction(self):
+    saved_size = result_log.SEGMENT_SIZE
+    result_log.SEGMENT_SIZE = 1
+    try:
+      log = result_log.ResultLog(self.directory)
+      for value in range(3):
+        log.Append([('R', 'abc', '100', 'clip', str(value))])
+      log.Append([('P', 'def', None, None, '--foo=bar'),
+                  ('R', 'def', '100', 'clip', 'def result'),
+                  ('D', 'def', None, None, '')])
+      log.Append([('P', 'abc', None, None, '--foo=baz')])
+    finally:
+      result_log.SEGMENT_SIZE = saved_size
+    self.assertEquals(5, len(glob.glob(os.path.join(self.directory,
+                                                    '*.segment'))))
+    other_log = result_log.ResultLog(self.directory)
+    other_log.Refresh()
+    self.assertTrue(result_log.ResultLog(self.directory).Compact())
+    self.assertEquals(2, len(glob.glob(os.path.join(self.directory,
+                                                    '*.segment'))))
+    # Readers that indexed the old segments notice the change.
+    self.assertEquals('2', other_log.ReadResult(('abc', '100', 'clip')))
+    other_log.Refresh()
+    self.assertEquals(['abc'], other_log.Hashnames())
+    self.assertEquals('--foo=baz', other_log.ReadParameters('abc'))
+    self.assertEquals([('abc', '100', 'clip')], other_log.ResultKeys())
+    # Appends after compaction go to the new segment.
+    log.Append([('R', 'abc', '100', 'clip', '3')])
+    other_log.Refresh()
+    self.assertEquals('3', other_log.ReadResult(('abc', '100', 'clip')))
+
+  def testCompactInBackground(self):
+    log = result_log.ResultLog(self.directory)
+    log.Append([('R', 'abc', '100', 'clip', '1')])
+    log.Append([('R', 'abc', '100', 'clip', '2')])
+    result_log.CompactInBackground(self.directory).join()
+    log.Refresh()
+    self.assertEquals('2', log.ReadResult(('abc', '100', 'clip')))
+
+
+class TestEncodingLogCache(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestEncodingLogCache, self).setUp()
+    test_tools.EmptyWorkDirectory()
+
+  def testStoreFetchEncoder(self):
+    context, cache = MakeLogCache()
+    my_encoder = MakeEncoding(context, 123).encoder
+    cache.StoreEncoder(my_encoder)
+    new_encoder_data = cache.ReadEncoderParameters(
+        os.path.join(cache.WorkDir(), my_encoder.Hashname()))
+    self.assertEquals(new_encoder_data, my_encoder.parameters)
+    self.assertIsNone(cache.ReadEncoderParameters('nosuchhash'))
+
+  def testStoreFetchEncoding(self):
+    context, cache = MakeLogCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    my_encoding.result = None
+    self.assertEquals({'foo': 'bar'}, cache.ReadEncodingResult(my_encoding))
+
+  def testFrameDataIsReadWhenAskedFor(self):
+    context, cache = MakeLogCache()
+    frames = [{'size': 800}, {'size': 80}]
+    MakeEncoding(context, 123, {'foo': 'bar', 'frame': frames}).Store()
+    result = cache.ReadEncodingResult(MakeEncoding(context, 123))
+    self.assertEquals({'foo': 'bar'}, result.result)
+    self.assertEquals(frames, result['frame'])
+
+  def testHasResult(self):
+    context, cache = MakeLogCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    self.assertTrue(MakeEncoding(context, 123).Tried())
+    self.assertFalse(MakeEncoding(context, 246).Tried())
+    self.assertEquals(set([my_encoding.encoder.Hashname()]),
+                      cache.TriedHashnames(123, my_encoding.videofile))
+    self.assertEquals(set(), cache.TriedHashnames(246, my_encoding.videofile))
+
+  def testStoreMultipleEncodings(self):
+    context, cache = MakeLogCache()
+    MakeEncoding(context, 123, {'foo': 'bar'}).Store()
+    my_encoding = MakeEncoding(context, 246, {'foo': 'bar'})
+    my_encoding.Store()
+    videofile = my_encoding.videofile
+    self.assertEquals(2, len(cache.AllScoredRates(my_encoding.encoder,
+                                                  videofile)))
+    result = cache.AllScoredEncodings(123, videofile)
+    self.assertEquals(1, len(result))
+    self.assertEquals(123, result[0].bitrate)
+    result = cache.AllScoredEncodingsForEncoder(my_encoding.encoder)
+    self.assertEquals(2, len(result))
+    self.assertEquals('foo_640_480_20.yuv', result[0].videofile.filename)
+
+  def testAllEncoderFilenamesAndRemove(self):
+    context, cache = MakeLogCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    files = cache.AllEncoderFilenames()
+    self.assertEquals(1, len(files))
+    cache.RemoveEncoder(files[0])
+    self.assertEquals(0, len(cache.AllEncoderFilenames()))
+    self.assertIsNone(cache.ReadEncodingResult(my_encoding))
+
+  def testBrokenStoredEncoding(self):
+    context, cache = MakeLogCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    cache.log.Append([('R', my_encoding.encoder.Hashname(), '123',
+                       'foo_640_480_20', 'not json')])
+    self.assertFalse(cache.AllScoredEncodingsForEncoder(my_encoding.encoder))
+    self.assertEquals(1, len(cache.bad_encodings))
+
+  def testImportAndExport(self):
+    disk_context, _ = MakeContextAndCache(encoder.EncodingDiskCache)
+    frames = [{'size': 800}]
+    MakeEncoding(disk_context, 123, {'foo': 'bar', 'frame': frames}).Store()
+    MakeEncoding(disk_context, 246, {'foo': 'baz'}).Store()
+    context, cache = MakeLogCache()
+    self.assertEquals((1, 2), cache.ImportDiskCache())
+    # Importing again adds nothing.
+    self.assertEquals((0, 0), cache.ImportDiskCache())
+    self.assertEquals(frames, cache.ReadEncodingResult(
+        MakeEncoding(context, 123))['frame'])
+
+    export_dir = os.path.join(encoder_configuration.conf.sysdir(), 'exported')
+    self.assertEquals((1, 2), cache.ExportDiskCache(
+        os.path.join(export_dir, context.codec.name)))
+    exported_context, exported_cache = MakeContextAndCache(
+        encoder.EncodingDiskCache, scoredir='exported')
+    result = exported_cache.ReadEncodingResult(
+        MakeEncoding(exported_context, 123))
+    self.assertEquals({'foo': 'bar'}, result.result)
+    self.assertEquals(frames, result['frame'])
+    self.assertEquals({'foo': 'baz'}, exported_cache.ReadEncodingResult(
+        MakeEncoding(exported_context, 246)))
+
+  def testScorePathIsSearched(self):
+    other_dir = os.path.join(encoder_configuration.conf.sysdir(), 'other')
+    os.mkdir(other_dir)
+    other_context, _ = MakeLogCache(scoredir='other')
+    MakeEncoding(other_context, 123, {'foo': 'other'}).Store()
+    context, cache = MakeLogCache()
+    self.assertIsNone(cache.ReadEncodingResult(MakeEncoding(context, 123)))
+    encoder_configuration.conf.override_scorepath_for_test([other_dir])
+    self.assertEquals({'foo': 'other'},
+                      cache.ReadEncodingResult(MakeEncoding(context, 123)))
+    self.assertEquals(1, len(cache.AllEncoderFilenames()))
+    self.assertEquals(0, len(cache.AllEncoderFilenames(only_workdir=True)))
+
+  def testUsableWithOptimizer(self):
+    my_optimizer = optimizer.Optimizer(
+        StorageOnlyCodec(), cache_class=result_log.EncodingLogCache)
+    my_encoding = MakeEncoding(my_optimizer.context, 123,
+                               {'psnr': 40.0, 'bitrate': 100})
+    my_encoding.Store()
+    best = my_optimizer.BestEncoding(123, my_encoding.videofile)
+    self.assertEquals(my_encoding.encoder.Hashname(), best.encoder.Hashname())
+    self.assertEquals(40.0, best.Result()['psnr'])
+
+  def testCodecsAreSeparate(self):
+    context, _ = MakeLogCache()
+    MakeEncoding(context, 123, {'foo': 'bar'}).Store()
+    other_context = StorageOnlyContext()
+    other_context.codec = StorageOnlyCodec(name='other')
+    other_context.cache = result_log.EncodingLogCache(other_context)
+    self.assertEquals(0, len(other_context.cache.AllEncoderFilenames()))
+
+
+if __name__ == '__main__':
+  unittest.main()
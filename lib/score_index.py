@@ -0,0 +1,363 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory index over score directories.
+
+A score directory has the layout <hashname>/<speed group>/<clip>.result,
+with a "parameters" file in each <hashname> directory.
+The EncodingDiskCache asks the same questions of the same directories
+many times in a single run, so this module keeps one index per directory
+for the lifetime of the process.
+
+Each directory level is listed once, and listed again only when its
+modification time (or inode) changes. Directories are checked for
+changes at most every CHECK_INTERVAL_SECONDS, so a query does not stat
+every directory it covers each time it is made. Writers in this process
+call ForgetFile or ForgetDirectory, and their changes are seen at once;
+changes made by other processes may take that long to show up.
+
+Each index also keeps a fingerprint of the set of encoders with a result
+for each speed group and clip, updated as listings change, so that
+leaderboards can tell whether they are up to date without listing.
+
+File contents (the text of results and parameter files) are kept in memory
+and reread only when the file's modification time or size changes.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+# Directories modified less than this many seconds ago may be modified
+# again without their mtime changing (on filesystems with coarse
+# timestamps), so their listings are not trusted.
+_RACY_SECONDS = 2
+
+# How long a directory that has been checked is taken to be unchanged.
+CHECK_INTERVAL_SECONDS = 10
+
+RESULT_SUFFIX = '.result'
+
+
+def _DirectoryStamp(dirname):
+  """Returns an identifier that changes when a directory listing changes.
+
+  None is returned for directories that do not exist, and for directories
+  that have been modified so recently that the listing can't be trusted."""
+  try:
+    stat = os.stat(dirname)
+  except OSError:
+    return None
+  if time.time() - stat.st_mtime < _RACY_SECONDS:
+    return None
+  return (stat.st_ino, stat.st_mtime)
+
+
+def _FileStamp(filename):
+  """Returns an identifier that changes when a file is rewritten."""
+  try:
+    stat = os.stat(filename)
+  except OSError:
+    return None
+  return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+
+def _Subdirectories(dirname):
+  try:
+    names = os.listdir(dirname)
+  except OSError:
+    return []
+  return [name for name in names if not name.startswith('.')
+          and os.path.isdir(os.path.join(dirname, name))]
+
+
+def _ResultClips(dirname):
+  try:
+    names = os.listdir(dirname)
+  except OSError:
+    return set()
+  return set([name[:-len(RESULT_SUFFIX)] for name in names
+              if name.endswith(RESULT_SUFFIX) and not name.startswith('.')])
+
+
+class _CachedFiles(object):
+  """File contents, kept until the file changes."""
+  def __init__(self):
+    self.contents = {}
+
+  def Read(self, filename, loader):
+    """Returns loader(file object) for the file, or None if it is missing.
+
+    Errors raised by the loader are passed on, and nothing is cached."""
+    stamp = _FileStamp(filename)
+    if stamp is None:
+      self.contents.pop(filename, None)
+      return None
+    cached = self.contents.get(filename)
+    if cached and cached[0] == stamp:
+      return cached[1]
+    with open(filename, 'r') as the_file:
+      value = loader(the_file)
+    self.contents[filename] = (stamp, value)
+    return value
+
+  def Forget(self, filename):
+    self.contents.pop(filename, None)
+
+
+# pylint: disable=invalid-name
+_cached_files = _CachedFiles()
+
+
+def _ReadString(the_file):
+  return the_file.read()
+
+
+def ReadResultFile(filename):
+  """Returns the parsed result in a .result file, or None if missing.
+
+  The file's text is cached, and parsed on each call, so that callers get
+  a result of their own to modify. Parsing is faster than copying a
+  parsed result, mostly for old results with the frame data in them.
+  Raises ValueError if the file is not valid JSON."""
+  text = _cached_files.Read(filename, _ReadString)
+  if text is None:
+    return None
+  return json.loads(text)
+
+
+def ReadParameterFile(filename):
+  """Returns the contents of a parameters file, or None if missing."""
+  return _cached_files.Read(filename, _ReadString)
+
+
+def HashnameValue(hashname):
+  """Returns a number for a hashname. The XOR of these numbers is a
+  fingerprint of a set of hashnames that can be updated one at a time."""
+  return int(hashlib.md5(hashname).hexdigest(), 16)
+
+
+def ForgetFile(filename):
+  """Drops cached contents of a file, and has the indexes look at its
+  directory again. Used by writers of the file; a result file that has
+  been written or removed is in the indexes' listings at once."""
+  _cached_files.Forget(filename)
+  filename = os.path.abspath(filename)
+  for index in _indexes.itervalues():
+    index.Recheck(os.path.dirname(filename))
+    index.NoteFile(filename)
+
+
+def ForgetDirectory(dirname):
+  """Has the indexes look at a directory, and the directories above it,
+  again on the next query. Used by writers in the directory."""
+  dirname = os.path.abspath(dirname)
+  for index in _indexes.itervalues():
+    index.Recheck(dirname)
+    # Anything in it may have changed.
+    index.polled.clear()
+
+
+class ScoreDirectoryIndex(object):
+  """The set of (hashname, speed group, clip) results in one directory."""
+  def __init__(self, path, check_interval=CHECK_INTERVAL_SECONDS):
+    self.path = path
+    self.check_interval = check_interval
+    self.stamps = {}
+    # Directory -> time it was last checked for changes.
+    self.checked = {}
+    # Hashname -> speed group -> set of clip names.
+    self.encoders = {}
+    # (speed group, clip) -> XOR of the HashnameValue of the encoders
+    # with a result for it.
+    self.fingerprints = {}
+    # Speed group -> time all encoders were last checked for it.
+    self.polled = {}
+
+  def Recheck(self, dirname):
+    """Has the next query check dirname, and the directories between it
+    and the score directory, for changes."""
+    while dirname == self.path or dirname.startswith(self.path + os.sep):
+      self.checked.pop(dirname, None)
+      dirname = os.path.dirname(dirname)
+
+  def _Changed(self, dirname):
+    """Returns true if dirname needs to be listed again."""
+    now = time.time()
+    if (dirname in self.stamps and
+        now - self.checked.get(dirname, 0) < self.check_interval):
+      return False
+    stamp = _DirectoryStamp(dirname)
+    if stamp is None:
+      self.stamps.pop(dirname, None)
+      return True
+    self.checked[dirname] = now
+    if self.stamps.get(dirname) == stamp:
+      return False
+    self.stamps[dirname] = stamp
+    return True
+
+  def _SetClips(self, hashname, speed_group, clips):
+    """Sets the clips with a result for an encoder and speed group, or
+    removes the speed group if clips is None, updating the fingerprints."""
+    speed_groups = self.encoders.get(hashname)
+    if speed_groups is None:
+      if clips is None:
+        return
+      speed_groups = self.encoders.setdefault(hashname, {})
+    old_clips = speed_groups.get(speed_group) or set()
+    for clip in old_clips.symmetric_difference(clips or set()):
+      key = (speed_group, clip)
+      self.fingerprints[key] = (self.fingerprints.get(key, 0) ^
+                                HashnameValue(hashname))
+    if clips is None:
+      speed_groups.pop(speed_group, None)
+    else:
+      speed_groups[speed_group] = clips
+
+  def NoteFile(self, filename):
+    """Brings the listing up to date for a result file that has been
+    written or removed."""
+    if not filename.startswith(self.path + os.sep):
+      return
+    parts = filename[len(self.path) + 1:].split(os.sep)
+    if len(parts) != 3 or not parts[2].endswith(RESULT_SUFFIX):
+      return
+    hashname, speed_group, clip_file = parts
+    clips = self.encoders.get(hashname, {}).get(speed_group)
+    if clips is None:
+      clips = _ResultClips(os.path.dirname(filename))
+    else:
+      clips = set(clips)
+      clip = clip_file[:-len(RESULT_SUFFIX)]
+      if os.path.isfile(filename):
+        clips.add(clip)
+      else:
+        clips.discard(clip)
+    self._SetClips(hashname, speed_group, clips)
+
+  def _RefreshTop(self):
+    if not self._Changed(self.path):
+      return
+    hashnames = set(_Subdirectories(self.path))
+    for hashname in set(self.encoders) - hashnames:
+      self._DropEncoder(hashname)
+    for hashname in hashnames:
+      self.encoders.setdefault(hashname, {})
+
+  def _DropEncoder(self, hashname):
+    encoder_dir = os.path.join(self.path, hashname)
+    for speed_group in self.encoders.get(hashname, {}).keys():
+      self._SetClips(hashname, speed_group, None)
+      self.stamps.pop(os.path.join(encoder_dir, speed_group), None)
+    self.encoders.pop(hashname, None)
+    self.stamps.pop(encoder_dir, None)
+
+  def _RefreshEncoder(self, hashname):
+    encoder_dir = os.path.join(self.path, hashname)
+    if not self._Changed(encoder_dir):
+      return
+    speed_groups = self.encoders.setdefault(hashname, {})
+    present = set(_Subdirectories(encoder_dir))
+    for speed_group in set(speed_groups) - present:
+      self._SetClips(hashname, speed_group, None)
+      self.stamps.pop(os.path.join(encoder_dir, speed_group), None)
+    for speed_group in present:
+      speed_groups.setdefault(speed_group, None)
+
+  def _RefreshSpeedGroup(self, hashname, speed_group):
+    speed_group_dir = os.path.join(self.path, hashname, speed_group)
+    if not self._Changed(speed_group_dir):
+      return
+    if os.path.isdir(speed_group_dir):
+      self._SetClips(hashname, speed_group, _ResultClips(speed_group_dir))
+    else:
+      self._SetClips(hashname, speed_group, None)
+
+  def Fingerprint(self, speed_group, clip):
+    """Returns the XOR of the HashnameValue of the encoders with a result
+    for a speed group and clip.
+
+    The encoders are checked for changes at most once per check interval;
+    in between, this is a lookup."""
+    now = time.time()
+    if now - self.polled.get(speed_group, 0) >= self.check_interval:
+      self._RefreshTop()
+      for hashname in list(self.encoders):
+        self._RefreshEncoder(hashname)
+        if speed_group in self.encoders.get(hashname, {}):
+          self._RefreshSpeedGroup(hashname, speed_group)
+      self.polled[speed_group] = now
+    return self.fingerprints.get((speed_group, clip), 0)
+
+  def ResultFilename(self, hashname, speed_group, clip):
+    """Returns the name of a result file, or None if it does not exist."""
+    self._RefreshSpeedGroup(hashname, speed_group)
+    clips = self.encoders.get(hashname, {}).get(speed_group)
+    if clips and clip in clips:
+      return os.path.join(self.path, hashname, speed_group,
+                          clip + RESULT_SUFFIX)
+    return None
+
+  def ResultFilenames(self, hashname=None, speed_group=None, clip=None):
+    """Returns the result files matching the given parts.
+
+    Parts that are None match anything, so this works like a glob
+    over <hashname>/<speed group>/<clip>.result."""
+    self._RefreshTop()
+    if hashname is None:
+      hashnames = self.encoders.keys()
+    elif hashname in self.encoders:
+      hashnames = [hashname]
+    else:
+      return []
+    filenames = []
+    for this_hashname in hashnames:
+      # Only the speed groups that an encoder has are looked at, so that
+      # encoders without the speed group cost no stat.
+      self._RefreshEncoder(this_hashname)
+      if speed_group is None:
+        speed_groups = self.encoders[this_hashname].keys()
+      elif speed_group in self.encoders[this_hashname]:
+        speed_groups = [speed_group]
+      else:
+        continue
+      for this_speed_group in speed_groups:
+        self._RefreshSpeedGroup(this_hashname, this_speed_group)
+        clips = self.encoders.get(this_hashname, {}).get(this_speed_group)
+        if not clips:
+          continue
+        if clip is None:
+          these_clips = clips
+        elif clip in clips:
+          these_clips = [clip]
+        else:
+          continue
+        filenames.extend([os.path.join(self.path, this_hashname,
+                                       this_speed_group,
+                                       this_clip + RESULT_SUFFIX)
+                          for this_clip in these_clips])
+    return filenames
+
+
+# pylint: disable=invalid-name
+_indexes = {}
+
+
+def IndexForDirectory(path):
+  """Returns the process-wide index for a score directory."""
+  path = os.path.abspath(path)
+  if path not in _indexes:
+    _indexes[path] = ScoreDirectoryIndex(path)
+  return _indexes[path]
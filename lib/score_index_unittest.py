@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the score directory index."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import score_index
+
+
+def AgeDirectories(top):
+  """Make all directories look old enough for their listings to be trusted."""
+  old = time.time() - 100
+  for dirname, _, _ in os.walk(top):
+    os.utime(dirname, (old, old))
+
+
+class TestScoreDirectoryIndex(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp(prefix='score-index-unittest')
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def WriteResult(self, hashname, speed_group, clip, result):
+    dirname = os.path.join(self.path, hashname, speed_group)
+    if not os.path.isdir(dirname):
+      os.makedirs(dirname)
+    filename = os.path.join(dirname, clip + '.result')
+    with open(filename, 'w') as resultfile:
+      json.dump(result, resultfile)
+    return filename
+
+  def testEmptyDirectory(self):
+    index = score_index.ScoreDirectoryIndex(self.path)
+    self.assertEquals([], index.ResultFilenames())
+    self.assertIsNone(index.ResultFilename('abc', '100', 'clip'))
+
+  def testMissingDirectory(self):
+    index = score_index.ScoreDirectoryIndex(os.path.join(self.path, 'none'))
+    self.assertEquals([], index.ResultFilenames())
+
+  def testQueries(self):
+    first = self.WriteResult('abc', '100', 'clip', {})
+    second = self.WriteResult('abc', '200', 'clip', {})
+    third = self.WriteResult('def', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.ScoreDirectoryIndex(self.path)
+    self.assertEquals(set([first, second, third]),
+                      set(index.ResultFilenames()))
+    self.assertEquals(set([first, third]),
+                      set(index.ResultFilenames(speed_group='100',
+                                                clip='clip')))
+    self.assertEquals(set([first, second]),
+                      set(index.ResultFilenames(hashname='abc')))
+    self.assertEquals([], index.ResultFilenames(hashname='abc',
+                                                clip='otherclip'))
+    self.assertEquals(first, index.ResultFilename('abc', '100', 'clip'))
+    self.assertIsNone(index.ResultFilename('abc', '300', 'clip'))
+
+  def testNewResultsAreSeen(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.ScoreDirectoryIndex(self.path, check_interval=0)
+    self.assertEquals(1, len(index.ResultFilenames(speed_group='100')))
+    # New clip in an old directory, new rate, new encoder.
+    self.WriteResult('abc', '100', 'otherclip', {})
+    self.WriteResult('abc', '200', 'clip', {})
+    self.WriteResult('def', '100', 'clip', {})
+    self.assertEquals(3, len(index.ResultFilenames(speed_group='100')))
+    self.assertEquals(3, len(index.ResultFilenames(hashname='abc')))
+    self.assertTrue(index.ResultFilename('abc', '100', 'otherclip'))
+
+  def testRemovedEncoderDisappears(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    self.WriteResult('def', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.ScoreDirectoryIndex(self.path, check_interval=0)
+    self.assertEquals(2, len(index.ResultFilenames()))
+    shutil.rmtree(os.path.join(self.path, 'abc'))
+    self.assertEquals(1, len(index.ResultFilenames()))
+    self.assertIsNone(index.ResultFilename('abc', '100', 'clip'))
+
+  def testUnchangedDirectoryIsNotListedAgain(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.ScoreDirectoryIndex(self.path)
+    self.assertEquals(1, len(index.ResultFilenames()))
+    # Sneak a file in behind the index' back, keeping the mtime.
+    self.WriteResult('abc', '100', 'hidden', {})
+    AgeDirectories(self.path)
+    index.stamps = dict((name, (os.stat(name).st_ino, os.stat(name).st_mtime))
+                        for name in index.stamps)
+    self.assertEquals(1, len(index.ResultFilenames()))
+
+  def testDirectoriesAreCheckedOncePerInterval(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.ScoreDirectoryIndex(self.path)
+    self.assertEquals(1, len(index.ResultFilenames(speed_group='100')))
+    self.WriteResult('abc', '100', 'otherclip', {})
+    self.WriteResult('def', '100', 'clip', {})
+    AgeDirectories(self.path)
+    # Checked just now, so the new results are not seen yet.
+    self.assertEquals(1, len(index.ResultFilenames(speed_group='100')))
+    # The directories above the one rechecked are checked too.
+    index.Recheck(os.path.join(self.path, 'abc', '100'))
+    self.assertEquals(3, len(index.ResultFilenames(speed_group='100')))
+
+  def testForgetFileRechecksIndexes(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    AgeDirectories(self.path)
+    index = score_index.IndexForDirectory(self.path)
+    self.assertEquals(1, len(index.ResultFilenames()))
+    score_index.ForgetFile(self.WriteResult('abc', '200', 'clip', {}))
+    self.assertEquals(2, len(index.ResultFilenames()))
+
+  def testFingerprints(self):
+    self.WriteResult('abc', '100', 'clip', {})
+    self.WriteResult('def', '100', 'clip', {})
+    self.WriteResult('def', '100', 'otherclip', {})
+    AgeDirectories(self.path)
+    index = score_index.IndexForDirectory(self.path)
+    abc = score_index.HashnameValue('abc')
+    ghi = score_index.HashnameValue('ghi')
+    both = abc ^ score_index.HashnameValue('def')
+    self.assertEquals(both, index.Fingerprint('100', 'clip'))
+    self.assertEquals(0, index.Fingerprint('200', 'clip'))
+    # Results written by this process are seen at once.
+    score_index.ForgetFile(self.WriteResult('ghi', '100', 'clip', {}))
+    self.assertEquals(both ^ ghi, index.Fingerprint('100', 'clip'))
+    # Others only when the directories are checked again.
+    shutil.rmtree(os.path.join(self.path, 'ghi'))
+    self.assertEquals(both ^ ghi, index.Fingerprint('100', 'clip'))
+    index.polled.clear()
+    self.assertEquals(both, index.Fingerprint('100', 'clip'))
+    score_index.ForgetDirectory(os.path.join(self.path, 'def'))
+    shutil.rmtree(os.path.join(self.path, 'def'))
+    self.assertEquals(abc, index.Fingerprint('100', 'clip'))
+    self.assertEquals(0, index.Fingerprint('100', 'otherclip'))
+
+  def testIndexIsSharedPerDirectory(self):
+    self.assertIs(score_index.IndexForDirectory(self.path),
+                  score_index.IndexForDirectory(self.path + '/'))
+
+
+class TestReadFiles(unittest.TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp(prefix='score-index-unittest')
+    self.filename = os.path.join(self.path, 'clip.result')
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def testReadResultFile(self):
+    self.assertIsNone(score_index.ReadResultFile(self.filename))
+    with open(self.filename, 'w') as resultfile:
+      json.dump({'psnr': 30.0}, resultfile)
+    self.assertEquals({'psnr': 30.0}, score_index.ReadResultFile(self.filename))
+    # Callers may modify what they get.
+    score_index.ReadResultFile(self.filename)['psnr'] = 0
+    self.assertEquals({'psnr': 30.0}, score_index.ReadResultFile(self.filename))
+
+  def testNestedValuesAreCopied(self):
+    with open(self.filename, 'w') as resultfile:
+      json.dump({'frame_psnr': [30.0]}, resultfile)
+    score_index.ReadResultFile(self.filename)['frame_psnr'].append(0.0)
+    self.assertEquals({'frame_psnr': [30.0]},
+                      score_index.ReadResultFile(self.filename))
+
+  def testRewrittenFileIsReread(self):
+    with open(self.filename, 'w') as resultfile:
+      json.dump({'psnr': 30.0}, resultfile)
+    self.assertEquals({'psnr': 30.0}, score_index.ReadResultFile(self.filename))
+    with open(self.filename, 'w') as resultfile:
+      json.dump({'psnr': 40.25}, resultfile)
+    self.assertEquals({'psnr': 40.25},
+                      score_index.ReadResultFile(self.filename))
+
+  def testBrokenFileRaises(self):
+    with open(self.filename, 'w') as resultfile:
+      resultfile.write('not json')
+    with self.assertRaises(ValueError):
+      score_index.ReadResultFile(self.filename)
+
+  def testReadParameterFile(self):
+    filename = os.path.join(self.path, 'parameters')
+    self.assertIsNone(score_index.ReadParameterFile(filename))
+    with open(filename, 'w') as parameterfile:
+      parameterfile.write('--foo=bar')
+    self.assertEquals('--foo=bar', score_index.ReadParameterFile(filename))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,14 +16,25 @@
 # Tools for evaluating metrics.
 #
 
-def PickScorer(name):
-  # For now, just raise KeyError if the scorer doesn't exist.
-  scorer_map = {
+def _ScorerMap():
+  return {
     'psnr': ScorePsnrBitrate,
     'rt': ScoreCpuPsnr,
   }
 
-  return scorer_map[name]
+def PickScorer(name):
+  # For now, just raise KeyError if the scorer doesn't exist.
+  return _ScorerMap()[name]
+
+def ScorerNames():
+  return _ScorerMap().keys()
+
+def ScorerName(score_function):
+  """Returns the name PickScorer knows a score function by, or None."""
+  for name, function in _ScorerMap().items():
+    if function == score_function:
+      return name
+  return None
 
 def ScorePsnrBitrate(target_bitrate, result):
   """Returns the score of a particular encoding result.
@@ -56,5 +56,11 @@ class TestScoreTools(unittest.TestCase):
     with self.assertRaises(KeyError):
       score_tools.PickScorer('unknown')
 
+  def test_ScorerName(self):
+    for name in score_tools.ScorerNames():
+      self.assertEqual(name,
+                       score_tools.ScorerName(score_tools.PickScorer(name)))
+    self.assertIsNone(score_tools.ScorerName(lambda rate, result: 0))
+
 if __name__ == '__main__':
   unittest.main()
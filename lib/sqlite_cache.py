@@ -0,0 +1,348 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""An encoding cache that stores encoders and results in SQLite.
+
+The EncodingSqliteCache can be used wherever an EncodingDiskCache can
+be used, by passing it as the cache_class of a Context or an Optimizer.
+All encoders and results for all codecs live in a single database file,
+indexed on codec, encoder hashname, speed group and clip name, so that
+queries like AllScoredEncodings are index lookups rather than
+filesystem walks.
+
+The ImportDiskCache method copies the contents of an existing directory
+tree (as written by EncodingDiskCache) into the database.
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import sys
+
+import encoder
+import encoder_configuration
+import frame_data
+import leaderboard
+import score_index
+
+DATABASE_NAME = 'encodings.sqlite'
+
+_SCHEMA = [
+  'CREATE TABLE IF NOT EXISTS encoders ('
+  '  codec TEXT NOT NULL,'
+  '  hashname TEXT NOT NULL,'
+  '  parameters TEXT NOT NULL,'
+  '  PRIMARY KEY (codec, hashname))',
+  'CREATE TABLE IF NOT EXISTS encodings ('
+  '  codec TEXT NOT NULL,'
+  '  hashname TEXT NOT NULL,'
+  '  speed_group TEXT NOT NULL,'
+  '  clip TEXT NOT NULL,'
+  '  result TEXT NOT NULL,'
+  '  PRIMARY KEY (codec, hashname, speed_group, clip))',
+  'CREATE INDEX IF NOT EXISTS encodings_by_target'
+  '  ON encodings (codec, speed_group, clip)',
+]
+
+
+def DatabaseFilename(scoredir=None):
+  """Returns the name of the database file for a score directory."""
+  if scoredir:
+    return os.path.join(encoder_configuration.conf.sysdir(), scoredir,
+                        DATABASE_NAME)
+  return os.path.join(encoder_configuration.conf.workdir(), DATABASE_NAME)
+
+
+def _SpeedGroupToBitrate(speed_group):
+  # Same convention as the disk cache: speed groups that are not numbers
+  # give an unknown (zero) bitrate.
+  try:
+    return int(speed_group)
+  except ValueError:
+    return 0
+
+
+class EncodingSqliteCache(object):
+  """Encoder and encoding information, saved in an SQLite database."""
+  # pylint: disable=too-many-instance-attributes
+  def __init__(self, context, scoredir=None):
+    self.context = context
+    self.bad_encodings = {}
+    if scoredir:
+      root = os.path.join(encoder_configuration.conf.sysdir(), scoredir)
+    else:
+      root = encoder_configuration.conf.workdir()
+    # The workdir is still needed as scratch space for executing encodings.
+    self.workdir = os.path.join(root, context.codec.name)
+    if not os.path.isdir(self.workdir):
+      os.mkdir(self.workdir)
+    self.leaderboards = leaderboard.LeaderboardStore(context, root)
+    self.database_filename = DatabaseFilename(scoredir)
+    self.connection = sqlite3.connect(self.database_filename, timeout=60)
+    for statement in _SCHEMA:
+      self.connection.execute(statement)
+    self.connection.commit()
+    # Parsed parameter sets, keyed by hashname.
+    self.parameters = {}
+    # (speed group, clip) -> fingerprint, valid for one data_version.
+    self.fingerprints = {}
+    self.data_version = None
+
+  def WorkDir(self):
+    return self.workdir
+
+  def _RowsToEncodings(self, rows, videofile=None, bitrate=None,
+                       my_encoder=None):
+    """Turns (hashname, parameters, speed_group, clip, result) rows
+    into Encoding objects with their results filled in."""
+    # pylint: disable=too-many-arguments
+    candidates = []
+    for hashname, parameters, speed_group, clip, result in rows:
+      try:
+        if not my_encoder:
+          self._RememberParameters(hashname, parameters)
+        candidate = encoder.Encoding(
+            my_encoder or encoder.Encoder(self.context, filename=hashname),
+            bitrate or _SpeedGroupToBitrate(speed_group),
+            videofile or encoder.Videofile(clip + '.yuv'))
+        candidate.result = self._ParseResult(result, hashname,
+                                             speed_group, clip)
+        candidates.append(candidate)
+      except encoder.Error as err:
+        self.bad_encodings[(hashname, speed_group, clip)] = err
+        continue
+    return candidates
+
+  def _ParseResult(self, result, hashname, speed_group, clip):
+    # pylint: disable=no-self-use
+    try:
+      return json.loads(result)
+    except ValueError:
+      raise encoder.Error('Unexpected JSON error: %s, encoding was %s/%s/%s' %
+                          (sys.exc_info()[0], hashname, speed_group, clip))
+
+  def _RememberParameters(self, hashname, parameter_string):
+    if hashname not in self.parameters:
+      self.parameters[hashname] = encoder.OptionValueSet(
+          self.context.codec.option_set, parameter_string,
+          formatter=self.context.codec.option_formatter)
+
+  def _QueryScoredEncodings(self, my_encoder=None, bitrate=None,
+                            videofile=None):
+    conditions = ['encodings.codec = ?']
+    arguments = [self.context.codec.name]
+    if my_encoder:
+      conditions.append('encodings.hashname = ?')
+      arguments.append(my_encoder.Hashname())
+    if bitrate:
+      conditions.append('speed_group = ?')
+      arguments.append(self.context.codec.SpeedGroup(bitrate))
+    if videofile:
+      conditions.append('clip = ?')
+      arguments.append(videofile.basename)
+    rows = self.connection.execute(
+        'SELECT encodings.hashname, encoders.parameters, speed_group, clip, '
+        '  result '
+        'FROM encodings JOIN encoders '
+        '  ON encodings.codec = encoders.codec '
+        '  AND encodings.hashname = encoders.hashname '
+        'WHERE ' + ' AND '.join(conditions), arguments)
+    return self._RowsToEncodings(rows, videofile, bitrate, my_encoder)
+
+  def AllScoredEncodings(self, bitrate, videofile):
+    return self._QueryScoredEncodings(bitrate=bitrate, videofile=videofile)
+
+  def AllScoredRates(self, my_encoder, videofile):
+    return self._QueryScoredEncodings(my_encoder=my_encoder,
+                                      videofile=videofile)
+
+  def AllScoredEncodingsForEncoder(self, my_encoder):
+    return self._QueryScoredEncodings(my_encoder=my_encoder)
+
+  def StoreEncoder(self, my_encoder):
+    """Stores an encoder object in the database, keyed by its hashname."""
+    if my_encoder.stored:
+      return
+    self._InsertEncoder(my_encoder.Hashname(),
+                        my_encoder.parameters.ToString())
+    self.connection.commit()
+    my_encoder.stored = True
+
+  def _InsertEncoder(self, hashname, parameter_string, replace=True):
+    """Returns the number of rows written, 0 if an existing row was kept."""
+    return self.connection.execute(
+        'INSERT OR %s INTO encoders (codec, hashname, parameters) '
+        'VALUES (?, ?, ?)' % ('REPLACE' if replace else 'IGNORE'),
+        (self.context.codec.name, hashname, parameter_string)).rowcount
+
+  def ReadEncoderParameters(self, filename):
+    """Returns the parameters of an encoder.
+
+    The filename may be a hashname or a path ending in the hashname."""
+    hashname = os.path.basename(filename)
+    if hashname not in self.parameters:
+      row = self.connection.execute(
+          'SELECT parameters FROM encoders WHERE codec = ? AND hashname = ?',
+          (self.context.codec.name, hashname)).fetchone()
+      if not row:
+        return None
+      self._RememberParameters(hashname, row[0])
+    return self.parameters[hashname]
+
+  def AllEncoderFilenames(self, only_workdir=False):
+    # pylint: disable=unused-argument
+    # There is only one database, so only_workdir makes no difference.
+    return [os.path.join(self.workdir, row[0]) for row in
+            self.connection.execute(
+                'SELECT hashname FROM encoders WHERE codec = ?',
+                (self.context.codec.name,))]
+
+  def RemoveEncoder(self, hashname):
+    hashname = os.path.basename(hashname)
+    for table in ('encodings', 'encoders'):
+      self.connection.execute(
+          'DELETE FROM %s WHERE codec = ? AND hashname = ?' % table,
+          (self.context.codec.name, hashname))
+    self.connection.commit()
+    self.parameters.pop(hashname, None)
+    self.fingerprints = {}
+
+  def StoreEncoding(self, encoding):
+    """Stores the result of an encoding, if it has been executed."""
+    if not encoding.result:
+      return
+    key = (self.context.codec.SpeedGroup(encoding.bitrate),
+           encoding.videofile.basename)
+    if key in self.fingerprints and not self.HasResult(encoding):
+      self.fingerprints[key] ^= score_index.HashnameValue(
+          encoding.encoder.Hashname())
+    self._InsertEncoding(encoding.encoder.Hashname(), key[0], key[1],
+                         json.dumps(frame_data.FullResult(encoding.result)))
+    self.connection.commit()
+
+  def _InsertEncoding(self, hashname, speed_group, clip, result_string,
+                      replace=True):
+    """Returns the number of rows written, 0 if an existing row was kept."""
+    # pylint: disable=too-many-arguments
+    return self.connection.execute(
+        'INSERT OR %s INTO encodings '
+        '(codec, hashname, speed_group, clip, result) '
+        'VALUES (?, ?, ?, ?, ?)' % ('REPLACE' if replace else 'IGNORE'),
+        (self.context.codec.name, hashname, speed_group, clip,
+         result_string)).rowcount
+
+  def HasResult(self, encoding):
+    """Returns true if a result for the encoding is stored, without
+    reading the result."""
+    return self.connection.execute(
+        'SELECT 1 FROM encodings WHERE codec = ? AND hashname = ? '
+        'AND speed_group = ? AND clip = ?',
+        (self.context.codec.name, encoding.encoder.Hashname(),
+         self.context.codec.SpeedGroup(encoding.bitrate),
+         encoding.videofile.basename)).fetchone() is not None
+
+  def TriedHashnames(self, bitrate, videofile):
+    """Returns the set of hashnames of the encoders with a stored result
+    for a target."""
+    return set(row[0] for row in self.connection.execute(
+        'SELECT hashname FROM encodings WHERE codec = ? '
+        'AND speed_group = ? AND clip = ?',
+        (self.context.codec.name, self.context.codec.SpeedGroup(bitrate),
+         videofile.basename)))
+
+  def ScoredFingerprint(self, bitrate, videofile):
+    """Returns a string that changes when the set of encoders with a
+    result for a target's speed group and clip changes.
+
+    Fingerprints are kept until another connection changes the database."""
+    version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+    if version != self.data_version:
+      self.fingerprints = {}
+      self.data_version = version
+    key = (self.context.codec.SpeedGroup(bitrate), videofile.basename)
+    if key not in self.fingerprints:
+      fingerprint = 0
+      for row in self.connection.execute(
+          'SELECT hashname FROM encodings WHERE codec = ? '
+          'AND speed_group = ? AND clip = ?',
+          (self.context.codec.name,) + key):
+        fingerprint ^= score_index.HashnameValue(row[0])
+      self.fingerprints[key] = fingerprint
+    return '%x' % self.fingerprints[key]
+
+  def ReadEncodingResult(self, encoding):
+    """Reads an encoding result back from the database, if present.
+
+    None is returned if there is no result stored."""
+    hashname = encoding.encoder.Hashname()
+    speed_group = self.context.codec.SpeedGroup(encoding.bitrate)
+    clip = encoding.videofile.basename
+    row = self.connection.execute(
+        'SELECT result FROM encodings WHERE codec = ? AND hashname = ? '
+        'AND speed_group = ? AND clip = ?',
+        (self.context.codec.name, hashname, speed_group, clip)).fetchone()
+    if not row:
+      return None
+    return self._ParseResult(row[0], hashname, speed_group, clip)
+
+  def _ReadResultFiles(self, result_filename, hashname, speed_group, clip):
+    """Returns the result string for a result file written by the disk
+    cache, with the frame data from its frame file put back in."""
+    # pylint: disable=too-many-arguments
+    with open(result_filename, 'r') as resultfile:
+      result_string = resultfile.read()
+    entries = frame_data.ReadFrameFile(
+        frame_data.FrameFilename(result_filename))
+    if entries is None:
+      return result_string
+    result = self._ParseResult(result_string, hashname, speed_group, clip)
+    result.update(entries)
+    return json.dumps(result)
+
+  def ImportDiskCache(self, directories=None):
+    """Copies encoders and results from a directory tree into the database.
+
+    The directories default to the search path of the EncodingDiskCache
+    for this codec. As with the disk cache, when the same result is present
+    in several directories, the first one on the path wins.
+    Existing entries in the database are not overwritten.
+    Returns the number of encoders and results imported, not counting
+    those that were already in the database."""
+    if directories is None:
+      directories = [self.workdir]
+      directories.extend(
+          [os.path.join(this_path, self.context.codec.name)
+           for this_path in encoder_configuration.conf.scorepath()])
+    encoder_count = 0
+    result_count = 0
+    for directory in directories:
+      for parameterfile_name in glob.glob(os.path.join(directory, '*',
+                                                       'parameters')):
+        encoder_dir = os.path.dirname(parameterfile_name)
+        hashname = os.path.basename(encoder_dir)
+        with open(parameterfile_name, 'r') as parameterfile:
+          encoder_count += self._InsertEncoder(hashname, parameterfile.read(),
+                                               replace=False)
+        for result_filename in glob.glob(os.path.join(encoder_dir, '*',
+                                                      '*.result')):
+          speed_group = os.path.basename(os.path.dirname(result_filename))
+          clip = os.path.splitext(os.path.basename(result_filename))[0]
+          result_count += self._InsertEncoding(
+              hashname, speed_group, clip,
+              self._ReadResultFiles(result_filename, hashname, speed_group,
+                                    clip),
+              replace=False)
+    self.connection.commit()
+    self.fingerprints = {}
+    return encoder_count, result_count
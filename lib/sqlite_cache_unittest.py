@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the SQLite encoding cache."""
+
+import os
+import unittest
+
+import encoder
+import encoder_configuration
+import optimizer
+import test_tools
+
+import sqlite_cache
+
+
+class StorageOnlyCodec(object):
+  """A codec that is only useful for testing storage."""
+  def __init__(self, name='unittest'):
+    self.name = name
+    self.option_set = encoder.OptionSet()
+    self.option_formatter = encoder.OptionFormatter(prefix='--', infix=':')
+
+  def SpeedGroup(self, bitrate):
+    # pylint: disable=R0201
+    return str(bitrate)
+
+  def ConfigurationFixups(self, parameters):
+    # pylint: disable=R0201
+    return parameters
+
+
+class StorageOnlyContext(object):
+  """A context that is only useful for testing storage."""
+  def __init__(self):
+    self.codec = StorageOnlyCodec()
+    self.cache = None
+
+
+# The SQLite caches made by a test, closed when it ends. A connection left
+# open to a removed database confuses SQLite when a new database file
+# gets the same inode.
+_open_caches = []  # pylint: disable=invalid-name
+
+
+def MakeContextAndCache(cache_class=sqlite_cache.EncodingSqliteCache,
+                        scoredir=None):
+  context = StorageOnlyContext()
+  context.cache = cache_class(context, scoredir)
+  if cache_class == sqlite_cache.EncodingSqliteCache:
+    _open_caches.append(context.cache)
+  return context, context.cache
+
+
+def MakeEncoding(context, bitrate, result=None):
+  my_encoder = encoder.Encoder(
+      context,
+      encoder.OptionValueSet(encoder.OptionSet(), '--parameters'))
+  my_encoding = encoder.Encoding(my_encoder, bitrate,
+                                 encoder.Videofile('x/foo_640_480_20.yuv'))
+  my_encoding.result = result
+  return my_encoding
+
+
+class TestEncodingSqliteCache(test_tools.FileUsingCodecTest):
+  def setUp(self):
+    super(TestEncodingSqliteCache, self).setUp()
+    test_tools.EmptyWorkDirectory()
+
+  def tearDown(self):
+    while _open_caches:
+      _open_caches.pop().connection.close()
+
+  def testInit(self):
+    _, cache = MakeContextAndCache()
+    self.assertTrue(cache)
+    self.assertTrue(os.path.isfile(cache.database_filename))
+
+  def testStoreFetchEncoder(self):
+    context, cache = MakeContextAndCache()
+    my_encoder = MakeEncoding(context, 123).encoder
+    cache.StoreEncoder(my_encoder)
+    new_encoder_data = cache.ReadEncoderParameters(
+        os.path.join(cache.WorkDir(), my_encoder.Hashname()))
+    self.assertEquals(new_encoder_data, my_encoder.parameters)
+    new_encoder_data = cache.ReadEncoderParameters(my_encoder.Hashname())
+    self.assertEquals(new_encoder_data, my_encoder.parameters)
+    self.assertIsNone(cache.ReadEncoderParameters('nosuchhash'))
+
+  def testStoreFetchEncoding(self):
+    context, cache = MakeContextAndCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    my_encoding.result = None
+    self.assertEquals({'foo': 'bar'}, cache.ReadEncodingResult(my_encoding))
+
+  def testHasResult(self):
+    context, cache = MakeContextAndCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    self.assertTrue(MakeEncoding(context, 123).Tried())
+    self.assertFalse(MakeEncoding(context, 246).Tried())
+    self.assertEquals(set([my_encoding.encoder.Hashname()]),
+                      cache.TriedHashnames(123, my_encoding.videofile))
+    self.assertEquals(set(), cache.TriedHashnames(246, my_encoding.videofile))
+
+  def testStoreMultipleEncodings(self):
+    context, cache = MakeContextAndCache()
+    MakeEncoding(context, 123, {'foo': 'bar'}).Store()
+    my_encoding = MakeEncoding(context, 246, {'foo': 'bar'})
+    my_encoding.Store()
+    videofile = my_encoding.videofile
+    result = cache.AllScoredRates(my_encoding.encoder, videofile)
+    self.assertEquals(2, len(result))
+    result = cache.AllScoredEncodings(123, videofile)
+    self.assertEquals(1, len(result))
+    self.assertEquals(123, result[0].bitrate)
+    self.assertEquals({'foo': 'bar'}, result[0].Result())
+
+  def testAllScoredEncodingsForEncoder(self):
+    context, cache = MakeContextAndCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.encoder.Store()
+    self.assertFalse(cache.AllScoredEncodingsForEncoder(my_encoding.encoder))
+    my_encoding.Store()
+    result = cache.AllScoredEncodingsForEncoder(my_encoding.encoder)
+    self.assertEquals(1, len(result))
+    # As with the disk cache, synthesized videofiles have no directory.
+    self.assertEquals('foo_640_480_20.yuv', result[0].videofile.filename)
+
+  def testAllEncoderFilenamesAndRemove(self):
+    context, cache = MakeContextAndCache()
+    self.assertEquals(0, len(cache.AllEncoderFilenames()))
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    files = cache.AllEncoderFilenames()
+    self.assertEquals(1, len(files))
+    self.assertEquals(my_encoding.encoder.Hashname(),
+                      os.path.basename(files[0]))
+    fetched_encoder = encoder.Encoder(context, filename=files[0])
+    self.assertEquals(my_encoding.encoder.parameters.ToString(),
+                      fetched_encoder.parameters.ToString())
+    cache.RemoveEncoder(files[0])
+    self.assertEquals(0, len(cache.AllEncoderFilenames()))
+    self.assertIsNone(cache.ReadEncodingResult(my_encoding))
+
+  def testCodecsAreSeparate(self):
+    context, cache = MakeContextAndCache()
+    MakeEncoding(context, 123, {'foo': 'bar'}).Store()
+    other_context = StorageOnlyContext()
+    other_context.codec = StorageOnlyCodec(name='other')
+    other_cache = sqlite_cache.EncodingSqliteCache(other_context)
+    other_context.cache = other_cache
+    self.assertEquals(cache.database_filename, other_cache.database_filename)
+    self.assertEquals(0, len(other_cache.AllEncoderFilenames()))
+    self.assertFalse(other_cache.ReadEncodingResult(
+        MakeEncoding(other_context, 123)))
+
+  def testBrokenStoredEncoding(self):
+    context, cache = MakeContextAndCache()
+    my_encoding = MakeEncoding(context, 123, {'foo': 'bar'})
+    my_encoding.Store()
+    cache.connection.execute('UPDATE encodings SET result = ?',
+                             ('stuff that is not valid json',))
+    result = cache.AllScoredEncodingsForEncoder(my_encoding.encoder)
+    self.assertFalse(result)
+    self.assertEquals(1, len(cache.bad_encodings))
+
+  def testImportDiskCache(self):
+    disk_context, _ = MakeContextAndCache(encoder.EncodingDiskCache)
+    MakeEncoding(disk_context, 123, {'foo': 'bar'}).Store()
+    # A second score directory on the search path. Its result for the
+    # same encoding must not override the one in the workdir.
+    other_dir = os.path.join(encoder_configuration.conf.sysdir(),
+                             'import_test')
+    os.mkdir(other_dir)
+    other_context, _ = MakeContextAndCache(encoder.EncodingDiskCache,
+                                           scoredir='import_test')
+    MakeEncoding(other_context, 123, {'foo': 'other'}).Store()
+    MakeEncoding(other_context, 246, {'foo': 'baz'}).Store()
+    encoder_configuration.conf.override_scorepath_for_test([other_dir])
+
+    context, cache = MakeContextAndCache()
+    # The encoder and the result for 123 in the second directory are
+    # already there, and not counted.
+    self.assertEquals((1, 2), cache.ImportDiskCache())
+    self.assertEquals({'foo': 'bar'},
+                      cache.ReadEncodingResult(MakeEncoding(context, 123)))
+    self.assertEquals({'foo': 'baz'},
+                      cache.ReadEncodingResult(MakeEncoding(context, 246)))
+    self.assertEquals(1, len(cache.AllEncoderFilenames()))
+
+  def testImportDiskCacheWithFrameData(self):
+    disk_context, _ = MakeContextAndCache(encoder.EncodingDiskCache)
+    frames = [{'size': 800}, {'size': 80}]
+    MakeEncoding(disk_context, 123, {'foo': 'bar', 'frame': frames}).Store()
+    context, cache = MakeContextAndCache()
+    self.assertEquals((1, 1), cache.ImportDiskCache())
+    self.assertEquals({'foo': 'bar', 'frame': frames},
+                      cache.ReadEncodingResult(MakeEncoding(context, 123)))
+
+  def testUsableWithOptimizer(self):
+    codec = StorageOnlyCodec()
+    my_optimizer = optimizer.Optimizer(
+        codec, cache_class=sqlite_cache.EncodingSqliteCache)
+    _open_caches.append(my_optimizer.context.cache)
+    my_encoding = MakeEncoding(my_optimizer.context, 123,
+                               {'psnr': 40.0, 'bitrate': 100})
+    my_encoding.Store()
+    best = my_optimizer.BestEncoding(123, my_encoding.videofile)
+    self.assertEquals(my_encoding.encoder.Hashname(), best.encoder.Hashname())
+    self.assertEquals(40.0, best.Result()['psnr'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,115 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Version strings of tools, remembered until the tools change.
+
+Finding the version of an encoder means running it (or git) and parsing
+its output. A VersionRegistry remembers each version string together
+with a fingerprint of the tool binaries (path, size and modification
+time), in a JSON file in the work directory, so that each version is
+probed once, and probed again only when a binary changes.
+"""
+
+import json
+import os
+
+import encoder_configuration
+
+VERSION_FILENAME = 'tool_versions.json'
+
+
+def Fingerprint(paths):
+  """Returns a value that changes when any of the files change."""
+  fingerprint = []
+  for path in paths:
+    path = os.path.abspath(path)
+    try:
+      stat = os.stat(path)
+      fingerprint.append([path, stat.st_size, stat.st_mtime])
+    except OSError:
+      fingerprint.append([path, None, None])
+  return fingerprint
+
+
+class VersionRegistry(object):
+  """Version strings, stored in a file."""
+  def __init__(self, filename):
+    self.filename = filename
+    self.entries = None
+
+  def _Load(self):
+    try:
+      with open(self.filename, 'r') as version_file:
+        self.entries = json.load(version_file)
+    except (IOError, ValueError):
+      self.entries = {}
+
+  def _Save(self):
+    directory = os.path.dirname(self.filename)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    # Other processes may read the file at any time, so replace it in
+    # one step. If two processes write at once, one probe is lost, and
+    # is done again later.
+    temp_filename = '%s.%d' % (self.filename, os.getpid())
+    with open(temp_filename, 'w') as version_file:
+      json.dump(self.entries, version_file, indent=2, sort_keys=True)
+    os.rename(temp_filename, self.filename)
+
+  def _Lookup(self, name, fingerprint):
+    entry = self.entries.get(name)
+    if entry and entry.get('fingerprint') == fingerprint:
+      return entry.get('version')
+    return None
+
+  def Version(self, name, paths, probe):
+    """Returns the version called name, which is probe() for the files
+    in paths. probe is called only if the files have changed since the
+    last time."""
+    fingerprint = Fingerprint(paths)
+    if self.entries is None:
+      self._Load()
+    version = self._Lookup(name, fingerprint)
+    if version is None:
+      # Another process may have probed it already.
+      self._Load()
+      version = self._Lookup(name, fingerprint)
+    if version is None:
+      version = probe()
+      self.entries[name] = {'fingerprint': fingerprint, 'version': version}
+      self._Save()
+    return version
+
+  def Forget(self, name):
+    if self.entries is None:
+      self._Load()
+    if self.entries.pop(name, None) is not None:
+      self._Save()
+
+
+# pylint: disable=invalid-name
+_registries = {}
+
+
+def Registry():
+  """Returns the process-wide registry for the current work directory."""
+  filename = os.path.join(encoder_configuration.conf.workdir(),
+                          VERSION_FILENAME)
+  if filename not in _registries:
+    _registries[filename] = VersionRegistry(filename)
+  return _registries[filename]
+
+
+def CachedVersion(name, paths, probe):
+  """Returns probe(), remembered until any of the files in paths change."""
+  return Registry().Version(name, paths, probe)
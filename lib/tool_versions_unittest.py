@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the tool version registry."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tool_versions
+
+
+class CountingProbe(object):
+  def __init__(self, version):
+    self.version = version
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    return self.version
+
+
+class TestVersionRegistry(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.tool = os.path.join(self.directory, 'tool')
+    self.WriteTool('binary')
+    self.filename = os.path.join(self.directory, 'versions',
+                                 tool_versions.VERSION_FILENAME)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def WriteTool(self, contents):
+    with open(self.tool, 'w') as tool_file:
+      tool_file.write(contents)
+
+  def test_ProbesOnce(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    probe = CountingProbe('tool 1.0')
+    self.assertEqual('tool 1.0', registry.Version('tool', [self.tool], probe))
+    self.assertEqual('tool 1.0', registry.Version('tool', [self.tool], probe))
+    self.assertEqual(1, probe.calls)
+
+  def test_PersistsAcrossRegistries(self):
+    probe = CountingProbe('tool 1.0')
+    tool_versions.VersionRegistry(self.filename).Version(
+        'tool', [self.tool], probe)
+    self.assertEqual('tool 1.0', tool_versions.VersionRegistry(
+        self.filename).Version('tool', [self.tool], probe))
+    self.assertEqual(1, probe.calls)
+
+  def test_ChangedToolIsProbedAgain(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    registry.Version('tool', [self.tool], CountingProbe('tool 1.0'))
+    self.WriteTool('a new and longer binary')
+    self.assertEqual('tool 2.0', registry.Version(
+        'tool', [self.tool], CountingProbe('tool 2.0')))
+
+  def test_NamesAreSeparate(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    registry.Version('one', [self.tool], CountingProbe('one 1.0'))
+    self.assertEqual('two 1.0', registry.Version(
+        'two', [self.tool], CountingProbe('two 1.0')))
+
+  def test_MissingTool(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    missing = os.path.join(self.directory, 'missing')
+    probe = CountingProbe('none')
+    registry.Version('tool', [missing], probe)
+    registry.Version('tool', [missing], probe)
+    self.assertEqual(1, probe.calls)
+    self.WriteTool('binary')
+    os.rename(self.tool, missing)
+    registry.Version('tool', [missing], probe)
+    self.assertEqual(2, probe.calls)
+
+  def test_FailedProbeIsNotRemembered(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    def FailingProbe():
+      raise ValueError('no version')
+    with self.assertRaises(ValueError):
+      registry.Version('tool', [self.tool], FailingProbe)
+    self.assertEqual('tool 1.0', registry.Version(
+        'tool', [self.tool], CountingProbe('tool 1.0')))
+
+  def test_Forget(self):
+    registry = tool_versions.VersionRegistry(self.filename)
+    probe = CountingProbe('tool 1.0')
+    registry.Version('tool', [self.tool], probe)
+    registry.Forget('tool')
+    tool_versions.VersionRegistry(self.filename).Version(
+        'tool', [self.tool], probe)
+    self.assertEqual(2, probe.calls)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,15 +22,224 @@ __author__ += "hta@gogle.com (Harald Alvestrand)"
 
 
 import encoder
-import gviz_api
+import lazy_import
 import math
 import mpeg_settings
-import numpy
 import optimizer
 import re
 import string
 import pick_codec
 
+numpy = lazy_import.LazyModule('numpy')  # pylint: disable=invalid-name
+gviz_api = lazy_import.LazyModule('gviz_api')  # pylint: disable=invalid-name
+
+
+def _CurveArrays(metric_sets):
+  """Returns the rates and metrics of a list of metric sets as two arrays,
+  with one row per set. Rows are padded with NaN to the longest set."""
+  length = max([len(metric_set) for metric_set in metric_sets] + [1])
+  rates = numpy.full((len(metric_sets), length), numpy.nan)
+  metrics = numpy.full((len(metric_sets), length), numpy.nan)
+  for row, metric_set in enumerate(metric_sets):
+    if metric_set:
+      points = numpy.array(metric_set, dtype=float)
+      rates[row, :len(metric_set)] = points[:, 0]
+      metrics[row, :len(metric_set)] = points[:, 1]
+  return rates, metrics
+
+
+def _CubicFits(inputs, outputs):
+  """Returns the least-squares cubic fit of outputs to inputs for each row,
+  highest power first, as numpy.polyfit gives it. NaN points are left
+  out."""
+  # numpy plays games with its exported functions.
+  # pylint: disable=no-member,invalid-sequence-index
+  valid = ~(numpy.isnan(inputs) | numpy.isnan(outputs))
+  inputs = numpy.where(valid, inputs, 0.0)
+  outputs = numpy.where(valid, outputs, 0.0)
+  vandermonde = inputs[:, :, None] ** numpy.arange(3, -1, -1)
+  vandermonde *= valid[:, :, None]
+  # Scale the columns for a better conditioned problem, like polyfit does.
+  scale = numpy.sqrt((vandermonde * vandermonde).sum(axis=1))
+  scale[scale == 0] = 1.0
+  vandermonde /= scale[:, None, :]
+  # The distributions' numpy can't invert a stack of matrices at once.
+  coefficients = numpy.array([numpy.dot(numpy.linalg.pinv(matrix), values)
+                              for matrix, values
+                              in zip(vandermonde, outputs)])
+  return coefficients.reshape(scale.shape) / scale
+
+
+# Directions of the curve fits: PSNR as a function of log bitrate, for
+# dsnr, and log bitrate as a function of PSNR, for drate.
+FIT_PSNR = 'psnr'
+FIT_RATE = 'rate'
+
+
+def _FitCurves(metric_sets, direction):
+  """Fits a cubic to each metric set, in the given direction.
+
+  Returns (integrals, low, high), where integrals has the coefficients of
+  the integral of each cubic (highest power first, without the constant
+  term), and low and high give the range of each fit's input."""
+  # pylint: disable=no-member,assignment-from-no-return
+  rates, psnrs = _CurveArrays(metric_sets)
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    log_rates = numpy.log(rates)
+  if direction == FIT_PSNR:
+    inputs, outputs = log_rates, psnrs
+  else:
+    inputs, outputs = psnrs, log_rates
+  integrals = _CubicFits(inputs, outputs) / numpy.arange(4, 0, -1)
+  return (integrals, numpy.nanmin(inputs, axis=1),
+          numpy.nanmax(inputs, axis=1))
+
+
+class FitCache(object):
+  """Curve fits, made once for each curve.
+
+  Curves are named by the caller, for instance by (codec, clip); a fit
+  is kept for each name and direction."""
+  def __init__(self):
+    self.fits = {}
+
+  def Fits(self, keys, metric_sets, direction):
+    """Returns _FitCurves(metric_sets, direction), fitting only the curves
+    whose keys have not been seen before."""
+    new_keys = []
+    new_metric_sets = []
+    for key, metric_set in zip(keys, metric_sets):
+      if (key, direction) not in self.fits and key not in new_keys:
+        new_keys.append(key)
+        new_metric_sets.append(metric_set)
+    if new_keys:
+      integrals, low, high = _FitCurves(new_metric_sets, direction)
+      for row, key in enumerate(new_keys):
+        self.fits[(key, direction)] = (integrals[row], low[row], high[row])
+    fits = [self.fits[(key, direction)] for key in keys]
+    return (numpy.array([fit[0] for fit in fits]),
+            numpy.array([fit[1] for fit in fits]),
+            numpy.array([fit[2] for fit in fits]))
+
+
+def _AverageDifferences(fits1, fits2):
+  """Returns the average difference between the cubics of fits2 and fits1
+  over the range of input both cover, for each row, and that range."""
+  # pylint: disable=no-member,assignment-from-no-return
+  integrals1, low1, high1 = fits1
+  integrals2, low2, high2 = fits2
+  low = numpy.maximum(low1, low2)
+  high = numpy.minimum(high1, high2)
+  def Integral(integrals):
+    def Value(point):
+      return ((((integrals[:, 0] * point + integrals[:, 1]) * point +
+                integrals[:, 2]) * point + integrals[:, 3]) * point)
+    return Value(high) - Value(low)
+  return (Integral(integrals2) - Integral(integrals1)) / (high - low), low, high
+
+
+def _Bdsnr(fits1, fits2):
+  # pylint: disable=no-member
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    average, low, high = _AverageDifferences(fits1, fits2)
+    return numpy.where(high != low, average, 0.0)
+
+
+def _Bdrate(fits1, fits2):
+  # pylint: disable=no-member
+  with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+    average_exponent, _, _ = _AverageDifferences(fits1, fits2)
+    # In really bad formed data the exponent can grow too large.
+    # clamp it.
+    average_exponent = numpy.where(average_exponent > 200, 200,
+                                   average_exponent)
+    # Convert to a percentage.
+    return (numpy.exp(average_exponent) - 1) * 100
+
+
+def BatchBdsnr(metric_sets1, metric_sets2):
+  """Returns bdsnr(metric_sets1[i], metric_sets2[i]) for all i, as an
+  array."""
+  return _Bdsnr(_FitCurves(metric_sets1, FIT_PSNR),
+                _FitCurves(metric_sets2, FIT_PSNR))
+
+
+def BatchBdrate(metric_sets1, metric_sets2):
+  """Returns bdrate(metric_sets1[i], metric_sets2[i]) for all i, as an
+  array."""
+  return _Bdrate(_FitCurves(metric_sets1, FIT_RATE),
+                 _FitCurves(metric_sets2, FIT_RATE))
+
+
+def BatchGraphBetter(metric_sets1, metric_sets2, use_set2_as_base):
+  """Returns GraphBetter(metric_sets1[i], metric_sets2[i],
+  use_set2_as_base) for all i, as an array.
+
+  Each point of a set 1 is compared with the first segment of set 2
+  (in bitrate order) that spans its metric."""
+  # pylint: disable=no-member,too-many-locals
+  rates1, metrics1 = _CurveArrays(metric_sets1)
+  rates2, metrics2 = _CurveArrays(metric_sets2)
+  if rates2.shape[1] < 2:
+    return numpy.zeros(len(metric_sets1))
+  metric = metrics1[:, :, None]
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    # Axes are set, point in set 1, segment in set 2.
+    spanning = ((metrics2[:, None, :-1] < metric) &
+                (metric <= metrics2[:, None, 1:]))
+    found = spanning.any(axis=2)
+    segment = spanning.argmax(axis=2)
+    row = numpy.arange(len(metric_sets2))[:, None]
+    rate_0 = rates2[row, segment]
+    rate_1 = rates2[row, segment + 1]
+    metric_0 = metrics2[row, segment]
+    metric_1 = metrics2[row, segment + 1]
+    # The segment spans the metric, so metric_1 > metric_0.
+    estimated_rate = (rate_0 + (metrics1 - metric_0) *
+                      (rate_1 - rate_0) / (metric_1 - metric_0))
+    # Calculate percentage difference as given by base.
+    if use_set2_as_base:
+      ratio = (rates1 - estimated_rate) / estimated_rate
+    else:
+      ratio = (rates1 - estimated_rate) / rates1
+  count = found.sum(axis=1)
+  total = numpy.where(found, ratio, 0.0).sum(axis=1)
+  # Calculate the average improvement between graphs.
+  return numpy.where(count > 0, total / numpy.maximum(count, 1), 0.0)
+
+
+def BatchDataSetBetter(metric_set_pairs, method, key_pairs=None,
+                       fit_cache=None):
+  """Returns DataSetBetter(metric_set1, metric_set2, method) for a list
+  of (metric_set1, metric_set2) pairs, as an array.
+
+  All pairs are compared together, in a few passes over arrays, so that
+  comparing many codecs over many clips costs little more than one
+  comparison. With a FitCache, key_pairs names the two curves of each
+  pair, and each named curve is fitted only once."""
+  if not metric_set_pairs:
+    return numpy.zeros(0)
+  metric_sets1 = [pair[0] for pair in metric_set_pairs]
+  metric_sets2 = [pair[1] for pair in metric_set_pairs]
+  # Be fair to both graphs by testing all the points in each.
+  if method == 'avg':
+    return 50 * (BatchGraphBetter(metric_sets1, metric_sets2,
+                                  use_set2_as_base=True) -
+                 BatchGraphBetter(metric_sets2, metric_sets1,
+                                  use_set2_as_base=False))
+  direction = FIT_PSNR if method == 'dsnr' else FIT_RATE
+  if fit_cache is None:
+    fits1 = _FitCurves(metric_sets1, direction)
+    fits2 = _FitCurves(metric_sets2, direction)
+  else:
+    fits1 = fit_cache.Fits([keys[0] for keys in key_pairs], metric_sets1,
+                           direction)
+    fits2 = fit_cache.Fits([keys[1] for keys in key_pairs], metric_sets2,
+                           direction)
+  if method == 'dsnr':
+    return _Bdsnr(fits1, fits2)
+  return _Bdrate(fits2, fits1)
+
 
 def bdsnr(metric_set1, metric_set2):
   """
@@ -45,41 +254,7 @@ def bdsnr(metric_set1, metric_set2):
   code adapted from code written by : (c) 2010 Giuseppe Valenzise
   http://www.mathworks.com/matlabcentral/fileexchange/27798-bjontegaard-metric/content/bjontegaard.m
   """
-  # pylint: disable=too-many-locals
-  # numpy seems to do tricks with its exports.
-  # pylint: disable=no-member
-  # map() is recommended against.
-  # pylint: disable=bad-builtin
-  rate1 = [x[0] for x in metric_set1]
-  psnr1 = [x[1] for x in metric_set1]
-  rate2 = [x[0] for x in metric_set2]
-  psnr2 = [x[1] for x in metric_set2]
-
-  log_rate1 = map(math.log, rate1)
-  log_rate2 = map(math.log, rate2)
-
-  # Best cubic poly fit for graph represented by log_ratex, psrn_x.
-  poly1 = numpy.polyfit(log_rate1, psnr1, 3)
-  poly2 = numpy.polyfit(log_rate2, psnr2, 3)
-
-  # Integration interval.
-  min_int = max([min(log_rate1), min(log_rate2)])
-  max_int = min([max(log_rate1), max(log_rate2)])
-
-  # Integrate poly1, and poly2.
-  p_int1 = numpy.polyint(poly1)
-  p_int2 = numpy.polyint(poly2)
-
-  # Calculate the integrated value over the interval we care about.
-  int1 = numpy.polyval(p_int1, max_int) - numpy.polyval(p_int1, min_int)
-  int2 = numpy.polyval(p_int2, max_int) - numpy.polyval(p_int2, min_int)
-
-  # Calculate the average improvement.
-  if max_int != min_int:
-    avg_diff = (int2 - int1) / (max_int - min_int)
-  else:
-    avg_diff = 0.0
-  return avg_diff
+  return float(BatchBdsnr([metric_set1], [metric_set2])[0])
 
 
 def bdrate(metric_set1, metric_set2):
@@ -94,46 +269,7 @@ def bdrate(metric_set1, metric_set2):
   adapted from code from: (c) 2010 Giuseppe Valenzise
 
   """
-  # numpy plays games with its exported functions.
-  # pylint: disable=no-member
-  # pylint: disable=too-many-locals
-  # pylint: disable=bad-builtin
-  rate1 = [x[0] for x in metric_set1]
-  psnr1 = [x[1] for x in metric_set1]
-  rate2 = [x[0] for x in metric_set2]
-  psnr2 = [x[1] for x in metric_set2]
-
-  log_rate1 = map(math.log, rate1)
-  log_rate2 = map(math.log, rate2)
-
-  # Best cubic poly fit for graph represented by log_ratex, psrn_x.
-  poly1 = numpy.polyfit(psnr1, log_rate1, 3)
-  poly2 = numpy.polyfit(psnr2, log_rate2, 3)
-
-  # Integration interval.
-  min_int = max([min(psnr1), min(psnr2)])
-  max_int = min([max(psnr1), max(psnr2)])
-
-  # find integral
-  p_int1 = numpy.polyint(poly1)
-  p_int2 = numpy.polyint(poly2)
-
-  # Calculate the integrated value over the interval we care about.
-  int1 = numpy.polyval(p_int1, max_int) - numpy.polyval(p_int1, min_int)
-  int2 = numpy.polyval(p_int2, max_int) - numpy.polyval(p_int2, min_int)
-
-  # Calculate the average improvement.
-  avg_exp_diff = (int2 - int1) / (max_int - min_int)
-
-  # In really bad formed data the exponent can grow too large.
-  # clamp it.
-  if avg_exp_diff > 200:
-    avg_exp_diff = 200
-
-  # Convert to a percentage.
-  avg_diff = (math.exp(avg_exp_diff) - 1) * 100
-
-  return avg_diff
+  return float(BatchBdrate([metric_set1], [metric_set2])[0])
 
 
 def FillForm(string_for_substitution, dictionary_of_vars):
@@ -181,49 +317,10 @@ def ParseMetricFile(file_name, metric_column):
 def GraphBetter(metric_set1_sorted, metric_set2_sorted, use_set2_as_base):
   """
   Search through the sorted metric set for metrics on either side of
-  the metric from file 1.  Since both lists are sorted we really
-  should not have to search through the entire range, but these
-  are small lists."""
-  # pylint: disable=too-many-locals
-  total_bitrate_difference_ratio = 0.0
-  count = 0
-  # TODO(hta): Replace whole thing with a call to numpy.interp()
-  for bitrate, metric in metric_set1_sorted:
-    for i in range(len(metric_set2_sorted) - 1):
-      s2_bitrate_0, s2_metric_0 = metric_set2_sorted[i]
-      s2_bitrate_1, s2_metric_1 = metric_set2_sorted[i + 1]
-      # We have a point on either side of our metric range.
-      if s2_metric_0 < metric <= s2_metric_1:
-        # Calculate a slope.
-        if s2_metric_1 - s2_metric_0 != 0:
-          metric_slope = ((s2_bitrate_1 - s2_bitrate_0) /
-                          (s2_metric_1 - s2_metric_0))
-        else:
-          metric_slope = 0
-
-        estimated_s2_bitrate = (s2_bitrate_0 + (metric - s2_metric_0) *
-                                metric_slope)
-
-        # Calculate percentage difference as given by base.
-        if use_set2_as_base:
-          bitrate_difference_ratio = ((bitrate - estimated_s2_bitrate) /
-                                        estimated_s2_bitrate)
-        else:
-          bitrate_difference_ratio = ((bitrate - estimated_s2_bitrate) /
-                                      bitrate)
-
-        total_bitrate_difference_ratio += bitrate_difference_ratio
-        count += 1
-        break
-
-  # Calculate the average improvement between graphs.
-  if count != 0:
-    avg = total_bitrate_difference_ratio / count
-
-  else:
-    avg = 0.0
-
-  return avg
+  the metric from file 1, and return the average bitrate difference
+  ratio at those points."""
+  return float(BatchGraphBetter([metric_set1_sorted], [metric_set2_sorted],
+                                use_set2_as_base)[0])
 
 
 def DataSetBetter(metric_set1, metric_set2, method):
@@ -233,19 +330,7 @@ def DataSetBetter(metric_set1, metric_set2, method):
   The input metric set is sorted on bitrate.
   The first set is the one to compare, the second set is the baseline.
   """
-  # Be fair to both graphs by testing all the points in each.
-  if method == 'avg':
-    avg_improvement = 50 * (
-                       GraphBetter(metric_set1, metric_set2,
-                                   use_set2_as_base=True) -
-                       GraphBetter(metric_set2, metric_set1,
-                                   use_set2_as_base=False))
-  elif method == 'dsnr':
-    avg_improvement = bdsnr(metric_set1, metric_set2)
-  else:
-    avg_improvement = bdrate(metric_set2, metric_set1)
-
-  return avg_improvement
+  return float(BatchDataSetBetter([(metric_set1, metric_set2)], method)[0])
 
 
 def FileBetter(file_name_1, file_name_2, metric_column, method):
@@ -360,6 +445,7 @@ def ExtractBitrateAndPsnr(datatable, codec, filename):
 
 def BuildComparisonTable(datatable, metric, baseline_codec, other_codecs):
   """Builds a table of comparison data for this metric."""
+  # pylint: disable=too-many-locals
 
   # Find the metric files in the baseline codec.
   videofile_name_list = datatable[baseline_codec].keys()
@@ -371,11 +457,11 @@ def BuildComparisonTable(datatable, metric, baseline_codec, other_codecs):
     countoverall[this_codec] = 0
     sumoverall[this_codec] = 0
 
-  # Data holds the data for the visualization, name given comes from
-  # gviz_api sample code.
-  data = []
+  # Collect every comparison first, so that they are computed in one batch.
+  cells = []
+  pairs = []
+  key_pairs = []
   for filename in videofile_name_list:
-    row = {'file': filename}
     baseline_dataset = ExtractBitrateAndPsnr(datatable,
                                              baseline_codec,
                                              filename)
@@ -389,15 +475,23 @@ def BuildComparisonTable(datatable, metric, baseline_codec, other_codecs):
         this_dataset = ExtractBitrateAndPsnr(datatable,
                                              this_codec,
                                              filename)
-        overall = DataSetBetter(
-          baseline_dataset, this_dataset, metric)
-        if not math.isnan(overall):
-          # TODO(hta): figure out when DataSetBetter generates NaN
-          row[this_codec] = overall
-          sumoverall[this_codec] += overall
-          countoverall[this_codec] += 1
+        cells.append((filename, this_codec))
+        pairs.append((baseline_dataset, this_dataset))
+        key_pairs.append(((baseline_codec, filename), (this_codec, filename)))
 
-    data.append(row)
+  # Data holds the data for the visualization, name given comes from
+  # gviz_api sample code.
+  rows = dict((filename, {'file': filename})
+              for filename in videofile_name_list)
+  for (filename, this_codec), overall in zip(
+      cells, BatchDataSetBetter(pairs, metric, key_pairs, FitCache())):
+    # Curves that don't overlap give NaN for the bjontegaard metrics.
+    if not math.isnan(overall):
+      overall = float(overall)
+      rows[filename][this_codec] = overall
+      sumoverall[this_codec] += overall
+      countoverall[this_codec] += 1
+  data = [rows[filename] for filename in videofile_name_list]
 
   # Add the overall numbers.
   row = {"file": "OVERALL " + metric}
@@ -415,9 +509,12 @@ def BuildGvizDataTable(datatable, metric, baseline_codec, other_codecs):
   data = BuildComparisonTable(datatable, metric, baseline_codec, other_codecs)
   for this_codec in other_codecs:
     description[this_codec] = ("number", this_codec)
-  # Generate the gViz table
+  # Generate the gViz table, column by column.
+  columns = {'file': [row['file'] for row in data]}
+  for this_codec in other_codecs:
+    columns[this_codec] = [row.get(this_codec) for row in data]
   gviz_data_table = gviz_api.DataTable(description)
-  gviz_data_table.LoadData(data)
+  gviz_data_table.LoadColumns(columns)
   return gviz_data_table
 
 
@@ -428,29 +525,55 @@ def CrossPerformanceGvizTable(datatable, metric, codecs, criterion):
 
   description = {}
   description['codec'] = ('string', 'Codec')
-  data = []
   for codec in codecs:
     description[codec] = ('string', codec)
+
+  # Collect every comparison first, so that they are computed in one batch.
+  # Each curve is extracted and fitted once, however many codecs it is
+  # compared with.
+  datasets = {}
+  def Dataset(codec, filename):
+    if (codec, filename) not in datasets:
+      datasets[(codec, filename)] = ExtractBitrateAndPsnr(datatable, codec,
+                                                          filename)
+    return datasets[(codec, filename)]
+
+  cells = []
+  pairs = []
+  key_pairs = []
   for codec1 in codecs:
-    lineitem = {'codec': codec1}
     for codec2 in codecs:
       if codec1 != codec2:
-        count = 0
-        overall = 0.0
         for filename in videofile_name_list:
           if (codec1 in datatable and filename in datatable[codec1]
               and codec2 in datatable and filename in datatable[codec2]):
-            overall += DataSetBetter(
-              ExtractBitrateAndPsnr(datatable, codec2, filename),
-              ExtractBitrateAndPsnr(datatable, codec1, filename), metric)
-            count += 1
-        if count > 0:
-          display = ('<a href=/results/show_result.html?' +
-                     'codec1=%s&codec2=%s&criterion=%s>%5.2f</a>') % (
-                       codec2, codec1, criterion, overall / count)
-          lineitem[codec2] = (overall / count, display)
-    data.append(lineitem)
+            cells.append((codec1, codec2))
+            pairs.append((Dataset(codec2, filename),
+                          Dataset(codec1, filename)))
+            key_pairs.append(((codec2, filename), (codec1, filename)))
+  count = {}
+  overall = {}
+  for cell, result in zip(cells, BatchDataSetBetter(pairs, metric, key_pairs,
+                                                    FitCache())):
+    # Curves that don't overlap give NaN for the bjontegaard metrics.
+    if math.isnan(result):
+      continue
+    count[cell] = count.get(cell, 0) + 1
+    overall[cell] = overall.get(cell, 0.0) + float(result)
+
+  columns = {'codec': list(codecs)}
+  for codec2 in codecs:
+    columns[codec2] = []
+    for codec1 in codecs:
+      if (codec1, codec2) in count:
+        average = overall[(codec1, codec2)] / count[(codec1, codec2)]
+        display = ('<a href=/results/show_result.html?' +
+                   'codec1=%s&codec2=%s&criterion=%s>%5.2f</a>') % (
+                     codec2, codec1, criterion, average)
+        columns[codec2].append((average, display))
+      else:
+        columns[codec2].append(None)
 
   gviz_data_table = gviz_api.DataTable(description)
-  gviz_data_table.LoadData(data)
+  gviz_data_table.LoadColumns(columns)
   return gviz_data_table
@@ -16,6 +16,7 @@
 # Unit tests for the visual_metrics package.
 #
 import encoder
+import numpy
 import unittest
 
 import visual_metrics
@@ -143,6 +144,65 @@ class TestVisualMetricsFunctions(unittest.TestCase):
     self.assertAlmostEqual(
       2.0, visual_metrics.DataSetBetter(metric_set_1, metric_set_3, 'dsnr'))
 
+  def test_BatchDataSetBetterMatchesSinglePairs(self):
+    # Sets of different lengths are padded in the batch; the padding
+    # must not change any result.
+    short_set = [[10.0, 12.0], [25.0, 20.0], [40.0, 26.0]]
+    curved_set = [[float(rate), 10.0 * numpy.log(rate)]
+                  for rate in (8, 12, 20, 35, 50)]
+    pairs = [(LinearVector(slope=1), LinearVector(slope=2)),
+             (short_set, LinearVector(slope=1, offset=2)),
+             (curved_set, short_set),
+             (LinearVector(slope=1), curved_set)]
+    for method in ('avg', 'dsnr', 'drate'):
+      batch = visual_metrics.BatchDataSetBetter(pairs, method)
+      self.assertEquals(len(pairs), len(batch))
+      for (set1, set2), result in zip(pairs, batch):
+        self.assertAlmostEqual(
+          visual_metrics.DataSetBetter(set1, set2, method), result)
+
+  def test_BatchBdsnrMatchesPolyfit(self):
+    # pylint: disable=assignment-from-no-return
+    metric_set_1 = [[float(rate), 10.0 * numpy.log(rate)]
+                    for rate in (8, 12, 20, 35, 50)]
+    metric_set_2 = [[10.0, 22.0], [25.0, 30.0], [40.0, 36.0], [60.0, 39.0]]
+    log_rate1 = numpy.log([point[0] for point in metric_set_1])
+    log_rate2 = numpy.log([point[0] for point in metric_set_2])
+    fit1 = numpy.polyint(numpy.polyfit(
+      log_rate1, [point[1] for point in metric_set_1], 3))
+    fit2 = numpy.polyint(numpy.polyfit(
+      log_rate2, [point[1] for point in metric_set_2], 3))
+    low = max(min(log_rate1), min(log_rate2))
+    high = min(max(log_rate1), max(log_rate2))
+    expected = ((numpy.polyval(fit2, high) - numpy.polyval(fit2, low)) -
+                (numpy.polyval(fit1, high) - numpy.polyval(fit1, low))) / (
+                  high - low)
+    self.assertAlmostEqual(
+      expected, visual_metrics.BatchBdsnr([metric_set_1], [metric_set_2])[0])
+
+  def test_FitCacheFitsEachCurveOnce(self):
+    curves = {'a': LinearVector(slope=1),
+              'b': LinearVector(slope=2),
+              'c': LinearVector(slope=1, offset=2)}
+    key_pairs = [(name1, name2) for name1 in sorted(curves)
+                 for name2 in sorted(curves) if name1 != name2]
+    pairs = [(curves[name1], curves[name2]) for name1, name2 in key_pairs]
+    fit_cache = visual_metrics.FitCache()
+    for method in ('dsnr', 'drate'):
+      cached = visual_metrics.BatchDataSetBetter(pairs, method, key_pairs,
+                                                 fit_cache)
+      uncached = visual_metrics.BatchDataSetBetter(pairs, method)
+      for cached_result, uncached_result in zip(cached, uncached):
+        self.assertAlmostEqual(uncached_result, cached_result)
+    # One fit per curve and direction.
+    self.assertEquals(6, len(fit_cache.fits))
+    # Asking again fits nothing new.
+    visual_metrics.BatchDataSetBetter(pairs, 'dsnr', key_pairs, fit_cache)
+    self.assertEquals(6, len(fit_cache.fits))
+
+  def test_BatchDataSetBetterWithoutPairs(self):
+    self.assertEquals(0, len(visual_metrics.BatchDataSetBetter([], 'avg')))
+
   def test_HtmlPage(self):
     page_template = 'Test: //%%filestable_dpsnr%%//'
     expected_result = 'Test: result'
@@ -220,6 +280,24 @@ class TestVisualMetricsFunctions(unittest.TestCase):
     self.assertEquals(3, len(result.columns))
     self.assertEquals(2, result.NumberOfRows())
 
+  def test_CrossPerformanceGvizTableSkipsNan(self):
+    datatable = {
+      # The slopes are opposite, so drate is NaN both ways.
+      'codec1': {'dummyfile': [
+        {'result': {'bitrate': 100, 'psnr': 30.0}},
+        {'result': {'bitrate': 200, 'psnr': 40.0}}
+      ]},
+      'codec2': {'dummyfile': [
+        {'result': {'bitrate': 300, 'psnr': 50.0}},
+        {'result': {'bitrate': 400, 'psnr': 40.0}}
+      ]},
+    }
+    result = visual_metrics.CrossPerformanceGvizTable(datatable, 'drate',
+                                                      ['codec1', 'codec2'],
+                                                      'psnr')
+    self.assertEquals(2, result.NumberOfRows())
+    self.assertNotIn('nan', result.ToJSon().lower())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -88,11 +88,19 @@ class Vp8Codec(file_codec.FileCodec):
                                     encodedfile, yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = '%s -i %s %s' % (encoder.Tool("ffmpeg"),
+                                   encodedfile, file_codec.FFMPEG_PIPE_OUTPUT)
+    return commandline
+
   def ResultData(self, encodedfile):
     more_results = {}
     more_results['frame'] = file_codec.MatroskaFrameInfo(encodedfile)
     return more_results
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('vpxenc')]
+
   def EncoderVersion(self):
     # The vpxenc command line tool outputs the version number of the
     # encoder as part of its error message on illegal arguments.
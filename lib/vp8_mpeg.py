@@ -107,8 +107,7 @@ class Vp8CodecMpegMode(vp8.Vp8Codec):
       temp_encoder = encoder.Encoder(encoding.context, temp_params)
       temp_encoding = encoder.Encoding(temp_encoder, encoding.bitrate,
                                        encoding.videofile)
-      temp_encoding.Recover()
-      if temp_encoding.Result():
+      if temp_encoding.Tried():
         print name, 'found scored value', search_value
         new_value = int((value + search_value) / 2)
         if new_value in (value, search_value):
@@ -55,11 +55,18 @@ class Vp9Codec(file_codec.FileCodec):
                                     encodedfile, yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = '%s %s --i420 -o -' % (encoder.Tool("vpxdec"), encodedfile)
+    return commandline
+
   def ResultData(self, encodedfile):
     more_results = {}
     more_results['frame'] = file_codec.MatroskaFrameInfo(encodedfile)
     return more_results
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('vpxenc')]
+
   def EncoderVersion(self):
     # The vpxenc command line tool outputs the version number of the
     # encoder as part of its error message on illegal arguments.
@@ -82,11 +82,19 @@ class X264Codec(file_codec.FileCodec):
                                     encodedfile, yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    commandline = '%s -loglevel error -i %s %s' % (
+        encoder.Tool("ffmpeg"), encodedfile, file_codec.FFMPEG_PIPE_OUTPUT)
+    return commandline
+
   def ResultData(self, encodedfile):
     more_results = {}
     more_results['frame'] = file_codec.MatroskaFrameInfo(encodedfile)
     return more_results
 
+  def EncoderVersionTools(self):
+    return [encoder.Tool('x264')]
+
   def EncoderVersion(self):
     version_output = subprocess.check_output([encoder.Tool('x264'),
                                               '--version'])
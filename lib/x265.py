@@ -65,6 +65,14 @@ class X265Codec(ffmpeg.FfmpegCodec):
                                       yuvfile)
     return commandline
 
+  def DecodeToPipeCommandLine(self, videofile, encodedfile):
+    # The JM decoder writes its progress to standard output, so it
+    # decodes through a temporary file.
+    return None
+
+  def EncoderVersionTools(self):
+    return [encoder.Tool('x265')]
+
   def EncoderVersion(self):
     version_output = subprocess.check_output([encoder.Tool('x265'),
                                               '--version'],
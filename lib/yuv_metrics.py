@@ -0,0 +1,164 @@
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Comparison of decoded I420 video with the original clip.
+
+When a codec can decode into a pipe, FileCodec hands the pipe to a
+YuvComparison, which reads the decoded video one frame buffer at a time,
+next to the same frame of the original clip. The single pass gives:
+
+- the PSNR of the whole clip, computed as the psnr tool (src/psnr.c) does,
+- the PSNR of each of the Y, U and V planes over the whole clip,
+- the MD5 of the decoded video, as md5sum would give it for a file,
+- the PSNR of each frame.
+
+Codecs that decode to a file use the psnr tool with --frames instead,
+and ParsePsnrToolOutput gives the same metrics from its output, except
+for the MD5.
+"""
+
+import hashlib
+
+import encoder
+import lazy_import
+
+numpy = lazy_import.LazyModule('numpy')  # pylint: disable=invalid-name
+
+MAX_PSNR = 100.0
+PLANE_NAMES = ('y', 'u', 'v')
+
+
+def Mse2Psnr(samples, peak, total_sq_error):
+  """Returns the PSNR for a total squared error over a number of samples."""
+  if total_sq_error <= 0:
+    return MAX_PSNR
+  return min(MAX_PSNR,
+             10.0 * numpy.log10(float(peak) * peak * samples / total_sq_error))
+
+
+def RoundPsnr(psnr):
+  """Rounds a PSNR the way the psnr tool prints it."""
+  return float('%.3f' % psnr)
+
+
+def ParsePsnrToolOutput(output):
+  """Returns the metrics in the output of "psnr --frames" as a dictionary
+  with the psnr, psnr_y, psnr_u, psnr_v and frame_psnr entries.
+
+  Raises encoder.Error if the output is not in the expected format."""
+  metrics = {'frame_psnr': []}
+  try:
+    for line in output.splitlines():
+      fields = line.split()
+      if fields[0] == 'frame':
+        if int(fields[1]) != len(metrics['frame_psnr']):
+          raise ValueError('frame %s out of order' % fields[1])
+        metrics['frame_psnr'].append(float(fields[2]))
+      elif fields[0] == 'total':
+        metrics['psnr'] = float(fields[1])
+        for name, value in zip(PLANE_NAMES, fields[2:5]):
+          metrics['psnr_' + name] = float(value)
+      else:
+        raise ValueError('unknown line %s' % line)
+  except (IndexError, ValueError) as error:
+    raise encoder.Error('Bad psnr tool output: %s' % error)
+  if 'psnr' not in metrics or 'psnr_v' not in metrics:
+    raise encoder.Error('Bad psnr tool output: no total')
+  return metrics
+
+
+def _ReadInto(the_file, frame_buffer):
+  """Fills a buffer from a file. Returns the number of bytes read, which
+  is less than the buffer size only at the end of the file."""
+  view = memoryview(frame_buffer)
+  count = 0
+  while count < len(frame_buffer):
+    read = the_file.readinto(view[count:])
+    if not read:
+      break
+    count += read
+  return count
+
+
+class YuvComparison(object):
+  """Running comparison of a decoded I420 stream with the original."""
+  # pylint: disable=too-many-instance-attributes
+  def __init__(self, width, height):
+    self.frame_size = width * height * 3 / 2
+    self.frame_count = 0
+    self.decoded_size = 0
+    self.plane_sizes = [width * height]
+    self.plane_sizes.append((self.frame_size - self.plane_sizes[0]) / 2)
+    self.plane_sizes.append(self.frame_size - sum(self.plane_sizes))
+    self.plane_sq_error = [0] * len(self.plane_sizes)
+    self.frame_psnr = []
+    self.md5 = hashlib.md5()
+    self._original = bytearray(self.frame_size)
+    self._decoded = bytearray(self.frame_size)
+    self._original_samples = numpy.frombuffer(self._original, numpy.uint8)
+    self._decoded_samples = numpy.frombuffer(self._decoded, numpy.uint8)
+    self._difference = numpy.empty(self.frame_size, numpy.int64)
+
+  def _AddFrame(self):
+    numpy.subtract(self._decoded_samples, self._original_samples,
+                   out=self._difference, dtype=numpy.int64)
+    sq_error = 0
+    start = 0
+    for plane, plane_size in enumerate(self.plane_sizes):
+      plane_difference = self._difference[start:start + plane_size]
+      plane_sq_error = int(numpy.dot(plane_difference, plane_difference))
+      self.plane_sq_error[plane] += plane_sq_error
+      sq_error += plane_sq_error
+      start += plane_size
+    self.frame_count += 1
+    self.frame_psnr.append(
+        RoundPsnr(Mse2Psnr(self.frame_size, 255, sq_error)))
+
+  def Compare(self, original_file, decoded_file):
+    """Reads a decoded stream to its end, and compares it frame by frame
+    with the original file."""
+    while True:
+      count = _ReadInto(decoded_file, self._decoded)
+      if not count:
+        break
+      self.decoded_size += count
+      if count < self.frame_size:
+        self.md5.update(self._decoded[:count])
+        continue
+      self.md5.update(self._decoded)
+      if _ReadInto(original_file, self._original) == self.frame_size:
+        self._AddFrame()
+
+  def Metrics(self, original_size):
+    """Returns the psnr, psnr_y, psnr_u, psnr_v, frame_psnr and yuv_md5
+    of the decoded video, as a dictionary.
+
+    Like the psnr tool, this refuses to compare videos of different sizes,
+    or with partial frames, by raising encoder.Error."""
+    if (self.decoded_size != original_size or
+        original_size % self.frame_size or not self.frame_count):
+      raise encoder.Error(
+          'Decoded video must be the same size as the original, and have '
+          'only full frames (sizes: %d, %d)' % (original_size,
+                                                self.decoded_size))
+    metrics = {
+        'psnr': RoundPsnr(Mse2Psnr(self.frame_count * self.frame_size, 255,
+                                   sum(self.plane_sq_error))),
+        'frame_psnr': self.frame_psnr,
+        'yuv_md5': self.md5.hexdigest(),
+    }
+    for name, plane_size, sq_error in zip(PLANE_NAMES, self.plane_sizes,
+                                          self.plane_sq_error):
+      metrics['psnr_' + name] = RoundPsnr(
+          Mse2Psnr(self.frame_count * plane_size, 255, sq_error))
+    return metrics
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# Copyright 2015 Google.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for the decoded video comparison."""
+
+import hashlib
+import io
+import os
+import subprocess
+import unittest
+
+import encoder
+import test_tools
+import yuv_metrics
+
+# Frames of 4x2 pixels have 12 bytes.
+WIDTH = 4
+HEIGHT = 2
+
+
+def Compare(original, decoded):
+  comparison = yuv_metrics.YuvComparison(WIDTH, HEIGHT)
+  comparison.Compare(io.BytesIO(original), io.BytesIO(decoded))
+  return comparison
+
+
+class TestYuvComparison(unittest.TestCase):
+
+  def test_IdenticalFrames(self):
+    comparison = Compare('\1' * 24, '\1' * 24)
+    self.assertEqual(100.0, comparison.Metrics(24)['psnr'])
+    self.assertEqual([100.0, 100.0], comparison.frame_psnr)
+
+  def test_Md5IsOfDecodedVideo(self):
+    decoded = ''.join(chr(i) for i in range(24))
+    comparison = Compare('\0' * 24, decoded)
+    self.assertEqual(hashlib.md5(decoded).hexdigest(),
+                     comparison.Metrics(24)['yuv_md5'])
+
+  def test_PsnrOfKnownError(self):
+    # One sample off by 255 in 12 gives 10*log10(12) for the frame.
+    comparison = Compare('\0' * 24, '\xff' + '\0' * 23)
+    metrics = comparison.Metrics(24)
+    self.assertEqual([10.792, 100.0], metrics['frame_psnr'])
+    self.assertEqual(13.802, metrics['psnr'])
+    # The Y planes have 16 of the 24 samples.
+    self.assertEqual(12.041, metrics['psnr_y'])
+    self.assertEqual(100.0, metrics['psnr_u'])
+    self.assertEqual(100.0, metrics['psnr_v'])
+
+  def test_DifferentSizesFail(self):
+    comparison = Compare('\0' * 24, '\0' * 12)
+    with self.assertRaises(encoder.Error):
+      comparison.Metrics(24)
+
+  def test_PartialFrameFails(self):
+    comparison = Compare('\0' * 24, '\0' * 18)
+    with self.assertRaises(encoder.Error):
+      comparison.Metrics(24)
+
+  def test_PartialFrameIsInMd5(self):
+    comparison = Compare('\0' * 24, '\1' * 18)
+    self.assertEqual(hashlib.md5('\1' * 18).hexdigest(),
+                     comparison.md5.hexdigest())
+
+  def test_NoFramesFail(self):
+    comparison = Compare('', '')
+    with self.assertRaises(encoder.Error):
+      comparison.Metrics(0)
+
+
+class TestParsePsnrToolOutput(unittest.TestCase):
+
+  def test_FramesAndTotal(self):
+    metrics = yuv_metrics.ParsePsnrToolOutput(
+        'frame 0 30.000 29.000 31.000 32.000\n'
+        'frame 1 40.000 39.000 41.000 42.000\n'
+        'total 33.000 32.000 34.000 35.000\n')
+    self.assertEqual({'psnr': 33.0, 'psnr_y': 32.0, 'psnr_u': 34.0,
+                      'psnr_v': 35.0, 'frame_psnr': [30.0, 40.0]}, metrics)
+
+  def test_OldFormatFails(self):
+    with self.assertRaises(encoder.Error):
+      yuv_metrics.ParsePsnrToolOutput('33.000\n')
+
+  def test_MissingTotalFails(self):
+    with self.assertRaises(encoder.Error):
+      yuv_metrics.ParsePsnrToolOutput('frame 0 30.000 29.000 31.000 32.000\n')
+
+
+class TestYuvComparisonWithPsnrTool(test_tools.FileUsingCodecTest):
+
+  def test_SameAsPsnrTool(self):
+    original = test_tools.MakeYuvFileWithNoisyFrames('original_16_16_30.yuv', 3)
+    decoded = test_tools.MakeYuvFileWithBlankFrames('decoded_16_16_30.yuv', 3)
+    output = subprocess.check_output(
+        [encoder.Tool('psnr'), original.filename, decoded.filename,
+         '16', '16', '9999', '--frames', '--threads', '2'])
+    comparison = yuv_metrics.YuvComparison(16, 16)
+    with open(original.filename, 'rb') as original_file:
+      with open(decoded.filename, 'rb') as decoded_file:
+        comparison.Compare(original_file, decoded_file)
+    metrics = comparison.Metrics(os.path.getsize(original.filename))
+    del metrics['yuv_md5']
+    self.assertEqual(yuv_metrics.ParsePsnrToolOutput(output), metrics)
+
+  def test_PsnrToolSummaryIsTotal(self):
+    original = test_tools.MakeYuvFileWithNoisyFrames('original_16_16_30.yuv', 3)
+    decoded = test_tools.MakeYuvFileWithBlankFrames('decoded_16_16_30.yuv', 3)
+    arguments = [encoder.Tool('psnr'), original.filename, decoded.filename,
+                 '16', '16', '9999']
+    summary = subprocess.check_output(arguments)
+    output = subprocess.check_output(arguments + ['--frames'])
+    self.assertEqual(float(summary),
+                     yuv_metrics.ParsePsnrToolOutput(output)['psnr'])
+
+
+if __name__ == '__main__':
+  unittest.main()
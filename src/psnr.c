@@ -5,15 +5,40 @@
  Description : Computes the overall/global PSNR of two input yuv clips.
  Author      : Adrian Grange <agrange@google.com>
  ============================================================================
+
+ Usage: psnr <yuv_file1> <yuv_file2> <width> <height> <max_frames>
+             [--frames] [--threads <n>]
+
+ Without --frames, the PSNR over all frames and planes is printed with
+ three decimals, and nothing else.
+
+ With --frames, one line per frame is printed, followed by a line for
+ the whole clip:
+
+   frame <number> <psnr> <y psnr> <u psnr> <v psnr>
+   ...
+   total <psnr> <y psnr> <u psnr> <v psnr>
+
+ With --threads, the frames are divided into that many ranges, which are
+ compared in parallel.
  */
 
+#define _FILE_OFFSET_BITS 64
+
+#include <fcntl.h>
 #include <math.h>
+#include <pthread.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
-#include <malloc.h>
+#include <string.h>
+#include <sys/mman.h>
 #include <sys/stat.h>
+#include <unistd.h>
 
 #define MAX_PSNR 100
+#define MAX_THREADS 64
+#define PLANES 3
 
 typedef enum {
   STATUS_OK              =  0,
@@ -24,11 +49,22 @@ typedef enum {
   STATUS_ALLOC_ERROR     = -5,
 } STATUS_CODE;
 
+typedef struct {
+  const unsigned char *data0;
+  const unsigned char *data1;
+  int64_t frame_size;
+  int64_t plane_size[PLANES];
+  int first_frame;
+  int end_frame;
+  /* Squared error per frame and plane, shared by all threads. */
+  uint64_t *sq_error;
+} COMPARE_JOB;
 
-/* Note: Handles Maximum file size of 2GB! */
-int get_file_size(const char *filename) {
+
+int64_t get_file_size(const char *filename) {
   struct stat st;
-  stat(filename, &st);
+  if (stat(filename, &st) != 0)
+    return -1;
   return st.st_size;
 }
 
@@ -46,25 +82,115 @@ double mse2psnr(double samples, double peak, double mse) {
   return psnr;
 }
 
+/* Kept free of anything but integer arithmetic, so that it vectorizes. */
+uint64_t plane_sq_error(const unsigned char *ptr0, const unsigned char *ptr1,
+                        int64_t samples) {
+  uint64_t sq_error = 0;
+  int64_t i;
+
+  for (i = 0; i < samples; ++i) {
+    int diff = (int)ptr1[i] - (int)ptr0[i];
+    sq_error += (uint32_t)(diff * diff);
+  }
+  return sq_error;
+}
+
+void *compare_frames(void *arg) {
+  COMPARE_JOB *job = (COMPARE_JOB *)arg;
+  int frame;
+  int plane;
+
+  for (frame = job->first_frame; frame < job->end_frame; ++frame) {
+    int64_t offset = frame * job->frame_size;
+    for (plane = 0; plane < PLANES; ++plane) {
+      job->sq_error[frame * PLANES + plane] =
+          plane_sq_error(job->data0 + offset, job->data1 + offset,
+                         job->plane_size[plane]);
+      offset += job->plane_size[plane];
+    }
+  }
+  return NULL;
+}
+
+const unsigned char *map_file(const char *filename, int64_t size) {
+  void *data;
+  int fd = open(filename, O_RDONLY);
+
+  if (fd < 0)
+    return NULL;
+  data = mmap(NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (data == MAP_FAILED)
+    return NULL;
+  madvise(data, size, MADV_SEQUENTIAL);
+  return (const unsigned char *)data;
+}
+
+void print_psnr_line(const char *label, const uint64_t *sq_error,
+                     const int64_t *plane_size, int64_t frames) {
+  uint64_t total_sq_error = 0;
+  int64_t total_samples = 0;
+  int plane;
+
+  for (plane = 0; plane < PLANES; ++plane) {
+    total_sq_error += sq_error[plane];
+    total_samples += plane_size[plane];
+  }
+  fprintf(stdout, "%s %.3lf", label,
+          mse2psnr((double)(frames * total_samples), 255.0,
+                   (double)total_sq_error));
+  for (plane = 0; plane < PLANES; ++plane) {
+    fprintf(stdout, " %.3lf",
+            mse2psnr((double)(frames * plane_size[plane]), 255.0,
+                     (double)sq_error[plane]));
+  }
+  fprintf(stdout, "\n");
+}
 
 int main(int argc, char *argv[]) {
   int i;
   int width, height;
-  int frame_size;
+  int64_t frame_size;
+  int64_t plane_size[PLANES];
+  int64_t size0, size1;
   int max_frames;
   int number_of_frames = 0;
-  double total_sq_error = 0.0;
-  unsigned char *frame0 = NULL, *frame1 = NULL;
-  FILE *file0_ptr = NULL, *file1_ptr = NULL;
+  int per_frame_output = 0;
+  int threads = 1;
+  int started_threads;
+  int plane;
+  uint64_t total_sq_error[PLANES] = {0, 0, 0};
+  uint64_t *sq_error = NULL;
+  const unsigned char *data0 = NULL, *data1 = NULL;
+  COMPARE_JOB jobs[MAX_THREADS];
+  pthread_t thread_ids[MAX_THREADS];
   STATUS_CODE return_status = STATUS_OK;
 
   if (argc < 6) {
     fprintf (stderr, "Usage: %s <yuv_file1> <yuv_file2> "
-             "<width> <height> <max_frames>\n", argv[0]);
+             "<width> <height> <max_frames> [--frames] [--threads <n>]\n",
+             argv[0]);
     return_status = STATUS_USAGE_ERROR;
     goto end;
   }
 
+  for (i = 6; i < argc; ++i) {
+    if (strcmp(argv[i], "--frames") == 0) {
+      per_frame_output = 1;
+    } else if (strcmp(argv[i], "--threads") == 0 && i + 1 < argc) {
+      threads = strtol(argv[++i], NULL, 10);
+    } else {
+      fprintf (stderr, "ERROR: unknown argument %s.\n", argv[i]);
+      return_status = STATUS_USAGE_ERROR;
+      goto end;
+    }
+  }
+  if (threads < 1 || threads > MAX_THREADS) {
+    fprintf (stderr, "ERROR: thread count must be 1 to %d.\n", MAX_THREADS);
+    return_status = STATUS_ARGS_ERROR;
+    goto end;
+  }
+
   width  = strtol(argv[3], NULL, 10);
   height = strtol(argv[4], NULL, 10);
   if (width < 1 || height < 1) {
@@ -73,75 +199,101 @@ int main(int argc, char *argv[]) {
     goto end;
   }
 
-  frame_size = width * height * 3 / 2;
-  {
-    int size0 = get_file_size(argv[1]);
-    int size1 = get_file_size(argv[2]);
-    if ((size0 <= 0) || (size1 <= 0)) {
-      fprintf(stderr, "ERROR: input file size exceeds 2GB limit.\n");
-      return_status = STATUS_FILE_SIZE_ERROR;
-      goto end;
-    }
+  frame_size = (int64_t)width * height * 3 / 2;
+  plane_size[0] = (int64_t)width * height;
+  plane_size[1] = (frame_size - plane_size[0]) / 2;
+  plane_size[2] = frame_size - plane_size[0] - plane_size[1];
 
-    if ((size0 != size1) || (size0 % frame_size)) {
-      fprintf(stderr, "ERROR: input files must be same size and have only "
-              "full frames (file sizes:%d, %d).\n", size0, size1);
-      return_status = STATUS_FILE_SIZE_ERROR;
-      goto end;
-    }
+  size0 = get_file_size(argv[1]);
+  size1 = get_file_size(argv[2]);
+  if ((size0 <= 0) || (size1 <= 0)) {
+    fprintf(stderr, "ERROR: input files must exist and not be empty.\n");
+    return_status = STATUS_FILE_SIZE_ERROR;
+    goto end;
   }
 
-  if ((file0_ptr = fopen(argv[1], "rb")) == NULL) {
+  if ((size0 != size1) || (size0 % frame_size)) {
+    fprintf(stderr, "ERROR: input files must be same size and have only "
+            "full frames (file sizes:%lld, %lld).\n",
+            (long long)size0, (long long)size1);
+    return_status = STATUS_FILE_SIZE_ERROR;
+    goto end;
+  }
+
+  if ((data0 = map_file(argv[1], size0)) == NULL) {
     fprintf (stderr, "ERROR: unable to open input file %s.\n", argv[1]);
     return_status = STATUS_FILE_OPEN_ERROR;
     goto end;
   }
 
-  if ((file1_ptr = fopen(argv[2], "rb")) == NULL) {
+  if ((data1 = map_file(argv[2], size1)) == NULL) {
     fprintf (stderr, "ERROR: unable to open input file %s.\n", argv[2]);
     return_status = STATUS_FILE_OPEN_ERROR;
     goto end;
   }
 
-  if ((frame0 = calloc(frame_size, sizeof(unsigned char))) == NULL) {
-    fprintf (stderr, "ERROR: unable to allocate memory.\n");
-    return_status = STATUS_ALLOC_ERROR;
+  max_frames = strtol(argv[5], NULL, 10);
+  number_of_frames = size0 / frame_size;
+  if (number_of_frames > max_frames)
+    number_of_frames = max_frames;
+  if (number_of_frames < 1)
     goto end;
-  }
+  if (threads > number_of_frames)
+    threads = number_of_frames;
 
-  if ((frame1 = calloc(frame_size, sizeof(unsigned char))) == NULL) {
+  if ((sq_error = calloc(number_of_frames * PLANES,
+                         sizeof(uint64_t))) == NULL) {
     fprintf (stderr, "ERROR: unable to allocate memory.\n");
     return_status = STATUS_ALLOC_ERROR;
     goto end;
   }
 
-  max_frames = strtol(argv[5], NULL, 10);
-
-  while ((number_of_frames < max_frames)
-      && (fread(frame0, 1, frame_size, file0_ptr) == frame_size)
-      && (fread(frame1, 1, frame_size, file1_ptr) == frame_size)) {
-    unsigned char *ptr0 = frame0;
-    unsigned char *ptr1 = frame1;
+  for (i = 0; i < threads; ++i) {
+    jobs[i].data0 = data0;
+    jobs[i].data1 = data1;
+    jobs[i].frame_size = frame_size;
+    memcpy(jobs[i].plane_size, plane_size, sizeof(plane_size));
+    jobs[i].first_frame = (int64_t)number_of_frames * i / threads;
+    jobs[i].end_frame = (int64_t)number_of_frames * (i + 1) / threads;
+    jobs[i].sq_error = sq_error;
+  }
+  for (i = 1; i < threads; ++i) {
+    if (pthread_create(&thread_ids[i], NULL, compare_frames, &jobs[i]))
+      break;
+  }
+  started_threads = i;
+  /* This thread takes the first range, and any that didn't get a thread. */
+  compare_frames(&jobs[0]);
+  for (i = started_threads; i < threads; ++i)
+    compare_frames(&jobs[i]);
+  for (i = 1; i < started_threads; ++i)
+    pthread_join(thread_ids[i], NULL);
 
-    for (i = 0; i < frame_size; ++i) {
-      double diff = (*ptr1) - (*ptr0);
-      total_sq_error += diff * diff;
-      ++ptr0; ++ptr1;
+  for (i = 0; i < number_of_frames; ++i) {
+    for (plane = 0; plane < PLANES; ++plane)
+      total_sq_error[plane] += sq_error[i * PLANES + plane];
+    if (per_frame_output) {
+      char label[32];
+      snprintf(label, sizeof(label), "frame %d", i);
+      print_psnr_line(label, &sq_error[i * PLANES], plane_size, 1);
     }
-    ++number_of_frames;
   }
 
-  if (number_of_frames > 0) {
-    double samples = number_of_frames * frame_size;
-    double total_psnr = mse2psnr(samples, 255.0, total_sq_error);
+  if (per_frame_output) {
+    print_psnr_line("total", total_sq_error, plane_size, number_of_frames);
+  } else {
+    double samples = (double)number_of_frames * frame_size;
+    double total_psnr = mse2psnr(samples, 255.0,
+                                 (double)(total_sq_error[0] +
+                                          total_sq_error[1] +
+                                          total_sq_error[2]));
     fprintf(stdout, "%.3lf\n", total_psnr);
   }
 
 end:
-  if (frame0) free(frame0);
-  if (frame1) free(frame1);
-  if (file0_ptr) fclose(file0_ptr);
-  if (file1_ptr) fclose(file1_ptr);
+  if (sq_error) free(sq_error);
+  if (data0) munmap((void *)data0, size0);
+  if (data1) munmap((void *)data1, size1);
 
   return return_status;
 }